@@ -1,6 +1,7 @@
-from flask import Flask, request, Response
+from flask import Flask, Response
 import logging
 from lxml import etree
+from utils.xml_da_requisicao import obter_xml_da_requisicao
 
 app = Flask(__name__)
 
@@ -9,31 +10,7 @@ logging.basicConfig(level=logging.DEBUG)
 
 def capturar_xml():
     try:
-        content_type = request.headers.get("Content-Type", "").lower()
-        logging.debug(f"Tipo de conteúdo recebido: {content_type}")
-        
-        xml_data = None
-        
-        # Tenta extrair o XML do formulário
-        if request.form:
-            for possible_name in ["TextXML", "textxml", "xmldata", "xml"]:
-                if possible_name in request.form:
-                    xml_data = request.form.get(possible_name)
-                    logging.debug(f"XML encontrado no campo {possible_name}")
-                    break
-            
-            if not xml_data and len(request.form) > 0:
-                first_key = next(iter(request.form))
-                xml_data = request.form.get(first_key)
-                logging.debug(f"Usando primeiro campo do form: {first_key}")
-        
-        # Se não encontrou no form, tenta do corpo da requisição
-        if not xml_data and request.data:
-            try:
-                xml_data = request.data.decode('utf-8')
-                logging.debug("Usando dados brutos do corpo da requisição")
-            except:
-                pass
+        xml_data = obter_xml_da_requisicao()
         
         if xml_data:
             logging.debug(f"XML recebido: {xml_data}")
@@ -1,171 +1,65 @@
-from flask import request, Response
-import requests
+from flask import Response
+from werkzeug.exceptions import HTTPException
 from lxml import etree
 import logging
-from utils.gerar_erro import gerar_erro_xml
-from utils.adicionar_campo import adicionar_campo
+from utils import gerar_erro
+from utils.cache_cep import FALHA, NAO_ENCONTRADO, buscar_cep
+from utils.extrator_campos import extrair_campos_da_requisicao
+from utils.resposta_v2 import ConstrutorRespostaV2
 
 
 def consultar_cepv2():
     try:
-        content_type = request.headers.get("Content-Type", "").lower()
-        logging.debug(f"Tipo de conteúdo recebido: {content_type}")
-        
-        # Tenta extrair o XML de várias fontes possíveis
-        xml_data = None
-        
-        # Tenta do form primeiro (com vários nomes possíveis)
-        if request.form:
-            for possible_name in ["TextXML", "textxml", "xmldata", "xml", "application/x-www-form-urlencoded"]:
-                if possible_name in request.form:
-                    xml_data = request.form.get(possible_name)
-                    logging.debug(f"XML encontrado no campo {possible_name}")
-                    break
-            
-            # Se não encontrou por nome específico, tenta o primeiro campo do form
-            if not xml_data and len(request.form) > 0:
-                first_key = next(iter(request.form))
-                xml_data = request.form.get(first_key)
-                logging.debug(f"Usando primeiro campo do form: {first_key}")
-        
-        # Se não encontrou no form, tenta do corpo da requisição
-        if not xml_data and request.data:
-            try:
-                xml_data = request.data.decode('utf-16')
-                logging.debug("Usando dados brutos do corpo da requisição")
-            except:
-                pass
-        
-        if not xml_data:
-            return gerar_erro_xml("Não foi possível encontrar dados XML na requisição", "Erro")
-        
-        logging.debug(f"XML para processar: {xml_data}")
-
-        # Tenta fazer o parse do XML
+        # Extrai só os campos necessários, parando a leitura assim que são encontrados
         try:
-            root = etree.fromstring(xml_data.encode("utf-16"))
+            campos = extrair_campos_da_requisicao({"CEP"})
         except etree.XMLSyntaxError:
             return gerar_erro_xml("Erro ao processar o XML recebido.", "Erro")
 
-        # Processa os campos do XML
-        campos = processar_campos(root)
+        if campos is None:
+            return gerar_erro_xml("Não foi possível encontrar dados XML na requisição", "Erro")
 
-        # Faz a requisição à API ViaCEP
         cep = campos.get("CEP")
         if not cep:
             return gerar_erro_xml("Erro: CEP não informado no campo CEP.", "CEP invalido")
 
-        response = requests.get(f"https://viacep.com.br/ws/{cep}/json/")
-        if response.status_code != 200:
+        # Consulta o ViaCEP, ou o cache de CEPs compartilhado pelas rotas de CEP
+        situacao, data = buscar_cep(cep)
+        if situacao == FALHA:
             return gerar_erro_xml("Erro ao consultar o CEP - Verifique e tente novamente.", "Erro")
-
-        data = response.json()
-        if "erro" in data:
+        if situacao == NAO_ENCONTRADO:
             return gerar_erro_xml("Erro: CEP inválido ou não encontrado.", "Erro")
 
         # Retorna os dados do endereço no novo formato
         return gerar_resposta_xml_v2(data)
 
+    except HTTPException:
+        # Erros do corpo da requisição (tamanho, compressão) são respondidos pelo middleware
+        raise
     except Exception as e:
         logging.error(f"Erro interno: {str(e)}")
         return gerar_erro_xml(f"Erro interno no servidor: {str(e)}", "Erro")
 
-def processar_campos(root):
-    """Processa os campos do XML e retorna um dicionário com os valores."""
-    campos = {}
-    for field in root.findall(".//Field"):
-        id = field.findtext("ID") or field.findtext("Id")  # Tenta ambos os formatos
-        value = field.findtext("Value")
-        if id and value:
-            campos[id] = value
-
-    for table_field in root.findall(".//TableField"):
-        table_id = table_field.findtext("ID")
-        rows = []
-        for row in table_field.findall(".//Row"):
-            row_data = {}
-            for field in row.findall(".//Field"):
-                id = field.findtext("ID")
-                value = field.findtext("Value")
-                if id and value:
-                    row_data[id] = value
-            rows.append(row_data)
-        campos[table_id] = rows
-
-    return campos
-
 def gerar_resposta_xml_v2(data):
     """Gera a resposta XML V2 com os dados do endereço."""
-    # Definir namespaces
-    nsmap = {
-        'xsi': 'http://www.w3.org/2001/XMLSchema-instance',
-        'xsd': 'http://www.w3.org/2001/XMLSchema'
-    }
-    
-    # Criar o elemento raiz com namespaces
-    response = etree.Element("ResponseV2", nsmap=nsmap)
-    
-    # Adicionar seção de mensagem
-    message = etree.SubElement(response, "MessageV2")
-    etree.SubElement(message, "Text").text = "CEP encontrado com sucesso"
-    
-    # Criar seção ReturnValueV2
-    return_value = etree.SubElement(response, "ReturnValueV2")
-    fields = etree.SubElement(return_value, "Fields")
-    
+    construtor = ConstrutorRespostaV2("CEP encontrado com sucesso", encoding="utf-8")
+
     # Mapear dados do CEP para os novos campos
     # Você pode ajustar este mapeamento conforme necessário
-    adicionar_campo(fields, "LOGRADOURO", data.get("logradouro", ""))
-    adicionar_campo(fields, "COMPLEMENTO", data.get("complemento", ""))
-    adicionar_campo(fields, "BAIRRO", data.get("bairro", ""))
-    adicionar_campo(fields, "CIDADE", data.get("localidade", ""))
-    adicionar_campo(fields, "ESTADO", data.get("estado", ""))
-    adicionar_campo(fields, "UF", data.get("uf", ""))
-    
-    
-    # Adicionar campos adicionais do ReturnValueV2
-    etree.SubElement(return_value, "ShortText").text = "CEP ENCONTRADO - INFOS ABAIXO"
-    etree.SubElement(return_value, "LongText")  # Vazio
-    etree.SubElement(return_value, "Value").text = "17"
-    
-    # Gerar XML com declaração e encoding utf-8
-    xml_declaration = '<?xml version="1.0" encoding="utf-8"?>'
-    xml_str = etree.tostring(response, encoding="utf-8", xml_declaration=False).decode("utf-8")
-    xml_str = xml_declaration + "\n" + xml_str
-    
-    logging.debug(f"XML de Resposta V2: {xml_str}")  # Depuração no console
-    
-    return Response(xml_str, content_type="text/xml; charset=utf-8")
-
+    construtor.campo("LOGRADOURO", data.get("logradouro", ""))
+    construtor.campo("COMPLEMENTO", data.get("complemento", ""))
+    construtor.campo("BAIRRO", data.get("bairro", ""))
+    construtor.campo("CIDADE", data.get("localidade", ""))
+    construtor.campo("ESTADO", data.get("estado", ""))
+    construtor.campo("UF", data.get("uf", ""))
 
+    corpo = construtor.finalizar("CEP ENCONTRADO - INFOS ABAIXO", value="17")
+    construtor.registrar("XML de Resposta V2")  # Depuração no console
 
+    return Response(corpo, content_type="text/xml; charset=utf-8")
 
 
 def gerar_erro_xml(mensagem, short_text):
-    """Gera um XML de erro com mensagem personalizada."""
-    # Definir namespaces
-    nsmap = {
-        'xsi': 'http://www.w3.org/2001/XMLSchema-instance',
-        'xsd': 'http://www.w3.org/2001/XMLSchema'
-    }
-    
-    # Criar o elemento raiz com namespaces
-    response = etree.Element("ResponseV2", nsmap=nsmap)
-    
-    # Adicionar seção de mensagem
-    message = etree.SubElement(response, "MessageV2")
-    etree.SubElement(message, "Text").text = mensagem
-    
-    # Criar seção ReturnValueV2 vazia
-    return_value = etree.SubElement(response, "ReturnValueV2")
-    etree.SubElement(return_value, "Fields")
-    etree.SubElement(return_value, "ShortText").text = short_text
-    etree.SubElement(return_value, "LongText")
-    etree.SubElement(return_value, "Value").text = "0"
-    
-    # Gerar XML com declaração e encoding utf-8
-    xml_declaration = '<?xml version="1.0" encoding="utf-8"?>'
-    xml_str = etree.tostring(response, encoding="utf-8", xml_declaration=False).decode("utf-8")
-    xml_str = xml_declaration + "\n" + xml_str
-    
-    return Response(xml_str, content_type="text/xml; charset=utf-8")
\ No newline at end of file
+    """Gera um XML de erro (UTF-8) com mensagem personalizada; o corpo vem do cache de utils/gerar_erro.py."""
+    return gerar_erro.gerar_erro_xml(mensagem, short_text, encoding="utf-8",
+                                     content_type="text/xml; charset=utf-8")
@@ -1,67 +1,52 @@
-from flask import request, Response
-import requests
+from flask import Response
+from werkzeug.exceptions import HTTPException
 from lxml import etree
 import logging
 import re
 from utils.gerar_erro import gerar_erro_xml
-from utils.adicionar_campo import adicionar_campo
-from utils.adicionar_table_field import adicionar_table_field
+from utils.extrator_campos import extrair_campos_da_requisicao
+from utils.resposta_v2 import ConstrutorRespostaV2, ConstrutorXml
+from utils.charset_resposta import charset_da_resposta, content_type_xml
+from utils.paginacao import eh_cursor, escrever_itens, ler_cursor, paginar
+from utils import base_cep
+from utils.cache_logradouro import buscar_logradouro
+from utils.cache_cep import ENCONTRADO, FALHA, NAO_ENCONTRADO, buscar_cep, endereco_vencido
+from utils.especulacao import Especulacao
 
 def consultar_cepv3():
     try:
-        content_type = request.headers.get("Content-Type", "").lower()
-        logging.debug(f"Tipo de conteúdo recebido: {content_type}")
-        
-        # Tenta extrair o XML de várias fontes possíveis
-        xml_data = None
-        
-        # Tenta do form primeiro (com vários nomes possíveis)
-        if request.form:
-            for possible_name in ["TextXML", "textxml", "xmldata", "xml", "application/x-www-form-urlencoded"]:
-                if possible_name in request.form:
-                    xml_data = request.form.get(possible_name)
-                    logging.debug(f"XML encontrado no campo {possible_name}")
-                    break
-            
-            # Se não encontrou por nome específico, tenta o primeiro campo do form
-            if not xml_data and len(request.form) > 0:
-                first_key = next(iter(request.form))
-                xml_data = request.form.get(first_key)
-                logging.debug(f"Usando primeiro campo do form: {first_key}")
-        
-        # Se não encontrou no form, tenta do corpo da requisição
-        if not xml_data and request.data:
-            try:
-                xml_data = request.data.decode('utf-8')
-                logging.debug("Usando dados brutos do corpo da requisição")
-            except:
-                pass
-        
-        if not xml_data:
-            return gerar_erro_xml("Não foi possível encontrar dados XML na requisição", "Erro")
-        
-        logging.debug(f"XML para processar: {xml_data}")
-
-        # Tenta fazer o parse do XML
+        # Extrai só os campos necessários, parando a leitura assim que são encontrados
         try:
-            root = etree.fromstring(xml_data.encode("utf-8"))
+            campos = extrair_campos_da_requisicao({"CEP"})
         except etree.XMLSyntaxError:
             return gerar_erro_xml("Erro ao processar o XML recebido.", "Erro")
 
-        # Processa os campos do XML
-        campos = processar_campos(root)
+        if campos is None:
+            return gerar_erro_xml("Não foi possível encontrar dados XML na requisição", "Erro")
 
-        # Faz a requisição à API ViaCEP
         cep = campos.get("CEP")
         if not cep:
             return gerar_erro_xml("Erro: CEP não informado no campo CEP.", "CEP invalido")
 
-        response = requests.get(f"https://viacep.com.br/ws/{cep}/json/")
-        if response.status_code != 200:
-            return gerar_erro_xml("Erro ao consultar o CEP - Verifique e tente novamente.", "Erro")
+        # Item "mais resultados" escolhido: a lista do CEP é montada de novo e cortada na página pedida
+        if eh_cursor(cep):
+            cursor = ler_cursor(cep)
+            pagina = proxima_pagina(*cursor) if cursor is not None else None
+            if pagina is None:
+                return gerar_erro_xml("A lista de endereços mudou. Consulte o CEP novamente.", "Erro")
+            return gerar_value_selection(pagina)
 
-        data = response.json()
-        if "erro" in data:
+        # CEP já visto, mas vencido no cache: a busca por logradouro parte do endereço
+        # antigo enquanto o ViaCEP confirma o CEP (quase sempre o endereço é o mesmo)
+        especulacao = iniciar_busca_especulativa(cep)
+
+        # Consulta o ViaCEP, ou o cache de CEPs compartilhado pelas rotas de CEP
+        situacao, data = buscar_cep(cep)
+        if situacao in (FALHA, NAO_ENCONTRADO) and especulacao is not None:
+            especulacao.descartar()
+        if situacao == FALHA:
+            return gerar_erro_xml("Erro ao consultar o CEP - Verifique e tente novamente.", "Erro")
+        if situacao == NAO_ENCONTRADO:
             return gerar_erro_xml("Erro: CEP inválido ou não encontrado.", "Erro")
 
         # Verifica se deve buscar múltiplos endereços
@@ -69,22 +54,50 @@ def consultar_cepv3():
         
         if deve_buscar_multiplos_enderecos(data, cep):
             logging.debug("Buscando múltiplos endereços...")
-            enderecos_multiplos = buscar_enderecos_multiplos(data, cep)
+            enderecos_multiplos = None
+            if especulacao is not None:
+                enderecos_multiplos = especulacao.aproveitar(chave_busca_enderecos(data))
+            if enderecos_multiplos is None:
+                enderecos_multiplos = buscar_enderecos_multiplos(data, cep)
             
             if enderecos_multiplos and len(enderecos_multiplos) > 1:
                 logging.debug(f"Encontrados {len(enderecos_multiplos)} endereços múltiplos")
-                return gerar_value_selection(enderecos_multiplos)
+                return gerar_value_selection(paginar(itens_de_enderecos(enderecos_multiplos), cep))
         
+        elif especulacao is not None:
+            especulacao.descartar()
+
         # Retorna o formato normal ResponseV2
         logging.debug("Retornando ResponseV2 normal")
         return gerar_resposta_xml_v2(data)
 
+    except HTTPException:
+        # Erros do corpo da requisição (tamanho, compressão) são respondidos pelo middleware
+        raise
     except Exception as e:
         logging.error(f"Erro interno: {str(e)}")
         import traceback
         logging.error(f"Traceback: {traceback.format_exc()}")
         return gerar_erro_xml(f"Erro interno no servidor: {str(e)}", "Erro")
 
+def itens_de_enderecos(enderecos):
+    """(texto, valor) de cada endereço, na ordem da lista de seleção."""
+    return [(endereco["endereco_completo"], endereco["id"]) for endereco in enderecos]
+
+def proxima_pagina(cep, inicio):
+    """
+    Página de endereços pedida pelo item "mais resultados". A lista é refeita pelo CEP
+    (caches de CEP e de logradouro), não guardada: qualquer processo atende o pedido.
+    None se o CEP não gerar mais a lista ou `inicio` estiver fora dela.
+    """
+    situacao, data = buscar_cep(cep)
+    if situacao != ENCONTRADO:
+        return None
+    enderecos = buscar_enderecos_multiplos(data, cep)
+    if len(enderecos) <= 1:
+        return None
+    return paginar(itens_de_enderecos(enderecos), cep, inicio)
+
 def deve_buscar_multiplos_enderecos(data, cep):
     """
     Verifica se o CEP/endereço indica que pode haver múltiplos endereços.
@@ -117,6 +130,28 @@ def deve_buscar_multiplos_enderecos(data, cep):
     
     return False
 
+def chave_busca_enderecos(data):
+    """(UF, cidade, logradouro limpo) da busca por logradouro que o endereço gera, ou None se não gera busca."""
+    logradouro = data.get("logradouro", "")
+    cidade = data.get("localidade", "")
+    uf = data.get("uf", "")
+    if not logradouro or not cidade or not uf:
+        return None
+    return uf, cidade, limpar_logradouro_para_busca(logradouro)
+
+def iniciar_busca_especulativa(cep):
+    """
+    Adianta, numa thread à parte, a busca por logradouro do último endereço conhecido
+    do CEP (já vencido no cache). Retorna a Especulacao, ou None se não há palpite.
+    """
+    palpite = endereco_vencido(cep)
+    if palpite is None or not deve_buscar_multiplos_enderecos(palpite, cep):
+        return None
+    chave = chave_busca_enderecos(palpite)
+    if chave is None:
+        return None
+    return Especulacao(chave, buscar_enderecos_multiplos, palpite, cep)
+
 def buscar_enderecos_multiplos(data_viacep, cep):
     """
     Busca múltiplos endereços baseado nos dados retornados pelo ViaCEP.
@@ -139,27 +174,22 @@ def buscar_enderecos_multiplos(data_viacep, cep):
             logging.debug("Logradouro não adequado para busca múltipla")
             return []
         
-        # Monta URL de busca
-        url_busca = f"https://viacep.com.br/ws/{uf}/{cidade}/{logradouro_busca}/json/"
-        
-        logging.debug(f"Buscando múltiplos endereços em: {url_busca}")
-        
-        response = requests.get(url_busca, timeout=10)
-        
-        if response.status_code != 200:
-            logging.error(f"Erro na busca de múltiplos endereços: {response.status_code}")
-            return []
-        
-        resultados = response.json()
+        # Base local primeiro; o ViaCEP só é consultado se ela não tiver a rua
+        resultados = base_cep.buscar_logradouro(uf, cidade, logradouro_busca)
+        if not resultados:
+            # ViaCEP, ou o cache das buscas por logradouro
+            resultados = buscar_logradouro(uf, cidade, logradouro_busca)
+            if resultados is None:
+                return []
         
         # Se não é uma lista ou está vazia, não há múltiplos endereços
         if not isinstance(resultados, list) or len(resultados) <= 1:
             logging.debug("Não encontrados múltiplos endereços")
             return []
         
-        # Processa os resultados para o formato esperado
+        # Processa os resultados para o formato esperado (todos: a lista é paginada na resposta)
         enderecos = []
-        for i, resultado in enumerate(resultados[:10]):  # Limita a 10 resultados
+        for i, resultado in enumerate(resultados):
             endereco_completo = montar_endereco_completo(resultado)
             
             endereco = {
@@ -178,9 +208,6 @@ def buscar_enderecos_multiplos(data_viacep, cep):
         logging.debug(f"Encontrados {len(enderecos)} endereços múltiplos")
         return enderecos
         
-    except requests.RequestException as e:
-        logging.error(f"Erro na requisição para buscar múltiplos endereços: {str(e)}")
-        return []
     except Exception as e:
         logging.error(f"Erro ao processar múltiplos endereços: {str(e)}")
         return []
@@ -237,127 +264,43 @@ def montar_endereco_completo(dados_endereco):
     
     return " ".join(partes)
 
-def gerar_value_selection(enderecos):
-    """Gera XML no formato Value Selection para múltiplos endereços."""
-    
-    # Criar o elemento Response
-    response = etree.Element("Response")
-    
-    # Adicionar mensagem opcional
-    message = etree.SubElement(response, "Message")
-    etree.SubElement(message, "Text").text = "Múltiplos endereços encontrados. Selecione um:"
-    etree.SubElement(message, "Icon").text = "Info"
-    
-    # Criar ReturnValue com Items
-    return_value = etree.SubElement(response, "ReturnValue")
-    items = etree.SubElement(return_value, "Items")
-    
-    # Adicionar cada endereço como um Item
-    for endereco in enderecos:
-        item = etree.SubElement(items, "Item")
-        etree.SubElement(item, "Text").text = endereco["endereco_completo"]
-        etree.SubElement(item, "Value").text = endereco["id"]
-    
-    # Gerar XML com encoding utf-16
-    xml_declaration = '<?xml version="1.0" encoding="utf-16"?>'
-    xml_str = etree.tostring(response, encoding="utf-16", xml_declaration=False).decode("utf-16")
-    xml_str = xml_declaration + "\n" + xml_str
-    
-    logging.debug(f"XML Value Selection: {xml_str}")
-    
-    return Response(xml_str.encode("utf-16"), content_type="application/xml; charset=utf-16")
+def gerar_value_selection(pagina):
+    """Gera XML no formato Value Selection para uma página de endereços (utils/paginacao.py)."""
+    charset = charset_da_resposta()
+    construtor = ConstrutorXml(charset)
+
+    # Criar o elemento Response com a mensagem opcional
+    construtor.abrir("Response")
+    construtor.abrir("Message")
+    construtor.elemento("Text", "Múltiplos endereços encontrados. Selecione um:")
+    construtor.elemento("Icon", "Info")
+    construtor.fechar()
 
-def processar_campos(root):
-    """Processa os campos do XML e retorna um dicionário com os valores."""
-    campos = {}
-    for field in root.findall(".//Field"):
-        id = field.findtext("ID") or field.findtext("Id")  # Tenta ambos os formatos
-        value = field.findtext("Value")
-        if id and value:
-            campos[id] = value
+    # Criar ReturnValue com Items, um Item por endereço (e "mais resultados" se houver outra página)
+    construtor.abrir("ReturnValue")
+    escrever_itens(construtor, pagina)
+    construtor.fechar()
+    construtor.fechar()
 
-    for table_field in root.findall(".//TableField"):
-        table_id = table_field.findtext("ID")
-        rows = []
-        for row in table_field.findall(".//Row"):
-            row_data = {}
-            for field in row.findall(".//Field"):
-                id = field.findtext("ID")
-                value = field.findtext("Value")
-                if id and value:
-                    row_data[id] = value
-            rows.append(row_data)
-        campos[table_id] = rows
+    corpo = construtor.corpo()
+    construtor.registrar("XML Value Selection")
 
-    return campos
+    return Response(corpo, content_type=content_type_xml(charset))
 
 def gerar_resposta_xml_v2(data):
     """Gera a resposta XML V2 com os dados do endereço."""
-    # Definir namespaces
-    nsmap = {
-        'xsi': 'http://www.w3.org/2001/XMLSchema-instance',
-        'xsd': 'http://www.w3.org/2001/XMLSchema'
-    }
-    
-    # Criar o elemento raiz com namespaces
-    response = etree.Element("ResponseV2", nsmap=nsmap)
-    
-    # Adicionar seção de mensagem
-    message = etree.SubElement(response, "MessageV2")
-    etree.SubElement(message, "Text").text = "CEP encontrado com sucesso"
-    
-    # Criar seção ReturnValueV2
-    return_value = etree.SubElement(response, "ReturnValueV2")
-    fields = etree.SubElement(return_value, "Fields")
-    
+    charset = charset_da_resposta()
+    construtor = ConstrutorRespostaV2("CEP encontrado com sucesso", encoding=charset)
+
     # Mapear dados do CEP para os novos campos
-    adicionar_campo(fields, "LOGRADOURO", data.get("logradouro", ""))
-    adicionar_campo(fields, "COMPLEMENTO", data.get("complemento", ""))
-    adicionar_campo(fields, "BAIRRO", data.get("bairro", ""))
-    adicionar_campo(fields, "CIDADE", data.get("localidade", ""))
-    adicionar_campo(fields, "ESTADO", data.get("estado", ""))
-    adicionar_campo(fields, "UF", data.get("uf", ""))
-    
-    
-    # Adicionar campos adicionais do ReturnValueV2
-    etree.SubElement(return_value, "ShortText").text = "CEP ENCONTRADO - INFOS ABAIXO"
-    etree.SubElement(return_value, "LongText")  # Vazio
-    etree.SubElement(return_value, "Value").text = "58"
-    
-    # Gerar XML com declaração e encoding utf-16
-    xml_declaration = '<?xml version="1.0" encoding="utf-16"?>'
-    xml_str = etree.tostring(response, encoding="utf-16", xml_declaration=False).decode("utf-16")
-    xml_str = xml_declaration + "\n" + xml_str
-    
-    logging.debug(f"XML de Resposta V2: {xml_str}")
-    
-    return Response(xml_str.encode("utf-16"), content_type="application/xml; charset=utf-16")
+    construtor.campo("LOGRADOURO", data.get("logradouro", ""))
+    construtor.campo("COMPLEMENTO", data.get("complemento", ""))
+    construtor.campo("BAIRRO", data.get("bairro", ""))
+    construtor.campo("CIDADE", data.get("localidade", ""))
+    construtor.campo("ESTADO", data.get("estado", ""))
+    construtor.campo("UF", data.get("uf", ""))
 
-def gerar_erro_xml(mensagem, short_text):
-    """Gera um XML de erro com mensagem personalizada."""
-    # Definir namespaces
-    nsmap = {
-        'xsi': 'http://www.w3.org/2001/XMLSchema-instance',
-        'xsd': 'http://www.w3.org/2001/XMLSchema'
-    }
-    
-    # Criar o elemento raiz com namespaces
-    response = etree.Element("ResponseV2", nsmap=nsmap)
-    
-    # Adicionar seção de mensagem
-    message = etree.SubElement(response, "MessageV2")
-    etree.SubElement(message, "Text").text = mensagem
-    
-    # Criar seção ReturnValueV2 vazia
-    return_value = etree.SubElement(response, "ReturnValueV2")
-    etree.SubElement(return_value, "Fields")
-    etree.SubElement(return_value, "ShortText").text = short_text
-    etree.SubElement(return_value, "LongText")
-    etree.SubElement(return_value, "Value").text = "0"
-    
-    # Gerar XML com declaração e encoding utf-16
-    xml_declaration = '<?xml version="1.0" encoding="utf-16"?>'
-    xml_str = etree.tostring(response, encoding="utf-16", xml_declaration=False).decode("utf-16")
-    xml_str = xml_declaration + "\n" + xml_str
-    
-    return Response(xml_str.encode("utf-16"), content_type="application/xml; charset=utf-16")
\ No newline at end of file
+    corpo = construtor.finalizar("CEP ENCONTRADO - INFOS ABAIXO")
+    construtor.registrar("XML de Resposta V2")
+
+    return Response(corpo, content_type=content_type_xml(charset))
@@ -1,192 +1,75 @@
-from flask import request, Response
-import requests
+from flask import Response
+from werkzeug.exceptions import HTTPException
 from lxml import etree
 import logging
 from utils.gerar_erro import gerar_erro_xml
-from utils.adicionar_campo import adicionar_campo
-from utils.adicionar_table_field import adicionar_table_field
+from utils.extrator_campos import extrair_campos_da_requisicao
+from utils.resposta_v2 import Vaga, compilar_resposta_v2, registrar_resposta
+from utils.charset_resposta import charset_da_resposta, content_type_xml
+from utils.cache_cep import FALHA, NAO_ENCONTRADO, buscar_cep
 
 def consultar_cep():
     try:
-        content_type = request.headers.get("Content-Type", "").lower()
-        logging.debug(f"Tipo de conteúdo recebido: {content_type}")
-        
-        # Tenta extrair o XML de várias fontes possíveis
-        xml_data = None
-        
-        # Tenta do form primeiro (com vários nomes possíveis)
-        if request.form:
-            for possible_name in ["TextXML", "textxml", "xmldata", "xml", "application/x-www-form-urlencoded"]:
-                if possible_name in request.form:
-                    xml_data = request.form.get(possible_name)
-                    logging.debug(f"XML encontrado no campo {possible_name}")
-                    break
-            
-            # Se não encontrou por nome específico, tenta o primeiro campo do form
-            if not xml_data and len(request.form) > 0:
-                first_key = next(iter(request.form))
-                xml_data = request.form.get(first_key)
-                logging.debug(f"Usando primeiro campo do form: {first_key}")
-        
-        # Se não encontrou no form, tenta do corpo da requisição
-        if not xml_data and request.data:
-            try:
-                xml_data = request.data.decode('utf-8')
-                logging.debug("Usando dados brutos do corpo da requisição")
-            except:
-                pass
-        
-        if not xml_data:
-            return gerar_erro_xml("Não foi possível encontrar dados XML na requisição", "Erro")
-        
-        logging.debug(f"XML para processar: {xml_data}")
-
-        # Tenta fazer o parse do XML
+        # Extrai só os campos necessários, parando a leitura assim que são encontrados
         try:
-            root = etree.fromstring(xml_data.encode("utf-8"))
+            campos = extrair_campos_da_requisicao({"CEP"})
         except etree.XMLSyntaxError:
             return gerar_erro_xml("Erro ao processar o XML recebido.", "Erro")
 
-        # Processa os campos do XML
-        campos = processar_campos(root)
+        if campos is None:
+            return gerar_erro_xml("Não foi possível encontrar dados XML na requisição", "Erro")
 
-        # Faz a requisição à API ViaCEP
         cep = campos.get("CEP")
         if not cep:
             return gerar_erro_xml("Erro: CEP não informado no campo CEP.", "CEP invalido")
 
-        response = requests.get(f"https://viacep.com.br/ws/{cep}/json/")
-        if response.status_code != 200:
+        # Consulta o ViaCEP, ou o cache de CEPs compartilhado pelas rotas de CEP
+        situacao, data = buscar_cep(cep)
+        if situacao == FALHA:
             return gerar_erro_xml("Erro ao consultar o CEP - Verifique e tente novamente.", "Erro")
-
-        data = response.json()
-        if "erro" in data:
+        if situacao == NAO_ENCONTRADO:
             return gerar_erro_xml("Erro: CEP inválido ou não encontrado.", "Erro")
 
         # Retorna os dados do endereço no novo formato
         return gerar_resposta_xml_v2(data)
 
+    except HTTPException:
+        # Erros do corpo da requisição (tamanho, compressão) são respondidos pelo middleware
+        raise
     except Exception as e:
         logging.error(f"Erro interno: {str(e)}")
         return gerar_erro_xml(f"Erro interno no servidor: {str(e)}", "Erro")
 
-def processar_campos(root):
-    """Processa os campos do XML e retorna um dicionário com os valores."""
-    campos = {}
-    for field in root.findall(".//Field"):
-        id = field.findtext("ID") or field.findtext("Id")  # Tenta ambos os formatos
-        value = field.findtext("Value")
-        if id and value:
-            campos[id] = value
-
-    for table_field in root.findall(".//TableField"):
-        table_id = table_field.findtext("ID")
-        rows = []
-        for row in table_field.findall(".//Row"):
-            row_data = {}
-            for field in row.findall(".//Field"):
-                id = field.findtext("ID")
-                value = field.findtext("Value")
-                if id and value:
-                    row_data[id] = value
-            rows.append(row_data)
-        campos[table_id] = rows
-
-    return campos
+# Resposta de sucesso compilada uma única vez (ver utils/resposta_v2.py)
+MODELO_RESPOSTA_CEP = compilar_resposta_v2(
+    "CEP encontrado com sucesso",
+    "CEP ENCONTRADO - INFOS ABAIXO",
+    campos=[
+        ("LOGRADOURO", Vaga("logradouro")),
+        ("COMPLEMENTO", Vaga("complemento")),
+        ("BAIRRO", Vaga("bairro")),
+        ("CIDADE", Vaga("localidade")),
+        ("ESTADO", Vaga("estado")),
+        ("UF", Vaga("uf")),
+        # TableField exemplo
+        ("TABCAIXA1", [
+            {"TextTable": "Y", "CX1PESO": "9,0"},
+            {"TextTable": "X", "CX1PESO": "8,0"},
+        ]),
+    ],
+)
 
 def gerar_resposta_xml_v2(data):
     """Gera a resposta XML V2 com os dados do endereço."""
-    # Definir namespaces
-    nsmap = {
-        'xsi': 'http://www.w3.org/2001/XMLSchema-instance',
-        'xsd': 'http://www.w3.org/2001/XMLSchema'
-    }
-    
-    # Criar o elemento raiz com namespaces
-    response = etree.Element("ResponseV2", nsmap=nsmap)
-    
-    # Adicionar seção de mensagem
-    message = etree.SubElement(response, "MessageV2")
-    etree.SubElement(message, "Text").text = "CEP encontrado com sucesso"
-    
-    # Criar seção ReturnValueV2
-    return_value = etree.SubElement(response, "ReturnValueV2")
-    fields = etree.SubElement(return_value, "Fields")
-    
-    # Mapear dados do CEP para os novos campos
-    # Você pode ajustar este mapeamento conforme necessário
-    adicionar_campo(fields, "LOGRADOURO", data.get("logradouro", ""))
-    adicionar_campo(fields, "COMPLEMENTO", data.get("complemento", ""))
-    adicionar_campo(fields, "BAIRRO", data.get("bairro", ""))
-    adicionar_campo(fields, "CIDADE", data.get("localidade", ""))
-    adicionar_campo(fields, "ESTADO", data.get("estado", ""))
-    adicionar_campo(fields, "UF", data.get("uf", ""))
-    
-    # Adicionar TableField exemplo
-    table_field_id = "TABCAIXA1"
-    rows_data = [
-        {"TextTable": "Y", "CX1PESO": "9,0"},
-        {"TextTable": "X", "CX1PESO": "8,0"},
-    ]
-    adicionar_table_field(fields, table_field_id, rows_data)
-    
-    # Adicionar campos adicionais do ReturnValueV2
-    etree.SubElement(return_value, "ShortText").text = "CEP ENCONTRADO - INFOS ABAIXO"
-    etree.SubElement(return_value, "LongText")  # Vazio
-    etree.SubElement(return_value, "Value").text = "58"
-    
-    # Gerar XML com declaração e encoding utf-16
-    xml_declaration = '<?xml version="1.0" encoding="utf-16"?>'
-    xml_str = etree.tostring(response, encoding="utf-16", xml_declaration=False).decode("utf-16")
-    xml_str = xml_declaration + "\n" + xml_str
-    
-    logging.debug(f"XML de Resposta V2: {xml_str}")  # Depuração no console
-    
-    return Response(xml_str.encode("utf-16"), content_type="application/xml; charset=utf-16")
-
-
-def adicionar_table_field(parent, field_id, rows_data):
-    """Adiciona um TableField com linhas dinâmicas."""
-    table_field = etree.SubElement(parent, "TableField")
-    etree.SubElement(table_field, "ID").text = field_id
-    rows_element = etree.SubElement(table_field, "Rows")
-
-    for row_data in rows_data:
-        create_row(rows_element, row_data)
-
-def create_row(parent, fields_data):
-    """Cria um elemento Row com campos."""
-    row = etree.SubElement(parent, "Row")
-    fields_element = etree.SubElement(row, "Fields")
-
-    for field_id, value in fields_data.items():
-        adicionar_campo(fields_element, field_id, value)
-
-def gerar_erro_xml(mensagem, short_text):
-    """Gera um XML de erro com mensagem personalizada."""
-    # Definir namespaces
-    nsmap = {
-        'xsi': 'http://www.w3.org/2001/XMLSchema-instance',
-        'xsd': 'http://www.w3.org/2001/XMLSchema'
-    }
-    
-    # Criar o elemento raiz com namespaces
-    response = etree.Element("ResponseV2", nsmap=nsmap)
-    
-    # Adicionar seção de mensagem
-    message = etree.SubElement(response, "MessageV2")
-    etree.SubElement(message, "Text").text = mensagem
-    
-    # Criar seção ReturnValueV2 vazia
-    return_value = etree.SubElement(response, "ReturnValueV2")
-    etree.SubElement(return_value, "Fields")
-    etree.SubElement(return_value, "ShortText").text = short_text
-    etree.SubElement(return_value, "LongText")
-    etree.SubElement(return_value, "Value").text = "0"
-    
-    # Gerar XML com declaração e encoding utf-16
-    xml_declaration = '<?xml version="1.0" encoding="utf-16"?>'
-    xml_str = etree.tostring(response, encoding="utf-16", xml_declaration=False).decode("utf-16")
-    xml_str = xml_declaration + "\n" + xml_str
-    
-    return Response(xml_str.encode("utf-16"), content_type="application/xml; charset=utf-16")
\ No newline at end of file
+    charset = charset_da_resposta()
+    corpo = MODELO_RESPOSTA_CEP.gerar(
+        charset,
+        logradouro=data.get("logradouro", ""),
+        complemento=data.get("complemento", ""),
+        bairro=data.get("bairro", ""),
+        localidade=data.get("localidade", ""),
+        estado=data.get("estado", ""),
+        uf=data.get("uf", ""),
+    )
+    registrar_resposta("XML de Resposta V2", corpo, charset)  # Depuração no console
+    return Response(corpo, content_type=content_type_xml(charset))
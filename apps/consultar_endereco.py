@@ -1,54 +1,24 @@
-from flask import request, Response
+from flask import Response
+from werkzeug.exceptions import HTTPException
 import requests
 from lxml import etree
 import logging
-import time
 from utils.gerar_erro import gerar_erro_xml
-from utils.adicionar_campo import adicionar_campo
+from utils.extrator_campos import extrair_campos_da_requisicao
+from utils import cliente_http
+from utils.resposta_v2 import Vaga, compilar_resposta_v2, registrar_resposta
+from utils.charset_resposta import charset_da_resposta, content_type_xml
 
 def consultar_endereco():
     try:
-        content_type = request.headers.get("Content-Type", "").lower()
-        logging.debug(f"Tipo de conteúdo recebido: {content_type}")
-
-        # Tenta extrair o XML de várias fontes possíveis
-        xml_data = None
-
-        # Tenta do form primeiro (com vários nomes possíveis)
-        if request.form:
-            for possible_name in ["TextXML", "textxml", "xmldata", "xml"]:
-                if possible_name in request.form:
-                    xml_data = request.form.get(possible_name)
-                    logging.debug(f"XML encontrado no campo {possible_name}")
-                    break
-
-            # Se não encontrou no form, tenta o primeiro campo do form
-            if not xml_data and len(request.form) > 0:
-                first_key = next(iter(request.form))
-                xml_data = request.form.get(first_key)
-                logging.debug(f"Usando primeiro campo do form: {first_key}")
-
-        # Se não encontrou no form, tenta do corpo da requisição
-        if not xml_data and request.data:
-            try:
-                xml_data = request.data.decode('utf-8')
-                logging.debug("Usando dados brutos do corpo da requisição")
-            except:
-                pass
-
-        if not xml_data:
-            return gerar_erro_xml("Não foi possível encontrar dados XML na requisição", "SEM DADOS XML")
-
-        logging.debug(f"XML para processar: {xml_data}")
-
-        # Tenta fazer o parse do XML
+        # Extrai só os campos necessários, parando a leitura assim que são encontrados
         try:
-            root = etree.fromstring(xml_data.encode("utf-8"))
+            campos = extrair_campos_da_requisicao({"LATLONG", "local", "coordenadas"})
         except etree.XMLSyntaxError:
             return gerar_erro_xml("Erro ao processar o XML recebido.", "SEM DADOS XML")
 
-        # Processa os campos do XML
-        campos = processar_campos(root)
+        if campos is None:
+            return gerar_erro_xml("Não foi possível encontrar dados XML na requisição", "SEM DADOS XML")
 
         # Extrai as coordenadas do XML
         latlong = campos.get("LATLONG") or campos.get("local") or campos.get("coordenadas")
@@ -83,8 +53,11 @@ def consultar_endereco():
         headers = {
             'User-Agent': 'MinhaAplicacao/1.0 (meuemail@exemplo.com)'  # Substitua com informações reais
         }
-        time.sleep(1) #Adicionando delay
-        response = requests.get(url, headers=headers)
+        # O intervalo de 1 s entre chamadas (política do Nominatim) fica no upstream "nominatim"
+        try:
+            response = cliente_http.get("nominatim", url, headers=headers)
+        except requests.RequestException:
+            return gerar_erro_xml("Erro ao consultar a API Nominatim. Tente novamente.", "SEM DADOS DA API")
 
         if response.status_code != 200:
             return gerar_erro_xml(f"Erro ao consultar a API Nominatim. Status code: {response.status_code}", "SEM DADOS DA API")
@@ -96,62 +69,42 @@ def consultar_endereco():
         # Retorna os dados do endereço no novo formato
         return gerar_resposta_xml_v2(data)
 
+    except HTTPException:
+        # Erros do corpo da requisição (tamanho, compressão) são respondidos pelo middleware
+        raise
     except Exception as e:
         logging.error(f"Erro interno: {str(e)}")
-        return gerar_erro_xml(f"Erro interno no servidor: {str(e)}")
-
-def processar_campos(root):
-    """Processa os campos do XML e retorna um dicionário com os valores."""
-    campos = {}
-    for field in root.findall(".//Field"):
-        id_field = field.findtext("ID") or field.findtext("Id")  # Tenta ambos os formatos
-        value = field.findtext("Value")
-        if id_field and value:
-            campos[id_field] = value
-
-    return campos
+        return gerar_erro_xml(f"Erro interno no servidor: {str(e)}", "Erro")
+
+# Resposta de sucesso compilada uma única vez (ver utils/resposta_v2.py)
+MODELO_RESPOSTA_ENDERECO = compilar_resposta_v2(
+    "Endereço encontrado com sucesso",
+    "ENDERECO ENCONTRADO",
+    campos=[
+        ("CEP", Vaga("cep")),
+        ("LOGRADOURO", Vaga("logradouro")),
+        ("COMPLEMENTO", Vaga("complemento")),
+        ("BAIRRO", Vaga("bairro")),
+        ("CIDADE", Vaga("cidade")),
+        ("ESTADO", Vaga("estado")),
+        ("UF", Vaga("uf")),
+    ],
+)
 
 def gerar_resposta_xml_v2(data):
     """Gera a resposta XML V2 com os dados do endereço."""
-    # Definir namespaces
-    nsmap = {
-        'xsi': 'http://www.w3.org/2001/XMLSchema-instance',
-        'xsd': 'http://www.w3.org/2001/XMLSchema'
-    }
-
-    # Criar o elemento raiz com namespaces
-    response = etree.Element("ResponseV2", nsmap=nsmap)
-
-    # Adicionar seção de mensagem
-    message = etree.SubElement(response, "MessageV2")
-    etree.SubElement(message, "Text").text = "Endereço encontrado com sucesso"
-
-    # Criar seção ReturnValueV2
-    return_value = etree.SubElement(response, "ReturnValueV2")
-    fields = etree.SubElement(return_value, "Fields")
-
     # Mapear dados do Nominatim para os novos campos
     address = data.get("address", {})
-    adicionar_campo(fields, "CEP", address.get("postcode", ""))
-    adicionar_campo(fields, "LOGRADOURO", address.get("road", ""))
-    adicionar_campo(fields, "COMPLEMENTO", address.get("house_number", ""))  # Ou outro campo apropriado
-    adicionar_campo(fields, "BAIRRO", address.get("neighbourhood", "") or address.get("suburb", ""))
-    adicionar_campo(fields, "CIDADE", address.get("city", "") or address.get("town", ""))
-    adicionar_campo(fields, "ESTADO", address.get("state", ""))
-    adicionar_campo(fields, "UF", address.get("country_code", "").upper())
-    
-    
-
-    # Adicionar campos adicionais do ReturnValueV2
-    etree.SubElement(return_value, "ShortText").text = "ENDERECO ENCONTRADO"
-    etree.SubElement(return_value, "LongText")  # Vazio
-    etree.SubElement(return_value, "Value").text = "58"
-
-    # Gerar XML com declaração e encoding utf-16
-    xml_declaration = '<?xml version="1.0" encoding="utf-16"?>'
-    xml_str = etree.tostring(response, encoding="utf-16", xml_declaration=False).decode("utf-16")
-    xml_str = xml_declaration + "\n" + xml_str
-
-    logging.debug(f"XML de Resposta V2: {xml_str}")  # Depuração no console
-
-    return Response(xml_str.encode("utf-16"), content_type="application/xml; charset=utf-16")
\ No newline at end of file
+    charset = charset_da_resposta()
+    corpo = MODELO_RESPOSTA_ENDERECO.gerar(
+        charset,
+        cep=address.get("postcode", ""),
+        logradouro=address.get("road", ""),
+        complemento=address.get("house_number", ""),  # Ou outro campo apropriado
+        bairro=address.get("neighbourhood", "") or address.get("suburb", ""),
+        cidade=address.get("city", "") or address.get("town", ""),
+        estado=address.get("state", ""),
+        uf=address.get("country_code", "").upper(),
+    )
+    registrar_resposta("XML de Resposta V2", corpo, charset)  # Depuração no console
+    return Response(corpo, content_type=content_type_xml(charset))
@@ -2,7 +2,10 @@ from flask import Flask, request, Response
 from lxml import etree
 import random
 import logging
-from io import BytesIO
+from utils.xml_da_requisicao import obter_root_da_requisicao
+from utils.form_index import FormIndex
+from utils.charset_resposta import charset_da_resposta, content_type_xml
+from utils import gerar_erro
 
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(levelname)s:%(name)s:%(message)s')
@@ -10,29 +13,13 @@ logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(levelname)s:%(nam
 # --- Funções Auxiliares ---
 def gerar_erro_xml(mensagem, short_text="Erro", status_code=400):
     logging.error(f"Gerando erro: {mensagem}")
-    nsmap = {'xsi': 'http://www.w3.org/2001/XMLSchema-instance','xsd': 'http://www.w3.org/2001/XMLSchema'}
-    response = etree.Element("ResponseV2", nsmap=nsmap)
-    message = etree.SubElement(response, "MessageV2")
-    etree.SubElement(message, "Text").text = mensagem
-    return_value = etree.SubElement(response, "ReturnValueV2")
-    etree.SubElement(return_value, "Fields")
-    etree.SubElement(return_value, "ShortText").text = short_text
-    etree.SubElement(return_value, "LongText")
-    etree.SubElement(return_value, "Value").text = "0"
-    xml_declaration = '<?xml version="1.0" encoding="utf-16"?>\n'
-    xml_body = etree.tostring(response, encoding="utf-16", xml_declaration=False).decode("utf-16")
-    xml_str_final = xml_declaration + xml_body
-    return Response(xml_str_final.encode("utf-16"), status=status_code, content_type="application/xml; charset=utf-16")
+    return gerar_erro.gerar_erro_xml(mensagem, short_text, status_code=status_code)
 
-def extrair_valores_do_xml(xml_bytes, balanca_id):
+def extrair_valores_do_xml(index, balanca_id):
     """
     Extrai valores de PESO e PESOBALANCA do XML (não da tabela)
     """
     try:
-        parser = etree.XMLParser(recover=True)
-        tree = etree.parse(BytesIO(xml_bytes), parser)
-        root = tree.getroot()
-        
         # Determina os IDs dos campos com base no balanca_id
         if balanca_id == "balanca1":
             peso_id = "PESO1"
@@ -43,14 +30,12 @@ def extrair_valores_do_xml(xml_bytes, balanca_id):
             pesobalanca_id = "PESOBALANCA2"
             tstpeso_id = "TSTPESO2"
         
-        # Extrair valores diretamente dos campos
+        # Campos presentes no formulário (Value ausente vira "")
         valores = {}
-        
-        # Procura todos os campos no XML
-        for field in root.findall(".//Field"):
-            field_id = field.findtext("ID") or field.findtext("Id")
-            if field_id in [peso_id, pesobalanca_id, tstpeso_id]:
-                valores[field_id] = field.findtext("Value", "").strip()
+        for field_id in (peso_id, pesobalanca_id, tstpeso_id):
+            campo = index.campos.get(field_id)
+            if campo is not None:
+                valores[field_id] = (campo.valor or "").strip()
         
         peso_valor = valores.get(peso_id)
         pesobalanca_valor = valores.get(pesobalanca_id)
@@ -70,7 +55,7 @@ def extrair_valores_do_xml(xml_bytes, balanca_id):
 def gerar_resposta_string_template(peso_novo, pesobalanca_novo, balanca_id, tstpeso_id, tstpeso_valor_usado):
     """
     Gera ResponseV2 usando string formatada, contendo APENAS
-    a TableField relevante com uma única Row e 3 campos essenciais. UTF-16.
+    a TableField relevante com uma única Row e 3 campos essenciais.
     """
     logging.debug(f"Gerando resposta STRING TEMPLATE para balanca '{balanca_id}'")
 
@@ -81,7 +66,8 @@ def gerar_resposta_string_template(peso_novo, pesobalanca_novo, balanca_id, tstp
     tstpeso_id_resp = tstpeso_id # Já é TSTPESO1 ou TSTPESO2
 
     # Monta o template XML usando f-string
-    xml_template = f"""<?xml version="1.0" encoding="utf-16"?>
+    charset = charset_da_resposta()
+    xml_template = f"""<?xml version="1.0" encoding="{charset}"?>
 <ResponseV2 xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns:xsd="http://www.w3.org/2001/XMLSchema">
   <MessageV2>
     <Text>Consulta realizada com sucesso.</Text>
@@ -118,48 +104,17 @@ def gerar_resposta_string_template(peso_novo, pesobalanca_novo, balanca_id, tstp
 
     xml_final_string = xml_template
 
-    logging.debug("XML de Resposta STRING TEMPLATE (UTF-16):\n%s", xml_final_string)
-    # Codifica a string final para UTF-16 para a resposta
-    return Response(xml_final_string.encode("utf-16"), content_type="application/xml; charset=utf-16")
+    logging.debug("XML de Resposta STRING TEMPLATE (%s):\n%s", charset, xml_final_string)
+    return Response(xml_final_string.encode(charset), content_type=content_type_xml(charset))
 
 def encaixotar_v3():
     logging.info(f"--- Nova Requisição {request.method} para /teste_caixa ---")
     # 1. Obtenção Robusta do XML
-    content_type = request.headers.get("Content-Type", "").lower()
-    xml_data_str = None
-    xml_data_bytes = None
-    
-    if 'form' in content_type.lower() and request.form:
-        for name in ["TextXML", "textxml", "XMLData", "xmldata", "xml"]:
-            if name in request.form:
-                xml_data_str = request.form.get(name)
-                break
-        if not xml_data_str and request.form:
-            first_key = next(iter(request.form))
-            xml_data_str = request.form.get(first_key)
-        if xml_data_str:
-            logging.info("XML obtido de request.form.")
-    
-    if not xml_data_str and request.data:
-        try:
-            xml_data_bytes = request.data
-            xml_data_str = xml_data_bytes.decode('utf-8')
-            logging.info("XML obtido de request.data (UTF-8).")
-        except UnicodeDecodeError:
-            try:
-                xml_data_str = request.data.decode('latin-1')
-                xml_data_bytes = request.data
-                logging.info("XML obtido de request.data (Latin-1).")
-            except UnicodeDecodeError:
-                return gerar_erro_xml("Encoding inválido.", "Erro Encoding", 400)
-    
-    if not xml_data_bytes and xml_data_str:
-        try:
-            xml_data_bytes = xml_data_str.encode('utf-8')
-        except Exception as e:
-            return gerar_erro_xml(f"Erro codificando form data: {e}", "Erro Encoding", 500)
-    
-    if not xml_data_bytes:
+    try:
+        root = obter_root_da_requisicao(recover=True)
+    except etree.XMLSyntaxError as e:
+        return gerar_erro_xml(f"Erro ao processar XML: {e}", "Erro Input", 400)
+    if root is None:
         return gerar_erro_xml("XML não encontrado.", "Erro Input", 400)
 
     try:
@@ -169,7 +124,7 @@ def encaixotar_v3():
             return gerar_erro_xml("Parâmetro 'balanca' inválido.", "Erro Param", 400)
 
         # 3. Extrair valores dos campos (não da tabela)
-        peso_valor, pesobalanca_valor, tstpeso_valor = extrair_valores_do_xml(xml_data_bytes, balanca)
+        peso_valor, pesobalanca_valor, tstpeso_valor = extrair_valores_do_xml(FormIndex.construir(root), balanca)
         
         # Se não conseguiu extrair os valores, gera erro
         if peso_valor is None or pesobalanca_valor is None:
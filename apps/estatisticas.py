@@ -0,0 +1,34 @@
+from flask import jsonify
+from utils.base_cep import estatisticas_base_cep
+from utils.cache_cep import estatisticas_cache_cep
+from utils.cache_logradouro import estatisticas_cache_logradouro
+from utils.cliente_http import estatisticas_http
+from utils.compressao_resposta import estatisticas_compressao
+from utils.especulacao import estatisticas_especulacao
+from utils.gerar_erro import estatisticas_erros
+from utils.listas_estaticas import estatisticas_listas
+from utils.mapa_ceps import estatisticas_mapa_ceps
+from utils.paginacao import estatisticas_paginacao
+from utils.parsers import estatisticas_parsers
+
+
+def estatisticas():
+    """
+    Contadores internos do serviço: parsers XML, cache de respostas de erro, bytes
+    por rota, listas estáticas, paginação, chamadas aos serviços externos, cache,
+    base local e mapa de CEPs e buscas por logradouro do cepv3 (especulativas e
+    em cache).
+    """
+    return jsonify({
+        "parsers": estatisticas_parsers(),
+        "erros": estatisticas_erros(),
+        "compressao": estatisticas_compressao(),
+        "listas": estatisticas_listas(),
+        "paginacao": estatisticas_paginacao(),
+        "http": estatisticas_http(),
+        "cache_cep": estatisticas_cache_cep(),
+        "base_cep": estatisticas_base_cep(),
+        "mapa_ceps": estatisticas_mapa_ceps(),
+        "especulacao": estatisticas_especulacao(),
+        "cache_logradouro": estatisticas_cache_logradouro(),
+    })
@@ -1,9 +1,11 @@
 from flask import Flask, request, Response
-from lxml import etree
-import random
+from werkzeug.exceptions import HTTPException
 import logging
-from io import StringIO
-from utils import gerar_erro
+from utils.gerar_erro import gerar_erro_xml
+from utils.extrator_campos import extrair_campos_da_requisicao
+from utils.resposta_v2 import ConstrutorRespostaV2
+from utils.charset_resposta import charset_da_resposta, content_type_xml
+from utils.valores_aleatorios import gerador_valores
 
 app = Flask(__name__)
 logging.basicConfig(level=logging.DEBUG)
@@ -17,98 +19,50 @@ ultimo_valor = {
     'balanca2': None
 }
 
-def extrair_campos_xml(xml_data):
-    """Extrai campos relevantes do XML de entrada"""
+def extrair_campos_xml(tstpeso_id):
+    """Extrai do XML de entrada apenas o campo TSTPESO da balança, sem ler o resto do form"""
     try:
-        logging.debug(f"Iniciando extração de campos do XML (tamanho: {len(xml_data)} bytes)")
-        xml_logger.debug("\n=== XML RECEBIDO ===\n%s\n=== FIM XML ===", xml_data)
-
-        parser = etree.XMLParser(recover=True)
-        tree = etree.parse(StringIO(xml_data), parser)
-        root = tree.getroot()
-
-        campos = {}
-        for field in root.findall(".//Field"):
-            field_id = field.findtext("ID") or field.findtext("Id")
-            if field_id:
-                campos[field_id] = field.findtext("Value")
-        
-        logging.debug(f"Campos extraídos: {campos}")
+        logging.debug(f"Iniciando extração do campo {tstpeso_id} do XML")
+        campos = extrair_campos_da_requisicao({tstpeso_id}, recover=True)
+        xml_logger.debug("Campos extraídos: %s", campos)
         return campos
+    except HTTPException:
+        # Erros do corpo da requisição (tamanho, compressão) são respondidos pelo middleware
+        raise
     except Exception as e:
         logging.error(f"Erro ao processar XML: {e}")
         return None
 
 def gerar_valores_peso(tstpeso, balanca):
     """Gera valores de peso conforme a lógica especificada"""
-    def formatar_numero():
-        # Usar 3 casas decimais para diminuir chance de colisão
-        return "{:.2f}".format(random.uniform(0.5, 500.0)).replace('.', ',')
-
     # Adiciona logging para clareza
     logging.debug(f"Gerando peso para balanca '{balanca}' com TSTPESO = '{tstpeso}'")
 
-    if tstpeso == "0":
-        valor = formatar_numero()
-        logging.debug(f"  -> Peso/Balanca (TST=0): {valor}")
-        return valor, valor
-    elif tstpeso == "1":
-        # Para tstpeso=1, geramos dois valores intencionalmente diferentes
-        peso = formatar_numero()
-        pesobalanca = formatar_numero()
-        
-        # Garantir que são diferentes
-        retry_count = 0
-        max_retries = 10  # Segurança
-        while peso == pesobalanca and retry_count < max_retries:
-            pesobalanca = formatar_numero()
-            retry_count += 1
-            logging.debug(f"  -> Regerando pesobalanca, tentativa {retry_count}")
-        
-        logging.debug(f"  -> Peso (TST=1): {peso}, Balanca: {pesobalanca}")
-        return peso, pesobalanca
-    else:
+    if tstpeso not in ("0", "1"):
         # Fallback para TSTPESO inválido
         logging.warning(f"TSTPESO inválido: '{tstpeso}'. Gerando como TST=0.")
-        valor = formatar_numero()
-        return valor, valor
-
-def gerar_resposta_xml(peso, pesobalanca, balanca, tstpeso):
-    """Gera a resposta XML formatada corretamente"""
-    nsmap = {
-        'xsi': 'http://www.w3.org/2001/XMLSchema-instance',
-        'xsd': 'http://www.w3.org/2001/XMLSchema'
-    }
-
-    response = etree.Element("ResponseV2", nsmap=nsmap)
 
-    message = etree.SubElement(response, "MessageV2")
-    etree.SubElement(message, "Text").text = "Consulta realizada com sucesso."
+    # Para tstpeso=1, dois valores intencionalmente diferentes; senão, o mesmo valor
+    peso, pesobalanca = gerador_valores().pesos(tstpeso)
+    logging.debug(f"  -> Peso (TST={tstpeso}): {peso}, Balanca: {pesobalanca}")
+    return peso, pesobalanca
 
-    return_value = etree.SubElement(response, "ReturnValueV2")
-    fields = etree.SubElement(return_value, "Fields")
+def gerar_resposta_xml(peso, pesobalanca, balanca, tstpeso, encoding="utf-16"):
+    """Gera a resposta XML formatada corretamente"""
+    # Mesma declaração (aspas simples) que o tostring(xml_declaration=True) do lxml gerava
+    construtor = ConstrutorRespostaV2("Consulta realizada com sucesso.", encoding=encoding,
+                                      declaracao=f"<?xml version='1.0' encoding='{encoding}'?>")
 
     if balanca == "balanca1":
-        adicionar_campo(fields, "PESO1", peso)
-        adicionar_campo(fields, "PESOBALANCA1", pesobalanca)
+        construtor.campo("PESO1", peso)
+        construtor.campo("PESOBALANCA1", pesobalanca)
     else:
-        adicionar_campo(fields, "PESO2", peso)
-        adicionar_campo(fields, "PESOBALANCA2", pesobalanca)
-
-    adicionar_campo(fields, "TSTPESO", tstpeso)
+        construtor.campo("PESO2", peso)
+        construtor.campo("PESOBALANCA2", pesobalanca)
 
-    etree.SubElement(return_value, "ShortText").text = "Pressione Lixeira para nova consulta"
-    etree.SubElement(return_value, "LongText")
-    etree.SubElement(return_value, "Value").text = "58"
+    construtor.campo("TSTPESO", tstpeso)
 
-    xml_bytes = etree.tostring(response, encoding="utf-16", xml_declaration=True)
-    return xml_bytes
-
-def adicionar_campo(parent, field_id, value):
-    """Adiciona um campo ao XML de resposta"""
-    field = etree.SubElement(parent, "Field")
-    etree.SubElement(field, "ID").text = field_id
-    etree.SubElement(field, "Value").text = value
+    return construtor.finalizar("Pressione Lixeira para nova consulta")
 
 @app.route("/funcao_unica", methods=['GET', 'POST'])
 def consultar_peso_unico():
@@ -119,38 +73,29 @@ def consultar_peso_unico():
         
         # Validar se o valor de balanca é válido
         if balanca not in ["balanca1", "balanca2"]:
-            return gerar_erro("Valor de 'balanca' inválido. Deve ser 'balanca1' ou 'balanca2'")
+            return gerar_erro_xml("Valor de 'balanca' inválido. Deve ser 'balanca1' ou 'balanca2'", "Erro")
 
-        # Obter XML da requisição
-        if request.content_type == 'application/xml':
-            xml_data = request.data.decode('utf-8')
-        else:
-            xml_data = request.form.get('xml') or request.form.get('TextXML') or next(iter(request.form.values()))
-        
-        if not xml_data:
-            return gerar_erro("Nenhum dado XML encontrado na requisição")
-        
-        # Extrair campos do XML
-        campos = extrair_campos_xml(xml_data)
-        if not campos:
-            return gerar_erro("Não foi possível extrair campos do XML")
-
-        if balanca == "balanca1":
-            tstpeso = campos.get("TSTPESO1", "0")
-            if tstpeso not in ["0", "1"]:
-                return gerar_erro("Campo TSTPESO deve ser 0 ou 1")
-        
-        else:
-            tstpeso = campos.get("TSTPESO2", "0")
-            if tstpeso not in ["0", "1"]:
-                return gerar_erro("Campo TSTPESO deve ser 0 ou 1")
+        tstpeso_id = "TSTPESO1" if balanca == "balanca1" else "TSTPESO2"
+
+        # Extrair do XML só o campo necessário
+        campos = extrair_campos_xml(tstpeso_id)
+        if campos is None:
+            return gerar_erro_xml("Nenhum dado XML encontrado na requisição", "Erro")
+
+        tstpeso = campos.get(tstpeso_id, "0")
+        if tstpeso not in ["0", "1"]:
+            return gerar_erro_xml("Campo TSTPESO deve ser 0 ou 1", "Erro")
 
         peso, pesobalanca = gerar_valores_peso(tstpeso, balanca)
         ultimo_valor[balanca] = peso
 
-        xml_resposta = gerar_resposta_xml(peso, pesobalanca, balanca, tstpeso)
-        return Response(xml_resposta, content_type='application/xml; charset=utf-16')
+        charset = charset_da_resposta()
+        xml_resposta = gerar_resposta_xml(peso, pesobalanca, balanca, tstpeso, charset)
+        return Response(xml_resposta, content_type=content_type_xml(charset))
 
+    except HTTPException:
+        # Erros do corpo da requisição (tamanho, compressão) são respondidos pelo middleware
+        raise
     except Exception as e:
         logging.error(f"Erro no processamento: {str(e)}")
-        return gerar_erro(f"Erro interno: {str(e)}")
+        return gerar_erro_xml(f"Erro interno: {str(e)}", "Erro")
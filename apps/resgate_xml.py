@@ -1,107 +1,65 @@
-from flask import Flask, request, Response
+from flask import Flask, Response
+from werkzeug.exceptions import HTTPException
 import logging
 from lxml import etree
+from utils.xml_da_requisicao import obter_root_da_requisicao
+from utils.resposta_v2 import NSMAP_PADRAO, ConstrutorXml
+from utils.charset_resposta import charset_da_resposta, content_type_xml
 
 def resgate_xml():
     try:
-        content_type = request.headers.get("Content-Type", "").lower()
-        logging.debug(f"Tipo de conteúdo recebido: {content_type}")
-        
-        xml_data = None
-        
-        # Tenta extrair o XML do formulário
-        if request.form:
-            for possible_name in ["TextXML", "textxml", "xmldata", "xml"]:
-                if possible_name in request.form:
-                    xml_data = request.form.get(possible_name)
-                    logging.debug(f"XML encontrado no campo {possible_name}")
-                    break
-            
-            if not xml_data and len(request.form) > 0:
-                first_key = next(iter(request.form))
-                xml_data = request.form.get(first_key)
-                logging.debug(f"Usando primeiro campo do form: {first_key}")
-        
-        # Se não encontrou no form, tenta do corpo da requisição
-        if not xml_data and request.data:
-            try:
-                xml_data = request.data.decode('utf-8')
-                logging.debug("Usando dados brutos do corpo da requisição")
-            except:
-                pass
-        
-        if not xml_data:
-            logging.error("Nenhum XML encontrado na requisição")
-            return gerar_resposta_erro("Nenhum XML encontrado")
-        
-        # Log do XML completo recebido
-        logging.debug(f"XML COMPLETO RECEBIDO: {xml_data}")
-        
-        # Tenta fazer parse do XML
+        # Tenta fazer parse do XML (forms são lidos em streaming)
         try:
-            root = etree.fromstring(xml_data.encode('utf-8'))
-            logging.debug("XML parseado com sucesso")
+            root = obter_root_da_requisicao()
         except etree.XMLSyntaxError as e:
             logging.error(f"Erro de sintaxe no XML: {e}")
             return gerar_resposta_erro(f"Erro de sintaxe no XML: {e}")
+
+        if root is None:
+            logging.error("Nenhum XML encontrado na requisição")
+            return gerar_resposta_erro("Nenhum XML encontrado")
+
+        logging.debug("XML parseado com sucesso")
+        # Log do XML completo recebido
+        logging.debug(f"XML COMPLETO RECEBIDO: {etree.tostring(root, encoding='unicode')}")
         
         # Se chegou aqui, é um XML válido
         return gerar_resposta_sucesso()
     
+    except HTTPException:
+        # Erros do corpo da requisição (tamanho, compressão) são respondidos pelo middleware
+        raise
     except Exception as e:
         logging.error(f"Erro interno: {str(e)}")
         return gerar_resposta_erro(f"Erro interno: {str(e)}")
 
+def gerar_resposta(texto, icon, short_text, long_text, value, action):
+    """Response/ReturnValue (formato V1) no charset negociado para a requisição"""
+    charset = charset_da_resposta()
+    construtor = ConstrutorXml(charset)
+    construtor.abrir("Response", {f"xmlns:{prefixo}": uri for prefixo, uri in NSMAP_PADRAO.items()})
+
+    construtor.abrir("Message")
+    construtor.elemento("Text", texto)
+    construtor.elemento("Icon", icon)
+    construtor.elemento("ButtonText", "OK")
+    construtor.fechar()
+
+    construtor.abrir("ReturnValue")
+    construtor.elemento("ShortText", short_text)
+    construtor.elemento("LongText", long_text)
+    construtor.elemento("Value", value)
+    construtor.elemento("Action", action)
+    construtor.fechar()
+    construtor.fechar()
+
+    return Response(construtor.corpo(), content_type=content_type_xml(charset))
+
 def gerar_resposta_sucesso():
     """Gera resposta de sucesso com XML"""
-    nsmap = {
-        'xsi': 'http://www.w3.org/2001/XMLSchema-instance',
-        'xsd': 'http://www.w3.org/2001/XMLSchema'
-    }
-    
-    response = etree.Element("Response", nsmap=nsmap)
-    
-    message = etree.SubElement(response, "Message")
-    etree.SubElement(message, "Text").text = "XML Processado com Sucesso"
-    etree.SubElement(message, "Icon").text = "Info"
-    etree.SubElement(message, "ButtonText").text = "OK"
-    
-    return_value = etree.SubElement(response, "ReturnValue")
-    etree.SubElement(return_value, "ShortText").text = "XML Válido"
-    etree.SubElement(return_value, "LongText").text = "XML foi capturado e validado"
-    etree.SubElement(return_value, "Value").text = "OK"
-    etree.SubElement(return_value, "Action").text = "Continue"
-    
-    # Gerar XML com declaração e encoding utf-16
-    xml_declaration = '<?xml version="1.0" encoding="utf-16"?>'
-    xml_str = etree.tostring(response, encoding="utf-16", xml_declaration=False).decode("utf-16")
-    xml_str = xml_declaration + "\n" + xml_str
-    
-    return Response(xml_str.encode("utf-16"), content_type="application/xml; charset=utf-16")
+    return gerar_resposta("XML Processado com Sucesso", "Info", "XML Válido",
+                          "XML foi capturado e validado", "OK", "Continue")
 
 def gerar_resposta_erro(mensagem):
     """Gera resposta de erro com XML"""
-    nsmap = {
-        'xsi': 'http://www.w3.org/2001/XMLSchema-instance',
-        'xsd': 'http://www.w3.org/2001/XMLSchema'
-    }
-    
-    response = etree.Element("Response", nsmap=nsmap)
-    
-    message = etree.SubElement(response, "Message")
-    etree.SubElement(message, "Text").text = mensagem
-    etree.SubElement(message, "Icon").text = "Warning"
-    etree.SubElement(message, "ButtonText").text = "OK"
-    
-    return_value = etree.SubElement(response, "ReturnValue")
-    etree.SubElement(return_value, "ShortText").text = "Erro no Processamento"
-    etree.SubElement(return_value, "LongText").text = mensagem
-    etree.SubElement(return_value, "Value").text = "Erro"
-    etree.SubElement(return_value, "Action").text = "Stop"
-    
-    # Gerar XML com declaração e encoding utf-16
-    xml_declaration = '<?xml version="1.0" encoding="utf-16"?>'
-    xml_str = etree.tostring(response, encoding="utf-16", xml_declaration=False).decode("utf-16")
-    xml_str = xml_declaration + "\n" + xml_str
-    
-    return Response(xml_str.encode("utf-16"), content_type="application/xml; charset=utf-16")
\ No newline at end of file
+    return gerar_resposta(mensagem, "Warning", "Erro no Processamento", mensagem, "Erro", "Stop")
@@ -1,50 +1,41 @@
 from flask import Flask, Response, request
 import logging
+import os
+from utils.listas_estaticas import ListaEstatica
 
 app = Flask(__name__)
 logging.basicConfig(level=logging.DEBUG)
 
-# Middleware para capturar TODAS as requisições
+# Middleware para capturar TODAS as requisições (só no servidor de teste deste módulo).
+# O corpo não é lido aqui: só o tamanho declarado entra no log
 @app.before_request
 def log_request_info():
+    if not app.logger.isEnabledFor(logging.DEBUG):
+        return
     app.logger.debug('=== ANTES DA REQUISIÇÃO ===')
     app.logger.debug('Headers: %s', request.headers)
-    app.logger.debug('Body: %s', request.get_data())
+    app.logger.debug('Body: %s bytes', request.content_length)
     app.logger.debug('Method: %s', request.method)
     app.logger.debug('URL: %s', request.url)
     app.logger.debug('=============================')
 
+# Lista da /simple-xml: renderizada uma vez, com ETag; LISTA_SIMPLE_XML_ARQUIVO
+# (JSON com [[texto, valor], ...]) substitui as opções fixas e é recarregado quando muda
+LISTA_SIMPLE_XML = ListaEstatica(
+    "simple-xml",
+    itens=[("Option One", "1"), ("Option Two", "2"), ("Option Three", "3")],
+    arquivo=os.getenv("LISTA_SIMPLE_XML_ARQUIVO"),
+)
+
 # Rota que aceita QUALQUER método
 @app.route('/simple-xml', methods=['GET', 'POST', 'PUT', 'DELETE', 'PATCH', 'OPTIONS', 'HEAD'])
 def simple_xml():
     try:
-        print(f"FUNÇÃO CHAMADA! Método: {request.method}")
-        
-        xml_data = '''<?xml version="1.0" encoding="utf-8"?>
-<Response>
-    <ReturnValue>
-        <Items>
-            <Item>
-                <Text>Option One</Text>
-                <Value>1</Value>
-            </Item>
-            <Item>
-                <Text>Option Two</Text>
-                <Value>2</Value>
-            </Item>
-            <Item>
-                <Text>Option Three</Text>
-                <Value>3</Value>
-            </Item>
-        </Items>
-    </ReturnValue>
-</Response>'''
-        
-        print("Enviando resposta XML...")
-        return Response(xml_data, mimetype='text/xml')
+        logging.debug(f"simple-xml chamada. Método: {request.method}")
+        return LISTA_SIMPLE_XML.resposta()
         
     except Exception as e:
-        print(f"ERRO na função: {str(e)}")
+        logging.error(f"ERRO na função: {str(e)}")
         return Response("Erro", status=500)
 
 # Rota catch-all para debug
@@ -1,70 +1,92 @@
 from flask import Flask, request, Response
 from lxml import etree
-import random
 import logging
-from io import BytesIO
+import os
+from utils.xml_da_requisicao import obter_root_da_requisicao
+from utils.form_index import FormIndex, ler_campo, tabela_so_linha_alvo
+from utils.resposta_v2 import ConstrutorRespostaV2
+from utils.charset_resposta import charset_da_resposta, content_type_xml
+from utils.valores_aleatorios import gerador_valores
 from utils.gerar_erro import gerar_erro_xml 
 
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s %(levelname)s:%(name)s:%(message)s')
 
+# Modo padrão da resposta (a requisição pode trocar com ?modo=):
+# "completo" devolve a tabela inteira; "linha_atual" só a linha IsCurrentRow
+MODOS_TESTE_CAIXA = ("completo", "linha_atual")
+MODO_TESTE_CAIXA = os.getenv("MODO_TESTE_CAIXA", "completo")
+
 # --- Funções Auxiliares ---
 def gerar_erro_xml_padrao(mensagem, short_text="Erro", status_code=400):
     logging.error(f"Gerando erro: {mensagem}")
-    nsmap = {'xsi': 'http://www.w3.org/2001/XMLSchema-instance', 'xsd': 'http://www.w3.org/2001/XMLSchema'}
-    response = etree.Element("ResponseV2", nsmap=nsmap)
-    message = etree.SubElement(response, "MessageV2")
-    etree.SubElement(message, "Text").text = mensagem
-    return_value = etree.SubElement(response, "ReturnValueV2")
-    etree.SubElement(return_value, "Fields")
-    etree.SubElement(return_value, "ShortText").text = short_text
-    etree.SubElement(return_value, "LongText")
-    etree.SubElement(return_value, "Value").text = "0"
-    xml_declaration = '<?xml version="1.0" encoding="utf-16"?>\n'
-    xml_body = etree.tostring(response, encoding="utf-16", xml_declaration=False).decode("utf-16")
-    xml_str_final = xml_declaration + xml_body
-    return Response(xml_str_final.encode("utf-16"), status=status_code, content_type="application/xml; charset=utf-16")
+    return gerar_erro_xml(mensagem, short_text, status_code=status_code)
 
 
-def extrair_tstpeso_da_tabela(xml_bytes, tabela_id_alvo, tstpeso_id_alvo):
-    if not xml_bytes: return "0"
-    try:
-        parser = etree.XMLParser(recover=True); tree = etree.parse(BytesIO(xml_bytes), parser); root = tree.getroot()
-        xpath_tabela = f".//TableField[Id='{tabela_id_alvo}']"; tabela_elements = root.xpath(xpath_tabela)
-        if not tabela_elements: return "0"
-        tabela_element = tabela_elements[0]; linha_alvo = None
-        current_rows = tabela_element.xpath(".//Row[@IsCurrentRow='True']")
-        if current_rows: linha_alvo = current_rows[0]
-        else:
-            primeira_linha_list = tabela_element.xpath(".//Row[1]")
-            if primeira_linha_list: linha_alvo = primeira_linha_list[0]
-        if linha_alvo is None: return "0"
-        xpath_tstpeso = f".//Field[Id='{tstpeso_id_alvo}']/Value"; tstpeso_elements = linha_alvo.xpath(xpath_tstpeso)
-        if tstpeso_elements:
-            value_text = tstpeso_elements[0].text
-            if value_text is not None: value_text = value_text.strip(); return value_text if value_text in ["0", "1"] else "0"
-        return "0"
-    except Exception: logging.exception("Erro ao extrair TSTPESO"); return "0"
+def extrair_tstpeso_da_tabela(tabela, tstpeso_id_alvo):
+    """TSTPESO da linha atual (IsCurrentRow) da tabela, ou da primeira linha; "0" se ausente/inválido."""
+    linha_alvo = tabela.linha_alvo() if tabela is not None else None
+    if linha_alvo is None: return "0"
+    value_text = linha_alvo.get(tstpeso_id_alvo)
+    if value_text is not None:
+        value_text = value_text.strip()
+        return value_text if value_text in ["0", "1"] else "0"
+    return "0"
 
 def gerar_valores_peso(tstpeso_valor, balanca):
-    def formatar_numero(): return "{:.2f}".format(random.uniform(0.5, 500)).replace('.', ',')
+    # Mesmo valor com TSTPESO "0"; dois valores diferentes caso contrário
+    return gerador_valores().pesos("0" if tstpeso_valor == "0" else "1")
 
-    if tstpeso_valor == "0":
-        valor = formatar_numero()
-        return valor, valor
-    else:
-        peso = formatar_numero()
-        pesobalanca = formatar_numero()
-        while peso == pesobalanca:
-            pesobalanca = formatar_numero()
-        return peso, pesobalanca
+# Campos de uma linha da tabela, na ordem original (compilado uma única vez)
+_CAMPOS_DA_LINHA = etree.XPath(".//Field | .//field")
+
+def _escrever_campos_da_linha_atual(construtor, linha, novos_valores, evfoto_id, copiar_foto):
+    """
+    Campos da linha atual, todos com OverrideData=1 (exceto o EVFOTO, copiado como
+    veio ou omitido), com os novos valores de TSTPESO/PESO/PESOBALANCA e o campo WS.
+    """
+    tem_ws = False
+    for field_original in _CAMPOS_DA_LINHA(linha.elemento):
+        # Obter ID e valor do campo original
+        field_id, value = ler_campo(field_original)
+        if field_id == evfoto_id and not copiar_foto:
+            continue
+        construtor.abrir("Field")
+        if field_id is not None:
+            tem_ws = tem_ws or field_id == "WS"
+            construtor.elemento("ID", field_id)
+            
+            # Verificar se é o campo de foto (CX1EVFOTO ou CX2EVFOTO)
+            if field_id == evfoto_id:
+                # Para o campo de foto, não adicionar OverrideData
+                # Apenas copiar o valor original se existir
+                if value is not None:
+                    construtor.elemento("Value", value)
+            else:
+                # Adicionar OverrideData=1 para todos os outros campos
+                construtor.elemento("OverrideData", "1")
+                
+                # TSTPESO, PESO e PESOBALANCA recebem os novos valores; os outros mantêm o original
+                value = novos_valores.get(field_id, value)
+                if value is not None:
+                    construtor.elemento("Value", value)
+        construtor.fechar()
+    
+    # Adicionar o campo WS se ainda não existir
+    if not tem_ws:
+        construtor.campo("Consulta realizada com sucesso", "Pressione Lixeira para nova consulta")
 
-# --- Função de Resposta com lxml ---
-def gerar_resposta_com_linhas_preservadas(xml_bytes, peso_novo, pesobalanca_novo, balanca_id, tstpeso_id, tstpeso_valor_usado):
+# --- Função de Resposta (escrita direto em bytes) ---
+def gerar_resposta_com_linhas_preservadas(tabela_original, peso_novo, pesobalanca_novo, balanca_id, tstpeso_id, tstpeso_valor_usado,
+                                          so_linha_atual=False, anexos=()):
     """
     Gera ResponseV2 preservando a estrutura original do XML,
     atualizando os campos na linha marcada como IsCurrentRow="True"
     e adicionando OverrideData=1 para todos os campos dessa linha,
-    exceto para o campo EVFOTO
+    exceto para o campo EVFOTO.
+    tabela_original vem do FormIndex da requisição (None se a tabela não existir).
+    so_linha_atual: responde só a linha IsCurrentRow, sem o EVFOTO; as demais linhas
+    e as fotos ficam como estão no formulário (tabela_original pode trazer só a linha alvo).
+    anexos: referências de fotos guardadas em disco no parse desta requisição.
     """
     logging.debug(f"Gerando resposta preservando estrutura para balanca '{balanca_id}'")
     
@@ -74,177 +96,80 @@ def gerar_resposta_com_linhas_preservadas(xml_bytes, peso_novo, pesobalanca_novo
         peso_id_resp = "CX1PESO" if balanca_id == "balanca1" else "CX2PESO"
         pesobalanca_id_resp = "CX1PESOBALANCA" if balanca_id == "balanca1" else "CX2PESOBALANCA"
         evfoto_id_resp = "CX1EVFOTO" if balanca_id == "balanca1" else "CX2EVFOTO"
+        novos_valores = {tstpeso_id: tstpeso_valor_usado, peso_id_resp: peso_novo, pesobalanca_id_resp: pesobalanca_novo}
         
-        # Parse do XML original
-        parser = etree.XMLParser(recover=True)
-        tree = etree.parse(BytesIO(xml_bytes), parser)
-        root = tree.getroot()
+        # Criar a estrutura base da resposta (MessageV2 e ReturnValueV2/Fields)
+        charset = charset_da_resposta()
+        construtor = ConstrutorRespostaV2("Consulta realizada com sucesso.", encoding=charset, anexos=anexos)
         
-        # Criar a estrutura base da resposta
-        response = etree.Element("ResponseV2", nsmap={
-            'xsi': 'http://www.w3.org/2001/XMLSchema-instance',
-            'xsd': 'http://www.w3.org/2001/XMLSchema'
-        })
-        
-        # Adicionar MessageV2
-        message = etree.SubElement(response, "MessageV2")
-        etree.SubElement(message, "Text").text = "Consulta realizada com sucesso."
-        
-        # Adicionar ReturnValueV2
-        return_value = etree.SubElement(response, "ReturnValueV2")
-        fields = etree.SubElement(return_value, "Fields")
-        
-        # Encontrar a tabela no XML original
-        xpath_tabela = f".//TableField[ID='{tabela_id_resp}']"
-        tabelas_originais = root.xpath(xpath_tabela)
-        
-        # Tente com "Id" se não encontrar com "ID"
-        if not tabelas_originais:
-            xpath_tabela = f".//TableField[Id='{tabela_id_resp}']"
-            tabelas_originais = root.xpath(xpath_tabela)
-        
-        if tabelas_originais:
-            # Copiar a tabela original
-            tabela_original = tabelas_originais[0]
-            tabela = etree.SubElement(fields, "TableField")
-            
-            # Adicionar ID da tabela
-            etree.SubElement(tabela, "ID").text = tabela_id_resp
-            
-            # Adicionar OverrideData à tabela
-            etree.SubElement(tabela, "OverrideData").text = "1"
-            
-            # Copiar as linhas
-            rows = etree.SubElement(tabela, "Rows")
+        if tabela_original is not None:
+            # Copiar a tabela original, com o ID da resposta e OverrideData
+            construtor.abrir_tabela(tabela_id_resp, override=True)
             
-            # Processar cada linha da tabela original
-            for row_original in tabela_original.xpath(".//Row"):
-                row = etree.SubElement(rows, "Row")
-                
+            # Processar cada linha da tabela original (já indexadas no FormIndex)
+            for linha_original in tabela_original.linhas:
                 # Verificar se é a linha atual
-                is_current = row_original.get("IsCurrentRow") == "True"
-                if is_current:
-                    row.set("IsCurrentRow", "True")
-                
-                # Adicionar campos
-                row_fields = etree.SubElement(row, "Fields")
+                is_current = linha_original.atual
+                if so_linha_atual and not is_current:
+                    # Sem IsCurrentRow não há linha a atualizar: a tabela vai sem linhas
+                    continue
+                construtor.abrir_linha(atual=is_current)
                 
                 # Processar campos com base em se é linha atual ou não
                 if is_current:
-                    # Para a linha atual, adicione todos os campos originais com OverrideData=1
-                    # exceto para o campo EVFOTO
-                    for field_original in row_original.xpath(".//Field"):
-                        field = etree.SubElement(row_fields, "Field")
-                        
-                        # Obter ID do campo original
-                        field_id = field_original.findtext("ID") or field_original.findtext("Id")
-                        if field_id is not None:
-                            etree.SubElement(field, "ID").text = field_id
-                            
-                            
-                            # Verificar se é o campo de foto (CX1EVFOTO ou CX2EVFOTO)
-                            if field_id == evfoto_id_resp:
-                                # Para o campo de foto, não adicionar OverrideData
-                                # Apenas copiar o valor original se existir
-                                value = field_original.findtext("Value")
-                                if value is not None:
-                                    etree.SubElement(field, "Value").text = value
-                            else:
-                                # Adicionar OverrideData=1 para todos os outros campos
-                                etree.SubElement(field, "OverrideData").text = "1"
-                                
-                                # Define valor com base no campo
-                                if field_id == tstpeso_id:
-                                    # Campo TSTPESO - use o valor extraído
-                                    etree.SubElement(field, "Value").text = tstpeso_valor_usado
-                                elif field_id == peso_id_resp:
-                                    # Campo PESO - use o novo valor gerado
-                                    etree.SubElement(field, "Value").text = peso_novo
-                                elif field_id == pesobalanca_id_resp:
-                                    # Campo PESOBALANCA - use o novo valor gerado
-                                    etree.SubElement(field, "Value").text = pesobalanca_novo
-                                else:
-                                    # Para todos os outros campos, mantenha o valor original
-                                    value = field_original.findtext("Value")
-                                    if value is not None:
-                                        etree.SubElement(field, "Value").text = value
-                    
-                    # Adicionar o campo WS se ainda não existir
-                    ws_fields = row_fields.xpath(".//Field[ID='WS' or Id='WS']")
-                    if not ws_fields:
-                        field = etree.SubElement(row_fields, "Field")
-                        etree.SubElement(field, "ID").text = "Consulta realizada com sucesso"
-                        etree.SubElement(field, "Value").text = "Pressione Lixeira para nova consulta"
+                    _escrever_campos_da_linha_atual(construtor, linha_original, novos_valores,
+                                                    evfoto_id_resp, copiar_foto=not so_linha_atual)
                 else:
-                    # Para linhas não-atuais, copiar os campos originais sem OverrideData
-                    for field_original in row_original.xpath(".//Field"):
-                        field = etree.SubElement(row_fields, "Field")
-                        
-                        # Copiar o ID
-                        id_value = field_original.findtext("ID") or field_original.findtext("Id")
+                    # Para linhas não-atuais, copiar os campos originais (ID e Value, se existirem) sem OverrideData
+                    for field_original in _CAMPOS_DA_LINHA(linha_original.elemento):
+                        id_value, value = ler_campo(field_original)
+                        if id_value is not None and value is not None:
+                            construtor.campo(id_value, value)
+                            continue
+                        construtor.abrir("Field")
                         if id_value is not None:
-                            etree.SubElement(field, "ID").text = id_value
-                        
-                        
-                        # Copiar o Value se existir
-                        value = field_original.findtext("Value")
+                            construtor.elemento("ID", id_value)
                         if value is not None:
-                            etree.SubElement(field, "Value").text = value
+                            construtor.elemento("Value", value)
+                        construtor.fechar()
+                
+                construtor.fechar_linha()
+            construtor.fechar_tabela()
         else:
             # Se não encontrou a tabela, criar uma nova com apenas a linha atual
-            tabela = etree.SubElement(fields, "TableField")
-            etree.SubElement(tabela, "ID").text = tabela_id_resp
-            etree.SubElement(tabela, "OverrideData").text = "1"
-            
-            rows = etree.SubElement(tabela, "Rows")
-            row = etree.SubElement(rows, "Row")
-            row.set("IsCurrentRow", "True")
-            
-            row_fields = etree.SubElement(row, "Fields")
+            construtor.abrir_tabela(tabela_id_resp, override=True)
+            construtor.abrir_linha(atual=True)
             
             # Campos básicos para a nova tabela
             # Campo TSTPESO
-            field = etree.SubElement(row_fields, "Field")
-            etree.SubElement(field, "ID").text = tstpeso_id
-            etree.SubElement(field, "OverrideData").text = "1"
-            etree.SubElement(field, "IsVisible").text = "1"
-            etree.SubElement(field, "Value").text = tstpeso_valor_usado
-            
-            # Campo PESO
-            field = etree.SubElement(row_fields, "Field")
-            etree.SubElement(field, "ID").text = peso_id_resp
-            etree.SubElement(field, "OverrideData").text = "1"
-            etree.SubElement(field, "Value").text = peso_novo
+            construtor.abrir("Field")
+            construtor.elemento("ID", tstpeso_id)
+            construtor.elemento("OverrideData", "1")
+            construtor.elemento("IsVisible", "1")
+            construtor.elemento("Value", tstpeso_valor_usado)
+            construtor.fechar()
             
-            # Campo PESOBALANCA
-            field = etree.SubElement(row_fields, "Field")
-            etree.SubElement(field, "ID").text = pesobalanca_id_resp
-            etree.SubElement(field, "OverrideData").text = "1"
-            etree.SubElement(field, "Value").text = pesobalanca_novo
-            
-            # Campo EVFOTO (sem OverrideData)
-            field = etree.SubElement(row_fields, "Field")
-            etree.SubElement(field, "ID").text = evfoto_id_resp
-            etree.SubElement(field, "OverrideData").text = "1"
+            # Campos PESO e PESOBALANCA
+            construtor.campo(peso_id_resp, peso_novo, override=True)
+            construtor.campo(pesobalanca_id_resp, pesobalanca_novo, override=True)
             
+            # Campo EVFOTO (sem Value)
+            construtor.abrir("Field")
+            construtor.elemento("ID", evfoto_id_resp)
+            construtor.elemento("OverrideData", "1")
+            construtor.fechar()
             
             # Campo WS (mensagem)
-            field = etree.SubElement(row_fields, "Field")
-            etree.SubElement(field, "ID").text = "Consulta realizada com sucesso."
-            etree.SubElement(field, "Value").text = "Pressione Lixeira para nova consulta"
-        
-        # Adicionar elementos restantes
-        etree.SubElement(return_value, "ShortText").text = "Pressione Lixeira para nova consulta"
-        etree.SubElement(return_value, "LongText")
-        etree.SubElement(return_value, "Value").text = "17"
-        
-        # Gerar a string XML final
-        xml_declaration = '<?xml version="1.0" encoding="utf-16"?>\n'
-        xml_body = etree.tostring(response, encoding="utf-16", xml_declaration=False).decode("utf-16")
-        xml_str_final = xml_declaration + xml_body
+            construtor.campo("Consulta realizada com sucesso.", "Pressione Lixeira para nova consulta")
+            
+            construtor.fechar_linha()
+            construtor.fechar_tabela()
         
-        logging.debug("XML de Resposta preservando estrutura (UTF-16):\n%s", xml_str_final)
-        return Response(xml_str_final.encode("utf-16"), content_type="application/xml; charset=utf-16")
+        # Fechar a resposta; com fotos guardadas fora da árvore o corpo é um gerador
+        # que as lê do disco direto para a resposta (ver utils/anexos.py)
+        corpo = construtor.finalizar("Pressione Lixeira para nova consulta", value="17")
+        construtor.registrar("XML de Resposta preservando estrutura")
+        return Response(corpo, content_type=content_type_xml(charset))
         
     except Exception as e:
         logging.exception("Erro ao gerar resposta preservando estrutura")
@@ -255,42 +180,15 @@ def gerar_resposta_com_linhas_preservadas(xml_bytes, peso_novo, pesobalanca_novo
 def encaixotar_v2():
     logging.info(f"--- Nova Requisição {request.method} para /teste_caixa ---")
     # 1. Obtenção Robusta do XML
-    content_type = request.headers.get("Content-Type", "").lower()
-    xml_data_str = None
-    xml_data_bytes = None
-    
-    # Tenta obter o XML de várias fontes possíveis
-    if 'form' in content_type.lower() and request.form:
-        for name in ["TextXML", "textxml", "XMLData", "xmldata", "xml"]:
-            if name in request.form:
-                xml_data_str = request.form.get(name)
-                break
-        if not xml_data_str and request.form:
-            first_key = next(iter(request.form))
-            xml_data_str = request.form.get(first_key)
-        if xml_data_str:
-            logging.info("XML obtido de request.form.")
-    
-    if not xml_data_str and request.data:
-        try:
-            xml_data_bytes = request.data
-            xml_data_str = xml_data_bytes.decode('utf-8')
-            logging.info("XML obtido de request.data (UTF-8).")
-        except UnicodeDecodeError:
-            try:
-                xml_data_str = request.data.decode('latin-1')
-                xml_data_bytes = request.data
-                logging.info("XML obtido de request.data (Latin-1).")
-            except UnicodeDecodeError:
-                return gerar_erro_xml_padrao("Encoding inválido.", "Erro Encoding", 400)
-    
-    if not xml_data_bytes and xml_data_str:
-        try:
-            xml_data_bytes = xml_data_str.encode('utf-8')
-        except Exception as e:
-            return gerar_erro_xml_padrao(f"Erro codificando form data: {e}", "Erro Encoding", 500)
-    
-    if not xml_data_bytes:
+    try:
+        # Parse único do XML original (forms são lidos em streaming). Só o modo completo
+        # devolve as fotos: nele, fotos de corpos grandes ficam em disco (utils/anexos.py)
+        modo = request.args.get('modo', MODO_TESTE_CAIXA).lower()
+        anexos = set() if modo == "completo" else None
+        root = obter_root_da_requisicao(recover=True, anexos=anexos)
+    except etree.XMLSyntaxError as e:
+        return gerar_erro_xml_padrao(f"Erro ao processar XML: {e}", "Erro Input", 400)
+    if root is None:
         return gerar_erro_xml_padrao("XML não encontrado.", "Erro Input", 400)
     
     try:
@@ -298,11 +196,19 @@ def encaixotar_v2():
         balanca = request.args.get('balanca', 'balanca1').lower()
         if balanca not in ["balanca1", "balanca2"]:
             return gerar_erro_xml_padrao("Parâmetro 'balanca' inválido.", "Erro Param", 400)
+        if modo not in MODOS_TESTE_CAIXA:
+            return gerar_erro_xml_padrao("Parâmetro 'modo' inválido.", "Erro Param", 400)
+        so_linha_atual = modo == "linha_atual"
         
-        # 3. Extrair TSTPESO (da linha 'atual')
+        # 3. Extrair TSTPESO (da linha 'atual'); tabela e linhas são indexadas uma única vez.
+        # No modo linha_atual só a linha alvo é lida: as outras linhas e fotos nem passam pelo Python
         tstpeso_id_a_usar = "TSTPESO1" if balanca == "balanca1" else "TSTPESO2"
         tabela_id_a_usar = "TABCAIXA1" if balanca == "balanca1" else "TABCAIXA2"
-        tstpeso_valor_extraido = extrair_tstpeso_da_tabela(xml_data_bytes, tabela_id_a_usar, tstpeso_id_a_usar)
+        if so_linha_atual:
+            tabela = tabela_so_linha_alvo(root, tabela_id_a_usar)
+        else:
+            tabela = FormIndex.construir(root).tabela(tabela_id_a_usar)
+        tstpeso_valor_extraido = extrair_tstpeso_da_tabela(tabela, tstpeso_id_a_usar)
         logging.info(f"TSTPESO extraído da linha 'atual': '{tstpeso_valor_extraido}'")
         
         # 4. Gerar Novos Pesos
@@ -310,14 +216,16 @@ def encaixotar_v2():
         
         # 5. Gerar Resposta XML preservando a estrutura original
         return gerar_resposta_com_linhas_preservadas(
-            xml_bytes=xml_data_bytes,
+            tabela_original=tabela,
             peso_novo=peso_novo,
             pesobalanca_novo=pesobalanca_novo,
             balanca_id=balanca,
             tstpeso_id=tstpeso_id_a_usar,
-            tstpeso_valor_usado=tstpeso_valor_extraido
+            tstpeso_valor_usado=tstpeso_valor_extraido,
+            so_linha_atual=so_linha_atual,
+            anexos=anexos or ()
         )
     
     except Exception as e:
         logging.exception("Erro GERAL fatal na rota /teste_caixa")
-        return gerar_erro_xml_padrao(f"Erro interno inesperado: {str(e)}", "Erro Servidor", 500)
\ No newline at end of file
+        return gerar_erro_xml_padrao(f"Erro interno inesperado: {str(e)}", "Erro Servidor", 500)
@@ -4,35 +4,24 @@
  # se TSTWS for 1, entao vai retornar algo do tipo no messagev2 - Itens verificados inconsistente, favor verificar novamente…..e no shorttext, aquele de pressione lixeira para novo processamento…
 
 from flask import request, Response
+from werkzeug.exceptions import HTTPException
 import requests
 from lxml import etree
 import logging
-from io import StringIO
-from utils.xml_da_requisicao import obter_xml_da_requisicao
+from utils.extrator_campos import extrair_campos_da_requisicao
 
 def validar_item():
     try:
-        xml_data = obter_xml_da_requisicao()
-        if not xml_data:
-            return gerar_resposta_xml(mensagem="Não foi possível encontrar dados XML na requisição", value = "Erro", shorttext= "Erro", icon = "Critical")
-
-        logging.debug(f"XML para processar: {xml_data}")
-
         try:
-            # Configurar o parser para recuperar de erros
-            parser = etree.XMLParser(recover=True)
-            
-            # Ler o XML a partir da string
-            tree = etree.parse(StringIO(xml_data), parser)
-
-            # Obter o elemento raiz (o <Form>)
-            root = tree.getroot()
+            # Extrai só o TSTWS, recuperando de erros
+            campos = extrair_campos_da_requisicao({"TSTWS"}, recover=True)
 
         except etree.XMLSyntaxError as e:
             logging.error(f"Erro ao processar o XML: {e}")
             return gerar_resposta_xml(mensagem=f"Erro ao processar o XML recebido: {e}", value = "Erro", shorttext= "Erro", icon = "Critical")
 
-        campos = processar_campos(root)
+        if campos is None:
+            return gerar_resposta_xml(mensagem="Não foi possível encontrar dados XML na requisição", value = "Erro", shorttext= "Erro", icon = "Critical")
 
         tstws = campos.get("TSTWS")
         if not tstws:
@@ -61,20 +50,13 @@ def validar_item():
             action=action
         )
 
+    except HTTPException:
+        # Erros do corpo da requisição (tamanho, compressão) são respondidos pelo middleware
+        raise
     except Exception as e:
         logging.error(f"Erro interno: {str(e)}")
         return gerar_resposta_xml(mensagem=f"Erro interno no servidor: {str(e)}", value = "Erro", shorttext= "Erro", icon = "Critical")
 
-def processar_campos(root):
-    """Processa os campos do XML e retorna um dicionário com os valores."""
-    campos = {}
-    for field in root.findall(".//Field"):
-        id = field.findtext("ID") or field.findtext("Id")  # Tenta ambos os formatos
-        value = field.findtext("Value")
-        if id and value:
-            campos[id] = value
-    return campos
-
 def gerar_resposta_xml(mensagem, value, icon, shorttext="", button_text="OK", action=""):
     # Cria o XML de resposta
     response = etree.Element("Response")
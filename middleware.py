@@ -1,6 +1,10 @@
 from flask import Flask
 from dotenv import load_dotenv
+from werkzeug.exceptions import RequestEntityTooLarge
 import logging
+from utils.corpo_streaming import LIMITE_CORPO_BYTES, LIMITE_XML_BYTES, CodificacaoNaoSuportada, CorpoInvalido, verificar_tamanho_declarado
+from utils.gerar_erro import gerar_erro_xml
+from utils.compressao_resposta import comprimir_resposta
 from apps.consultar_cep import consultar_cep
 from apps.consultar_groq import consultar_groq
 from apps.consultar_peso import consultar_peso
@@ -17,6 +21,7 @@ from apps.cepv2 import consultar_cepv2
 from apps.talk_descript import consultar_groqv2
 from apps.rota import simple_xml
 from apps.cepv3 import consultar_cepv3
+from apps.estatisticas import estatisticas
 
 
 load_dotenv()
@@ -26,6 +31,31 @@ app = Flask(__name__)
 # Configuração do logger
 logging.basicConfig(level=logging.DEBUG)
 
+# Limites de tamanho do corpo (também valem quando o Werkzeug monta request.form)
+app.config["MAX_CONTENT_LENGTH"] = LIMITE_CORPO_BYTES
+app.config["MAX_FORM_MEMORY_SIZE"] = LIMITE_XML_BYTES
+
+# Rejeita corpos grandes demais antes de ler qualquer byte
+@app.before_request
+def limitar_tamanho_corpo():
+    verificar_tamanho_declarado()
+
+# Comprime as respostas (gzip/deflate) para clientes que enviam Accept-Encoding
+@app.after_request
+def comprimir(response):
+    return comprimir_resposta(response)
+
+@app.errorhandler(RequestEntityTooLarge)
+def corpo_muito_grande(e):
+    logging.warning(f"Requisição rejeitada por tamanho: {e.description}")
+    return gerar_erro_xml("Requisição muito grande para ser processada.", "Erro", status_code=413)
+
+@app.errorhandler(CorpoInvalido)
+@app.errorhandler(CodificacaoNaoSuportada)
+def corpo_invalido(e):
+    logging.warning(f"Corpo da requisição rejeitado: {e.description}")
+    return gerar_erro_xml(e.description, "Erro", status_code=e.code)
+
 # Registrar as rotas de cada serviço
 app.add_url_rule("/consultar_cep", methods=["POST"], view_func=consultar_cep)
 app.add_url_rule("/consultar_groq", methods=['POST'], view_func=consultar_groq)
@@ -43,6 +73,7 @@ app.add_url_rule("/consultar_cepv2", methods=['POST'], view_func=consultar_cepv2
 app.add_url_rule("/consultar_groqv2", methods=['POST'], view_func=consultar_groqv2)
 app.add_url_rule("/simple-xml", methods=['GET'], view_func=simple_xml)
 app.add_url_rule("/consultar_cepv3", methods=['POST'], view_func=consultar_cepv3)
+app.add_url_rule("/estatisticas", methods=['GET'], view_func=estatisticas)
 
 if __name__ == '__main__':
     app.run(debug=True, port=5001)
\ No newline at end of file
@@ -0,0 +1,207 @@
+# utils/anexos.py
+from lxml import etree
+from xml.sax.saxutils import escape
+import codecs
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import time
+from utils.form_index import TAGS_VALOR
+
+# Valores de <Value> maiores que o limite (fotos em base64, p.ex. CX1EVFOTO) vão para o disco
+LIMITE_VALOR_INLINE = int(os.getenv("LIMITE_VALOR_INLINE", 64 * 1024))
+DIRETORIO_ANEXOS = os.getenv("DIRETORIO_ANEXOS", os.path.join(tempfile.gettempdir(), "anexos_officetrack"))
+VALIDADE_ANEXOS_SEGUNDOS = int(os.getenv("VALIDADE_ANEXOS_SEGUNDOS", 24 * 60 * 60))
+
+TAMANHO_BLOCO_ANEXO = 64 * 1024
+
+# Texto que fica no lugar do valor. Só vale como referência se estiver no conjunto de
+# referências criadas no parse da própria requisição (ver ConstrutorArvore.referencias):
+# o mesmo texto digitado pelo cliente é só texto
+PREFIXO_REFERENCIA = "anexo:sha256:"
+_RE_REFERENCIA = re.compile(r"anexo:sha256:([0-9a-f]{64})")
+
+# Mesmo escape que o lxml aplica ao texto dos elementos
+_ENTIDADES_TEXTO = {"\r": "&#13;"}
+
+_ultima_limpeza = 0.0
+
+
+def caminho_anexo(digest):
+    return os.path.join(DIRETORIO_ANEXOS, digest)
+
+
+class GravadorAnexo:
+    """Grava um valor no disco à medida que chega. O nome final do arquivo é o SHA-256 do conteúdo."""
+
+    def __init__(self):
+        os.makedirs(DIRETORIO_ANEXOS, exist_ok=True)
+        fd, self.caminho_temp = tempfile.mkstemp(dir=DIRETORIO_ANEXOS, suffix=".tmp")
+        self.arquivo = os.fdopen(fd, "wb")
+        self.hash = hashlib.sha256()
+        self.tamanho = 0
+
+    def escrever(self, texto):
+        dados = texto.encode("utf-8")
+        self.hash.update(dados)
+        self.arquivo.write(dados)
+        self.tamanho += len(dados)
+
+    def concluir(self):
+        """Fecha o arquivo e retorna a referência que fica no lugar do valor."""
+        self.arquivo.close()
+        digest = self.hash.hexdigest()
+        destino = caminho_anexo(digest)
+        if os.path.exists(destino):
+            # Mesmo conteúdo já armazenado: só renova a validade
+            os.remove(self.caminho_temp)
+            os.utime(destino)
+        else:
+            os.replace(self.caminho_temp, destino)
+        logging.debug(f"Valor de {self.tamanho} bytes armazenado fora da árvore: {digest}")
+        limpar_anexos_antigos()
+        return PREFIXO_REFERENCIA + digest
+
+    def descartar(self):
+        self.arquivo.close()
+        try:
+            os.remove(self.caminho_temp)
+        except OSError:
+            pass
+
+
+def limpar_anexos_antigos(intervalo=600):
+    """Remove anexos (e temporários abandonados) mais velhos que a validade; roda no máximo a cada `intervalo` segundos."""
+    global _ultima_limpeza
+    agora = time.time()
+    if agora - _ultima_limpeza < intervalo:
+        return
+    _ultima_limpeza = agora
+    try:
+        entradas = list(os.scandir(DIRETORIO_ANEXOS))
+    except OSError:
+        return
+    for entrada in entradas:
+        try:
+            if agora - entrada.stat().st_mtime > VALIDADE_ANEXOS_SEGUNDOS:
+                os.remove(entrada.path)
+        except OSError:
+            pass
+
+
+class ConstrutorArvore:
+    """
+    Target para o parser do lxml: monta a árvore normalmente, mas o texto de um
+    <Value> que passa de LIMITE_VALOR_INLINE vai direto para o disco, pedaço a pedaço,
+    e na árvore fica só a referência (ver blocos_do_anexo). As referências criadas vão
+    para `referencias`, o conjunto de quem pediu o parse (ver parsers.obter_parser).
+    """
+
+    def __init__(self, limite=LIMITE_VALOR_INLINE):
+        self.limite = limite
+        self.gravador = None
+        self.reiniciar()
+
+    def reiniciar(self):
+        """Prepara para um novo documento (o parser que usa este target é reutilizado)."""
+        if self.gravador is not None:
+            self.gravador.descartar()
+        self.builder = etree.TreeBuilder()
+        self.em_valor = False
+        self.pedacos = []
+        self.tamanho = 0
+        self.gravador = None
+        self.abertos = []
+        # O conjunto do documento anterior fica com quem o pediu; este recebe só o próximo
+        self.referencias = set()
+
+    def start(self, tag, attrib, nsmap=None):
+        if self.em_valor:
+            self._concluir_valor()
+        self.em_valor = tag in TAGS_VALOR
+        self.abertos.append(tag)
+        return self.builder.start(tag, attrib, nsmap)
+
+    def data(self, dados):
+        if not self.em_valor:
+            return self.builder.data(dados)
+        if self.gravador is not None:
+            self.gravador.escrever(dados)
+            return
+        self.pedacos.append(dados)
+        self.tamanho += len(dados)
+        if self.tamanho > self.limite:
+            self.gravador = GravadorAnexo()
+            for pedaco in self.pedacos:
+                self.gravador.escrever(pedaco)
+            self.pedacos = []
+
+    def end(self, tag):
+        if self.em_valor:
+            self._concluir_valor()
+        self.abertos.pop()
+        return self.builder.end(tag)
+
+    def comment(self, texto):
+        if self.em_valor:
+            self._concluir_valor()
+        return self.builder.comment(texto)
+
+    def pi(self, alvo, dados=None):
+        if self.em_valor:
+            self._concluir_valor()
+        return self.builder.pi(alvo, dados)
+
+    def close(self):
+        if self.em_valor:
+            # Documento truncado no meio de um valor (só chega aqui com recover=True)
+            self._concluir_valor()
+        # Com recover=True o lxml não fecha os elementos de um documento truncado
+        while self.abertos:
+            self.builder.end(self.abertos.pop())
+        try:
+            return self.builder.close()
+        except AssertionError:
+            # Nenhum elemento raiz (documento vazio com recover=True)
+            return None
+
+    def _concluir_valor(self):
+        if self.gravador is not None:
+            referencia = self.gravador.concluir()
+            self.referencias.add(referencia)
+            self.builder.data(referencia)
+            self.gravador = None
+        elif self.pedacos:
+            self.builder.data("".join(self.pedacos))
+        self.pedacos = []
+        self.tamanho = 0
+        self.em_valor = False
+
+
+def ler_anexo(referencia):
+    """Conteúdo original de um valor armazenado fora da árvore."""
+    digest = _RE_REFERENCIA.fullmatch(referencia).group(1)
+    with open(caminho_anexo(digest), "rb") as arquivo:
+        return arquivo.read().decode("utf-8")
+
+
+def blocos_do_anexo(referencia, encoding="utf-8"):
+    """
+    Valor armazenado fora da árvore, lido do disco aos poucos e devolvido em blocos
+    já escapados (como texto de elemento) e codificados. Usado por ConstrutorXml
+    (utils/resposta_v2.py) para montar o corpo da resposta sem carregar o valor.
+    """
+    digest = _RE_REFERENCIA.fullmatch(referencia).group(1)
+    encoder = codecs.getincrementalencoder(encoding)()
+    try:
+        arquivo = open(caminho_anexo(digest), "rb")
+    except OSError:
+        logging.error(f"Anexo {digest} não encontrado; valor omitido na resposta")
+        return
+    with arquivo:
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        for bloco in iter(lambda: arquivo.read(TAMANHO_BLOCO_ANEXO), b""):
+            yield encoder.encode(escape(decoder.decode(bloco), _ENTIDADES_TEXTO))
+    yield encoder.encode("", final=True)
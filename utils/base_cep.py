@@ -0,0 +1,220 @@
+# utils/base_cep.py
+import csv
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+# Base local de CEPs (SQLite gerado por este módulo, ver __main__); "" desliga
+BASE_CEP_ARQUIVO = os.getenv("BASE_CEP_ARQUIVO", "")
+# De quantos em quantos segundos o arquivo é conferido (uma importação nova troca o arquivo)
+BASE_CEP_INTERVALO_VERIFICACAO = float(os.getenv("BASE_CEP_INTERVALO_VERIFICACAO", 5))
+# Máximo de endereços numa busca por logradouro (o mesmo limite da busca do ViaCEP)
+BASE_CEP_LIMITE_BUSCA = int(os.getenv("BASE_CEP_LIMITE_BUSCA", 50))
+
+# Campos do ViaCEP guardados de cada CEP; o que vier a mais na importação é ignorado
+CAMPOS_VIACEP = ("cep", "logradouro", "complemento", "unidade", "bairro", "localidade", "uf",
+                 "estado", "regiao", "ibge", "gia", "ddd", "siafi")
+
+_COLUNAS = CAMPOS_VIACEP[1:]
+# Um campo do ViaCEP por coluna (sem repetir os nomes em cada linha); o CEP fica só com os dígitos
+_ESQUEMA = f"""
+CREATE TABLE enderecos (
+    cep TEXT PRIMARY KEY,
+    {", ".join(f"{coluna} TEXT NOT NULL" for coluna in _COLUNAS)},
+    localidade_busca TEXT NOT NULL,
+    logradouro_busca TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE info (chave TEXT PRIMARY KEY, valor TEXT) WITHOUT ROWID;
+"""
+_SELECT = f"SELECT cep, {', '.join(_COLUNAS)} FROM enderecos"
+# Criado depois da carga: bem mais rápido que manter o índice a cada INSERT
+_INDICE_LOGRADOURO = "CREATE INDEX enderecos_logradouro ON enderecos (uf, localidade_busca, logradouro_busca)"
+
+_RE_NAO_DIGITO = re.compile(r"\D")
+_RE_ESPACOS = re.compile(r"\s+")
+
+_local = threading.local()
+_trava = threading.Lock()
+_assinatura = None
+_proxima_verificacao = 0.0
+_ultimo_erro = None
+_contadores = {"consultas": 0, "acertos": 0, "buscas_logradouro": 0, "buscas_com_resultado": 0, "erros": 0}
+
+
+def normalizar_texto(texto):
+    """Texto para comparação: sem acentos, minúsculo, espaços simples ("São  Paulo" -> "sao paulo")."""
+    texto = unicodedata.normalize("NFKD", texto or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return _RE_ESPACOS.sub(" ", texto).strip().lower()
+
+
+def _dados(linha):
+    dados = dict(zip(CAMPOS_VIACEP, linha))
+    dados["cep"] = f"{linha[0][:5]}-{linha[0][5:]}"
+    return dados
+
+
+def _assinatura_atual():
+    """(inode, mtime) do arquivo, conferido no máximo a cada BASE_CEP_INTERVALO_VERIFICACAO s."""
+    global _assinatura, _proxima_verificacao
+    agora = time.monotonic()
+    if agora >= _proxima_verificacao:
+        with _trava:
+            if agora >= _proxima_verificacao:
+                try:
+                    info = os.stat(BASE_CEP_ARQUIVO)
+                    _assinatura = (info.st_ino, info.st_mtime_ns)
+                except OSError:
+                    _assinatura = None
+                _proxima_verificacao = agora + BASE_CEP_INTERVALO_VERIFICACAO
+    return _assinatura
+
+
+def _conexao():
+    """Conexão só de leitura desta thread; reaberta quando uma importação troca o arquivo."""
+    assinatura = _assinatura_atual()
+    if assinatura is None:
+        return None
+    conexao = getattr(_local, "conexao", None)
+    if conexao is not None and _local.assinatura == assinatura and _local.pid == os.getpid():
+        return conexao
+    if conexao is not None:
+        conexao.close()
+    # immutable: o arquivo nunca muda depois de importado, então o SQLite dispensa travas
+    conexao = sqlite3.connect(f"file:{BASE_CEP_ARQUIVO}?mode=ro&immutable=1", uri=True,
+                              check_same_thread=False)
+    _local.conexao = conexao
+    _local.assinatura = assinatura
+    _local.pid = os.getpid()
+    return conexao
+
+
+def _registrar_erro(erro):
+    global _ultimo_erro
+    with _trava:
+        _contadores["erros"] += 1
+        repetido = str(erro) == _ultimo_erro
+        _ultimo_erro = str(erro)
+    if not repetido:
+        logging.error(f"Base local de CEPs ({BASE_CEP_ARQUIVO}): {erro}")
+
+
+def _consultar(sql, parametros):
+    if not BASE_CEP_ARQUIVO:
+        return None
+    try:
+        conexao = _conexao()
+        return conexao.execute(sql, parametros).fetchall() if conexao is not None else None
+    except sqlite3.Error as e:
+        _registrar_erro(e)
+        return None
+
+
+def buscar(cep):
+    """Dados do CEP (8 dígitos, já normalizado) no formato do ViaCEP, ou None se não estiver na base."""
+    linhas = _consultar(f"{_SELECT} WHERE cep = ?", (cep,))
+    if linhas is None:
+        return None
+    with _trava:
+        _contadores["consultas"] += 1
+        _contadores["acertos"] += bool(linhas)
+    return _dados(linhas[0]) if linhas else None
+
+
+def buscar_logradouro(uf, cidade, logradouro):
+    """
+    Endereços (formato do ViaCEP) da cidade cujo logradouro contém todas as palavras de
+    `logradouro`, como a busca /ws/{uf}/{cidade}/{logradouro}/json/ do ViaCEP. None se a
+    base está desligada ou indisponível; lista vazia se nada foi encontrado.
+    """
+    palavras = normalizar_texto(logradouro).split()
+    if not palavras:
+        return None
+    filtro = " AND ".join("instr(logradouro_busca, ?) > 0" for _ in palavras)
+    linhas = _consultar(
+        f"{_SELECT} WHERE uf = ? AND localidade_busca = ? AND {filtro} ORDER BY cep LIMIT ?",
+        (uf.upper(), normalizar_texto(cidade), *palavras, BASE_CEP_LIMITE_BUSCA),
+    )
+    if linhas is None:
+        return None
+    with _trava:
+        _contadores["buscas_logradouro"] += 1
+        _contadores["buscas_com_resultado"] += bool(linhas)
+    return [_dados(linha) for linha in linhas]
+
+
+def estatisticas_base_cep():
+    """Consultas por CEP e por logradouro na base local (e quantas acharam algo)."""
+    with _trava:
+        return {**_contadores, "arquivo": BASE_CEP_ARQUIVO or None}
+
+
+def _ler_registros(caminho):
+    """Registros de um CSV (cabeçalho com os nomes do ViaCEP; ',' ou ';') ou de um JSON (lista ou um objeto por linha)."""
+    with open(caminho, encoding="utf-8-sig", newline="") as arquivo:
+        if caminho.lower().endswith(".csv"):
+            dialeto = csv.Sniffer().sniff(arquivo.read(64 * 1024), delimiters=",;\t")
+            arquivo.seek(0)
+            yield from csv.DictReader(arquivo, dialect=dialeto)
+            return
+        inicio = arquivo.read(1)
+        arquivo.seek(0)
+        if inicio == "[":
+            yield from json.load(arquivo)
+            return
+        for linha in arquivo:
+            if linha.strip():
+                yield json.loads(linha)
+
+
+def importar(origem, destino):
+    """
+    Gera a base em `destino` a partir de um dump de CEPs (DNE convertido ou ViaCEP).
+    A base é montada num arquivo temporário e só então troca o anterior: os processos
+    em execução passam a usá-la na próxima conferência, sem ver uma base pela metade.
+    """
+    temporario = f"{destino}.importando"
+    if os.path.exists(temporario):
+        os.remove(temporario)
+    conexao = sqlite3.connect(temporario)
+    conexao.execute("PRAGMA journal_mode = OFF")
+    conexao.execute("PRAGMA synchronous = OFF")
+    conexao.executescript(_ESQUEMA)
+    total = ignorados = 0
+    with conexao:
+        for registro in _ler_registros(origem):
+            cep = _RE_NAO_DIGITO.sub("", str(registro.get("cep") or ""))
+            if len(cep) != 8 or not registro.get("uf"):
+                ignorados += 1
+                continue
+            dados = {campo: str(registro.get(campo) or "") for campo in _COLUNAS}
+            dados["uf"] = dados["uf"].upper()
+            conexao.execute(
+                f"INSERT OR REPLACE INTO enderecos VALUES ({', '.join('?' * (len(_COLUNAS) + 3))})",
+                (cep, *dados.values(), normalizar_texto(dados["localidade"]), normalizar_texto(dados["logradouro"])),
+            )
+            total += 1
+        conexao.execute(_INDICE_LOGRADOURO)
+        conexao.execute("INSERT INTO info VALUES ('origem', ?), ('importado_em', ?)",
+                        (os.path.basename(origem), time.strftime("%Y-%m-%dT%H:%M:%S")))
+    conexao.execute("VACUUM")
+    conexao.close()
+    os.replace(temporario, destino)
+    return total, ignorados
+
+
+if __name__ == "__main__":
+    # Importação: python -m utils.base_cep dump.csv [base.sqlite3]
+    import sys
+
+    if not 2 <= len(sys.argv) <= 3 or (len(sys.argv) == 2 and not BASE_CEP_ARQUIVO):
+        sys.exit("uso: python -m utils.base_cep <dump .csv/.json> [destino] (ou BASE_CEP_ARQUIVO)")
+    destino = sys.argv[2] if len(sys.argv) == 3 else BASE_CEP_ARQUIVO
+    inicio = time.perf_counter()
+    total, ignorados = importar(sys.argv[1], destino)
+    print(f"{total} CEPs importados em {destino} ({ignorados} ignorados) em {time.perf_counter() - inicio:.1f}s")
@@ -0,0 +1,103 @@
+# utils/cache_cep.py
+import logging
+import os
+import re
+import threading
+import requests
+from utils import base_cep, cache_cep_disco, cliente_http, mapa_ceps
+from utils.cache_ttl import CacheTTL
+
+# Quantos CEPs ficam em memória (os menos consultados saem primeiro)
+CACHE_CEP_LIMITE = int(os.getenv("CACHE_CEP_LIMITE", 10000))
+# Validade (s) de um endereço encontrado e de um CEP inexistente
+CACHE_CEP_VALIDADE = float(os.getenv("CACHE_CEP_VALIDADE", 24 * 3600))
+CACHE_CEP_VALIDADE_NEGATIVA = float(os.getenv("CACHE_CEP_VALIDADE_NEGATIVA", 300))
+
+# Resultado de uma consulta de CEP
+ENCONTRADO = "encontrado"
+NAO_ENCONTRADO = "nao_encontrado"  # ViaCEP respondeu {"erro": true} ou o CEP não tem 8 dígitos
+FALHA = "falha"  # ViaCEP fora do ar / status inesperado: não vai para o cache
+
+_RE_SEPARADORES = re.compile(r"[\s.\-]")
+_RE_CEP = re.compile(r"\d{8}")
+
+_cache = CacheTTL(CACHE_CEP_LIMITE)
+_trava = threading.Lock()
+_acertos_negativos = 0
+
+
+def normalizar_cep(cep):
+    """CEP só com os 8 dígitos ("01310-100" -> "01310100"), ou None se não for um CEP."""
+    cep = _RE_SEPARADORES.sub("", cep or "")
+    return cep if _RE_CEP.fullmatch(cep) else None
+
+
+def buscar_cep(cep):
+    """
+    (situação, dados do ViaCEP) para o CEP. Textos que não são CEP e CEPs fora do mapa
+    de existentes (mapa_ceps) são recusados direto; os demais passam pelo cache
+    compartilhado pelas rotas de CEP:
+    primeiro o da memória, depois a base local (base_cep), o cache em disco
+    (cache_cep_disco, comum a todos os processos), e só então o ViaCEP. Encontrados
+    valem CACHE_CEP_VALIDADE; inexistentes, CACHE_CEP_VALIDADE_NEGATIVA.
+    Os dados devolvidos são compartilhados: só leitura.
+    """
+    global _acertos_negativos
+    chave = normalizar_cep(cep)
+    if chave is None or not mapa_ceps.pode_existir(chave):
+        # Formato inválido (o ViaCEP responderia 400) ou fora do mapa de CEPs existentes:
+        # recusado sem cache, base nem ViaCEP
+        return NAO_ENCONTRADO, None
+    guardado = _cache.obter(chave)
+    if guardado is not None:
+        if guardado[0] != ENCONTRADO:
+            with _trava:
+                _acertos_negativos += 1
+        return guardado
+
+    dados = base_cep.buscar(chave)
+    if dados is not None:
+        resultado = (ENCONTRADO, dados)
+        _cache.guardar(chave, resultado, CACHE_CEP_VALIDADE)
+        return resultado
+
+    do_disco = cache_cep_disco.obter(chave)
+    if do_disco is not None:
+        resultado, validade_restante = do_disco
+        _cache.guardar(chave, resultado, validade_restante)
+        return resultado
+
+    try:
+        response = cliente_http.get("viacep", f"https://viacep.com.br/ws/{chave}/json/")
+    except requests.RequestException:
+        return FALHA, None
+    if response.status_code != 200:
+        logging.error(f"ViaCEP respondeu {response.status_code} para o CEP {chave}")
+        return FALHA, None
+    dados = response.json()
+    resultado = (NAO_ENCONTRADO, None) if "erro" in dados else (ENCONTRADO, dados)
+
+    validade = CACHE_CEP_VALIDADE if resultado[0] == ENCONTRADO else CACHE_CEP_VALIDADE_NEGATIVA
+    _cache.guardar(chave, resultado, validade)
+    cache_cep_disco.guardar(chave, resultado, validade)
+    return resultado
+
+
+def endereco_vencido(cep):
+    """
+    Último endereço conhecido do CEP cuja validade já passou (o cache em disco o mantém
+    por CACHE_CEP_DISCO_RETENCAO), ou None. É só um palpite: a consulta de verdade
+    continua sendo buscar_cep.
+    """
+    chave = normalizar_cep(cep)
+    guardado = cache_cep_disco.obter_vencido(chave) if chave is not None else None
+    if guardado is None or guardado[0] != ENCONTRADO:
+        return None
+    return guardado[1]
+
+
+def estatisticas_cache_cep():
+    """Cache de CEPs em memória (acertos, quantos deles negativos, faltas, taxa de acerto) e em disco."""
+    with _trava:
+        memoria = {**_cache.estatisticas(), "acertos_negativos": _acertos_negativos}
+    return {**memoria, "disco": cache_cep_disco.estatisticas_cache_cep_disco()}
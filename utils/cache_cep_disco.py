@@ -0,0 +1,175 @@
+# utils/cache_cep_disco.py
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+# Arquivo SQLite compartilhado por todos os processos (e que sobrevive a reinícios); "" desliga
+CACHE_CEP_ARQUIVO = os.getenv("CACHE_CEP_ARQUIVO", os.path.join(tempfile.gettempdir(), "cache_cep_officetrack.sqlite3"))
+# Quantos CEPs no máximo no arquivo (na compactação saem os que expiram primeiro)
+CACHE_CEP_DISCO_LIMITE = int(os.getenv("CACHE_CEP_DISCO_LIMITE", 500000))
+# De quantos em quantos segundos (no máximo) roda a compactação
+CACHE_CEP_DISCO_COMPACTACAO = float(os.getenv("CACHE_CEP_DISCO_COMPACTACAO", 600))
+# Por quanto tempo (s) um CEP vencido continua no arquivo: serve de palpite para a busca especulativa do cepv3
+CACHE_CEP_DISCO_RETENCAO = float(os.getenv("CACHE_CEP_DISCO_RETENCAO", 7 * 24 * 3600))
+# Quanto (s) uma leitura/escrita espera se outro processo estiver gravando
+CACHE_CEP_DISCO_ESPERA = float(os.getenv("CACHE_CEP_DISCO_ESPERA", 0.5))
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS ceps (
+    cep TEXT PRIMARY KEY,
+    situacao TEXT NOT NULL,
+    dados TEXT,
+    expira_em REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ceps_expira_em ON ceps (expira_em);
+"""
+
+_local = threading.local()
+_trava = threading.Lock()
+_contadores = {"acertos": 0, "faltas": 0, "gravacoes": 0, "erros": 0, "compactacoes": 0, "removidos": 0}
+_proxima_compactacao = 0.0
+_compactando = False
+_ultimo_erro = None
+
+
+def _conexao():
+    """Conexão desta thread (e deste processo: depois de um fork abre outra)."""
+    conexao = getattr(_local, "conexao", None)
+    if conexao is not None and _local.pid == os.getpid():
+        return conexao
+    diretorio = os.path.dirname(CACHE_CEP_ARQUIVO)
+    if diretorio:
+        os.makedirs(diretorio, exist_ok=True)
+    conexao = sqlite3.connect(CACHE_CEP_ARQUIVO, timeout=CACHE_CEP_DISCO_ESPERA,
+                              isolation_level=None, check_same_thread=False)
+    # WAL: leitores de vários processos não bloqueiam (nem são bloqueados por) quem grava
+    conexao.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conexao.execute("PRAGMA journal_mode = WAL")
+    conexao.execute("PRAGMA synchronous = NORMAL")
+    conexao.executescript(_ESQUEMA)
+    _local.conexao = conexao
+    _local.pid = os.getpid()
+    return conexao
+
+
+def _registrar_erro(erro):
+    # O cache em disco é opcional: erro vira falta, e a mesma mensagem só entra no log uma vez
+    global _ultimo_erro
+    with _trava:
+        _contadores["erros"] += 1
+        repetido = str(erro) == _ultimo_erro
+        _ultimo_erro = str(erro)
+    if not repetido:
+        logging.error(f"Cache de CEPs em disco ({CACHE_CEP_ARQUIVO}): {erro}")
+
+
+def _contar(chave, quantidade=1):
+    with _trava:
+        _contadores[chave] += quantidade
+
+
+def obter(chave):
+    """((situação, dados), validade restante em s) do CEP guardado e ainda válido, ou None."""
+    if not CACHE_CEP_ARQUIVO:
+        return None
+    agora = time.time()
+    try:
+        linha = _conexao().execute(
+            "SELECT situacao, dados, expira_em FROM ceps WHERE cep = ? AND expira_em > ?", (chave, agora)
+        ).fetchone()
+    except sqlite3.Error as e:
+        _registrar_erro(e)
+        return None
+    if linha is None:
+        _contar("faltas")
+        return None
+    _contar("acertos")
+    situacao, dados, expira_em = linha
+    return (situacao, json.loads(dados) if dados is not None else None), expira_em - agora
+
+
+def obter_vencido(chave):
+    """(situação, dados) do CEP já vencido que ainda não saiu na compactação, ou None; não entra nas estatísticas."""
+    if not CACHE_CEP_ARQUIVO:
+        return None
+    try:
+        linha = _conexao().execute(
+            "SELECT situacao, dados FROM ceps WHERE cep = ? AND expira_em <= ?", (chave, time.time())
+        ).fetchone()
+    except sqlite3.Error as e:
+        _registrar_erro(e)
+        return None
+    if linha is None:
+        return None
+    situacao, dados = linha
+    return situacao, json.loads(dados) if dados is not None else None
+
+
+def guardar(chave, resultado, validade):
+    """Grava (situação, dados) do CEP com a validade dada (s), substituindo o que houver."""
+    if not CACHE_CEP_ARQUIVO:
+        return
+    situacao, dados = resultado
+    try:
+        _conexao().execute(
+            "INSERT OR REPLACE INTO ceps (cep, situacao, dados, expira_em) VALUES (?, ?, ?, ?)",
+            (chave, situacao, json.dumps(dados, ensure_ascii=False) if dados is not None else None,
+             time.time() + validade),
+        )
+    except sqlite3.Error as e:
+        _registrar_erro(e)
+        return
+    _contar("gravacoes")
+    _agendar_compactacao()
+
+
+def _agendar_compactacao():
+    """Dispara a compactação numa thread à parte, no máximo a cada CACHE_CEP_DISCO_COMPACTACAO s."""
+    global _proxima_compactacao, _compactando
+    agora = time.monotonic()
+    with _trava:
+        if _compactando or agora < _proxima_compactacao:
+            return
+        _compactando = True
+        _proxima_compactacao = agora + CACHE_CEP_DISCO_COMPACTACAO
+    threading.Thread(target=compactar, name="compactar-cache-cep", daemon=True).start()
+
+
+def compactar():
+    """
+    Remove os CEPs vencidos há mais de CACHE_CEP_DISCO_RETENCAO e, passando de
+    CACHE_CEP_DISCO_LIMITE, os que expiram primeiro; depois devolve ao sistema as
+    páginas livres e encurta o WAL. Pode rodar em vários processos ao mesmo tempo:
+    cada DELETE é uma transação curta.
+    """
+    global _compactando
+    try:
+        conexao = _conexao()
+        removidos = conexao.execute("DELETE FROM ceps WHERE expira_em <= ?",
+                                   (time.time() - CACHE_CEP_DISCO_RETENCAO,)).rowcount
+        excesso = conexao.execute("SELECT COUNT(*) FROM ceps").fetchone()[0] - CACHE_CEP_DISCO_LIMITE
+        if excesso > 0:
+            removidos += conexao.execute(
+                "DELETE FROM ceps WHERE cep IN (SELECT cep FROM ceps ORDER BY expira_em LIMIT ?)", (excesso,)
+            ).rowcount
+        conexao.execute("PRAGMA incremental_vacuum")
+        conexao.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        logging.debug(f"Cache de CEPs em disco compactado: {removidos} removidos")
+        with _trava:
+            _contadores["compactacoes"] += 1
+            _contadores["removidos"] += removidos
+    except sqlite3.Error as e:
+        _registrar_erro(e)
+    finally:
+        with _trava:
+            _compactando = False
+
+
+def estatisticas_cache_cep_disco():
+    """Acertos, faltas, gravações, erros e compactações do cache de CEPs em disco (deste processo)."""
+    with _trava:
+        return {**_contadores, "arquivo": CACHE_CEP_ARQUIVO or None}
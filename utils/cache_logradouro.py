@@ -0,0 +1,53 @@
+# utils/cache_logradouro.py
+import json
+import logging
+import os
+import requests
+from utils import cliente_http
+from utils.base_cep import normalizar_texto
+from utils.cache_ttl import CacheTTL
+
+# Memória (bytes) para as respostas da busca por logradouro do ViaCEP
+CACHE_LOGRADOURO_BYTES = int(os.getenv("CACHE_LOGRADOURO_BYTES", 8 * 1024 * 1024))
+# Validade (s) de uma busca guardada (ruas mudam ainda menos que CEPs)
+CACHE_LOGRADOURO_VALIDADE = float(os.getenv("CACHE_LOGRADOURO_VALIDADE", 24 * 3600))
+
+# Guarda a resposta como JSON compacto em bytes, não a lista decodificada: ocupa bem
+# menos e cada consulta recebe dicionários novos, que pode alterar à vontade
+_cache = CacheTTL(CACHE_LOGRADOURO_BYTES)
+
+
+def chave_busca(uf, cidade, logradouro_busca):
+    """Mesma busca, mesma chave: sem acentos, caixa e espaços extras ("SP", "são paulo", "paulista")."""
+    return uf.upper(), normalizar_texto(cidade), normalizar_texto(logradouro_busca)
+
+
+def buscar_logradouro(uf, cidade, logradouro_busca):
+    """
+    Resultado (JSON decodificado) da busca /ws/{uf}/{cidade}/{logradouro}/json/ do
+    ViaCEP, passando pelo cache; None se o ViaCEP falhou (falhas não são guardadas).
+    """
+    chave = chave_busca(uf, cidade, logradouro_busca)
+    corpo = _cache.obter(chave)
+    if corpo is None:
+        url_busca = f"https://viacep.com.br/ws/{uf}/{cidade}/{logradouro_busca}/json/"
+        logging.debug(f"Buscando múltiplos endereços em: {url_busca}")
+        try:
+            response = cliente_http.get("viacep", url_busca)
+        except requests.RequestException as e:
+            logging.error(f"Erro na requisição para buscar múltiplos endereços: {str(e)}")
+            return None
+        if response.status_code != 200:
+            logging.error(f"Erro na busca de múltiplos endereços: {response.status_code}")
+            return None
+        resultados = response.json()
+        # Reserializado sem a indentação do ViaCEP
+        corpo = json.dumps(resultados, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        _cache.guardar(chave, corpo, CACHE_LOGRADOURO_VALIDADE, peso=len(corpo))
+        return resultados
+    return json.loads(corpo)
+
+
+def estatisticas_cache_logradouro():
+    """Acertos, faltas, buscas guardadas e bytes ocupados do cache de buscas por logradouro."""
+    return _cache.estatisticas()
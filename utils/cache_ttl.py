@@ -0,0 +1,70 @@
+# utils/cache_ttl.py
+from collections import OrderedDict
+import threading
+import time
+
+
+class CacheTTL:
+    """
+    Cache LRU limitado, com validade (s) por entrada, seguro entre threads.
+    Os valores são compartilhados entre as requisições: quem lê não deve alterá-los.
+    O limite vale para a soma dos pesos das entradas (por padrão 1 cada, ou seja,
+    quantidade de entradas; com o tamanho em bytes como peso, vira limite de memória).
+    """
+
+    def __init__(self, limite):
+        self.limite = limite
+        self._itens = OrderedDict()  # chave -> (expira_em, valor, peso)
+        self._ocupado = 0
+        self._trava = threading.Lock()
+        self.contadores = {"acertos": 0, "faltas": 0, "expirados": 0, "descartados": 0}
+
+    def obter(self, chave, padrao=None):
+        """Valor guardado e ainda válido, ou `padrao`."""
+        agora = time.monotonic()
+        with self._trava:
+            item = self._itens.get(chave)
+            if item is not None and item[0] <= agora:
+                del self._itens[chave]
+                self._ocupado -= item[2]
+                self.contadores["expirados"] += 1
+                item = None
+            if item is None:
+                self.contadores["faltas"] += 1
+                return padrao
+            self._itens.move_to_end(chave)
+            self.contadores["acertos"] += 1
+            return item[1]
+
+    def guardar(self, chave, valor, validade, peso=1):
+        if peso > self.limite:
+            # Não cabe nem com o cache vazio: não guarda (e não derruba as outras entradas)
+            return
+        expira_em = time.monotonic() + validade
+        with self._trava:
+            anterior = self._itens.pop(chave, None)
+            if anterior is not None:
+                self._ocupado -= anterior[2]
+            self._itens[chave] = (expira_em, valor, peso)
+            self._ocupado += peso
+            while self._ocupado > self.limite:
+                _, descartado = self._itens.popitem(last=False)
+                self._ocupado -= descartado[2]
+                self.contadores["descartados"] += 1
+
+    def limpar(self):
+        with self._trava:
+            self._itens.clear()
+            self._ocupado = 0
+
+    def estatisticas(self):
+        """Contadores, entradas, peso ocupado e taxa de acerto (acertos / consultas)."""
+        with self._trava:
+            consultas = self.contadores["acertos"] + self.contadores["faltas"]
+            return {
+                **self.contadores,
+                "tamanho": len(self._itens),
+                "ocupado": self._ocupado,
+                "limite": self.limite,
+                "taxa_acerto": round(self.contadores["acertos"] / consultas, 3) if consultas else None,
+            }
@@ -0,0 +1,76 @@
+# utils/charset_resposta.py
+from flask import has_request_context, request
+import codecs
+import logging
+import os
+
+# Codificações em que as respostas podem sair (UTF-8 tem metade do tamanho para texto latino)
+CHARSETS_SUPORTADOS = ("utf-16", "utf-8")
+
+# Padrão global; os formulários do Officetrack que exigem UTF-16 continuam com ele
+CHARSET_RESPOSTA = os.getenv("CHARSET_RESPOSTA", "utf-16").strip().lower()
+# Padrão por rota, ex.: "/dados_sempre=utf-8,/consultar_cepv3=utf-8"
+CHARSET_RESPOSTA_ROTAS = os.getenv("CHARSET_RESPOSTA_ROTAS", "")
+# "1": responde no charset declarado no Content-Type da requisição, se suportado
+CHARSET_SEGUE_REQUISICAO = os.getenv("CHARSET_SEGUE_REQUISICAO", "0") == "1"
+
+
+def normalizar_charset(nome):
+    """Nome canônico ("utf-8"/"utf-16") de um charset suportado, ou None."""
+    if not nome:
+        return None
+    try:
+        nome = codecs.lookup(nome.strip()).name
+    except LookupError:
+        return None
+    nome = {"utf-16-le": "utf-16", "utf-16-be": "utf-16"}.get(nome, nome)
+    return nome if nome in CHARSETS_SUPORTADOS else None
+
+
+def _ler_rotas(texto):
+    rotas = {}
+    for item in texto.split(","):
+        if not item.strip():
+            continue
+        rota, _, charset = item.partition("=")
+        normalizado = normalizar_charset(charset)
+        if normalizado is None:
+            logging.warning(f"CHARSET_RESPOSTA_ROTAS: charset inválido em '{item.strip()}', ignorado")
+            continue
+        rotas[rota.strip()] = normalizado
+    return rotas
+
+
+_PADRAO = normalizar_charset(CHARSET_RESPOSTA) or "utf-16"
+_ROTAS = _ler_rotas(CHARSET_RESPOSTA_ROTAS)
+
+
+def charset_da_resposta():
+    """
+    Charset da resposta da requisição atual. Ordem: Accept-Charset do cliente (entre
+    os suportados, respeitando os pesos q), o Content-Type da requisição (se
+    CHARSET_SEGUE_REQUISICAO), o padrão da rota e o padrão global. Fora de uma
+    requisição, o padrão global.
+    """
+    if not has_request_context():
+        return _PADRAO
+    rota = request.url_rule.rule if request.url_rule is not None else request.path
+    padrao = _ROTAS.get(rota, _PADRAO)
+
+    if request.accept_charsets:
+        # O padrão vem primeiro: em empate (ou "*") ele é mantido
+        opcoes = [padrao] + [charset for charset in CHARSETS_SUPORTADOS if charset != padrao]
+        escolhido = request.accept_charsets.best_match(opcoes)
+        if escolhido is not None:
+            return escolhido
+
+    if CHARSET_SEGUE_REQUISICAO:
+        declarado = normalizar_charset(request.mimetype_params.get("charset"))
+        if declarado is not None:
+            return declarado
+
+    return padrao
+
+
+def content_type_xml(encoding):
+    return f"application/xml; charset={encoding}"
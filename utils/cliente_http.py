@@ -0,0 +1,139 @@
+# utils/cliente_http.py
+import logging
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Conexões mantidas abertas (keep-alive) por host
+HTTP_CONEXOES_POR_HOST = int(os.getenv("HTTP_CONEXOES_POR_HOST", 10))
+# Espera entre tentativas: HTTP_BACKOFF * 2^(tentativa - 1) segundos
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", 0.3))
+# Espera máxima (s) pedida por um Retry-After (429/503) antes de tentar de novo
+HTTP_RETRY_AFTER_MAXIMO = float(os.getenv("HTTP_RETRY_AFTER_MAXIMO", 2))
+# Respostas que valem nova tentativa (só em métodos idempotentes; POST só repete falha de conexão)
+_STATUS_REPETIR = (429, 500, 502, 503, 504)
+
+
+class _RetryLimitado(Retry):
+    """Retry que respeita o Retry-After só até HTTP_RETRY_AFTER_MAXIMO: um valor alto não prende o worker."""
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, HTTP_RETRY_AFTER_MAXIMO)
+
+
+class Upstream:
+    """
+    Serviço externo: host, timeouts de conexão/leitura (s), tentativas extras e
+    intervalo mínimo entre chamadas (s), todos sobrescrevíveis por variável de
+    ambiente HTTP_<NOME>_TIMEOUT_CONEXAO, _TIMEOUT_LEITURA, _TENTATIVAS e _INTERVALO.
+    """
+
+    def __init__(self, nome, host, timeout_conexao, timeout_leitura, tentativas, intervalo=0.0):
+        prefixo = f"HTTP_{nome.upper()}_"
+        self.nome = nome
+        self.host = host
+        self.timeout = (float(os.getenv(prefixo + "TIMEOUT_CONEXAO", timeout_conexao)),
+                        float(os.getenv(prefixo + "TIMEOUT_LEITURA", timeout_leitura)))
+        self.tentativas = int(os.getenv(prefixo + "TENTATIVAS", tentativas))
+        self.intervalo = float(os.getenv(prefixo + "INTERVALO", intervalo))
+        self._trava = threading.Lock()
+        self._proxima_chamada = 0.0
+
+    def aguardar_vez(self):
+        """Respeita o intervalo mínimo entre chamadas (ex.: 1 req/s da política do Nominatim)."""
+        if not self.intervalo:
+            return
+        with self._trava:
+            agora = time.monotonic()
+            espera = self._proxima_chamada - agora
+            self._proxima_chamada = max(agora, self._proxima_chamada) + self.intervalo
+        if espera > 0:
+            time.sleep(espera)
+
+
+UPSTREAMS = {
+    upstream.nome: upstream for upstream in (
+        Upstream("viacep", "viacep.com.br", 3.05, 10, tentativas=2),
+        Upstream("nominatim", "nominatim.openstreetmap.org", 3.05, 10, tentativas=1, intervalo=1.0),
+        Upstream("groq", "api.groq.com", 3.05, 60, tentativas=1),
+    )
+}
+
+_sessao = requests.Session()
+for _upstream in UPSTREAMS.values():
+    # Um pool de conexões por host, com as tentativas daquele serviço
+    _sessao.mount(f"https://{_upstream.host}/", HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=HTTP_CONEXOES_POR_HOST,
+        max_retries=_RetryLimitado(
+            total=_upstream.tentativas,
+            backoff_factor=HTTP_BACKOFF,
+            status_forcelist=_STATUS_REPETIR,
+            raise_on_status=False,
+        ),
+    ))
+
+_trava_estatisticas = threading.Lock()
+_por_host = {}
+
+
+def _registrar(host, duracao, erro, tentativas_extras):
+    with _trava_estatisticas:
+        contadores = _por_host.setdefault(host, {"requisicoes": 0, "erros": 0, "tentativas_extras": 0,
+                                                 "tempo_total_ms": 0.0, "tempo_maximo_ms": 0.0})
+        contadores["requisicoes"] += 1
+        contadores["erros"] += erro
+        contadores["tentativas_extras"] += tentativas_extras
+        contadores["tempo_total_ms"] += duracao * 1000
+        contadores["tempo_maximo_ms"] = max(contadores["tempo_maximo_ms"], duracao * 1000)
+
+
+def requisitar(nome_upstream, metodo, url, **kwargs):
+    """
+    Chamada a um serviço externo pela sessão compartilhada (keep-alive, timeouts e
+    tentativas do upstream). Falhas de rede e timeouts levantam requests.RequestException.
+    """
+    upstream = UPSTREAMS[nome_upstream]
+    kwargs.setdefault("timeout", upstream.timeout)
+    upstream.aguardar_vez()
+    inicio = time.perf_counter()
+    response = None
+    try:
+        response = _sessao.request(metodo, url, **kwargs)
+        return response
+    except requests.RequestException as e:
+        logging.error(f"Falha ao chamar {upstream.host}: {e}")
+        raise
+    finally:
+        retries = getattr(response.raw, "retries", None) if response is not None else None
+        extras = len(retries.history) if retries is not None else 0
+        _registrar(upstream.host, time.perf_counter() - inicio,
+                   response is None or response.status_code >= 500, extras)
+
+
+def get(nome_upstream, url, **kwargs):
+    return requisitar(nome_upstream, "GET", url, **kwargs)
+
+
+def post(nome_upstream, url, **kwargs):
+    return requisitar(nome_upstream, "POST", url, **kwargs)
+
+
+def estatisticas_http():
+    """Por host: requisições, erros (rede/5xx), tentativas extras e latência (média e máxima)."""
+    with _trava_estatisticas:
+        return {
+            host: {
+                **contadores,
+                "tempo_total_ms": round(contadores["tempo_total_ms"], 1),
+                "tempo_maximo_ms": round(contadores["tempo_maximo_ms"], 1),
+                "tempo_medio_ms": round(contadores["tempo_total_ms"] / contadores["requisicoes"], 1),
+            }
+            for host, contadores in _por_host.items()
+        }
@@ -0,0 +1,98 @@
+# utils/compressao_resposta.py
+from flask import request
+import os
+import threading
+import zlib
+
+# Respostas menores que isto vão sem compressão (o ganho não paga o custo)
+COMPRESSAO_MINIMO_BYTES = int(os.getenv("COMPRESSAO_MINIMO_BYTES", 1024))
+COMPRESSAO_NIVEL = int(os.getenv("COMPRESSAO_NIVEL", 6))
+COMPRESSAO_ATIVA = os.getenv("COMPRESSAO_ATIVA", "1") != "0"
+
+# wbits do zlib: gzip (cabeçalho gzip) e deflate (formato zlib, como o HTTP define)
+_WBITS = {"gzip": 31, "deflate": 15}
+
+_trava = threading.Lock()
+_bytes_por_rota = {}
+
+
+def _registrar(rota, originais, enviados):
+    with _trava:
+        contadores = _bytes_por_rota.setdefault(rota, {"respostas": 0, "bytes_originais": 0, "bytes_enviados": 0})
+        contadores["respostas"] += 1
+        contadores["bytes_originais"] += originais
+        contadores["bytes_enviados"] += enviados
+
+
+def estatisticas_compressao():
+    """Bytes por rota antes (corpo gerado) e depois (enviado) da compressão."""
+    with _trava:
+        return {rota: dict(contadores) for rota, contadores in _bytes_por_rota.items()}
+
+
+def _comprimivel(response):
+    tipo = response.mimetype or ""
+    return tipo.endswith("xml") or tipo.startswith("text/") or tipo == "application/json"
+
+
+def _compressor(codificacao):
+    return zlib.compressobj(COMPRESSAO_NIVEL, zlib.DEFLATED, _WBITS[codificacao])
+
+
+def _blocos_comprimidos(original, blocos, codificacao, rota):
+    """Comprime os blocos conforme são gerados; nada é acumulado além do buffer do zlib."""
+    compressor = _compressor(codificacao)
+    originais = enviados = 0
+    try:
+        for bloco in blocos:
+            originais += len(bloco)
+            dados = compressor.compress(bloco)
+            if dados:
+                enviados += len(dados)
+                yield dados
+        dados = compressor.flush()
+        enviados += len(dados)
+        yield dados
+    finally:
+        _registrar(rota, originais, enviados)
+        if hasattr(original, "close"):
+            original.close()
+
+
+def comprimir_resposta(response):
+    """
+    after_request: comprime com gzip/deflate quando o cliente aceita (Accept-Encoding).
+    Respostas em memória abaixo de COMPRESSAO_MINIMO_BYTES vão como estão; respostas
+    em streaming (dados_sempre grande, anexos) são comprimidas bloco a bloco.
+    """
+    rota = request.url_rule.rule if request.url_rule is not None else request.path
+    if (not COMPRESSAO_ATIVA or not _comprimivel(response) or response.direct_passthrough
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    codificacao = request.accept_encodings.best_match(list(_WBITS))
+
+    if response.is_streamed:
+        if codificacao is None:
+            return response
+        original = response.response
+        response.response = _blocos_comprimidos(original, response.iter_encoded(), codificacao, rota)
+        response.headers.pop("Content-Length", None)
+    else:
+        dados = response.get_data()
+        if codificacao is None or len(dados) < COMPRESSAO_MINIMO_BYTES:
+            _registrar(rota, len(dados), len(dados))
+            return response
+        compressor = _compressor(codificacao)
+        comprimido = compressor.compress(dados) + compressor.flush()
+        _registrar(rota, len(dados), len(comprimido))
+        response.set_data(comprimido)
+
+    response.headers["Content-Encoding"] = codificacao
+    # Os bytes enviados mudaram: a ETag forte passa a fraca (If-None-Match compara fraco)
+    etag, fraca = response.get_etag()
+    if etag is not None and not fraca:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,428 @@
+# utils/corpo_streaming.py
+from flask import g, request
+from lxml import etree
+from urllib.parse import unquote_plus, unquote_to_bytes
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge, UnsupportedMediaType
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
+import logging
+import os
+import zlib
+from utils.parsers import escolher_perfil, escolher_tipo_arvore, obter_parser
+
+# Limites configuráveis (em bytes) para o corpo inteiro e para o campo com o XML
+LIMITE_CORPO_BYTES = int(os.getenv("LIMITE_CORPO_BYTES", 32 * 1024 * 1024))
+LIMITE_XML_BYTES = int(os.getenv("LIMITE_XML_BYTES", 16 * 1024 * 1024))
+
+# Corpos com Content-Encoding gzip/deflate: limite do corpo descomprimido e razão máxima
+# descomprimido/comprimido aceita (proteção contra "bombas" de descompressão)
+LIMITE_DESCOMPRIMIDO_BYTES = int(os.getenv("LIMITE_DESCOMPRIMIDO_BYTES", LIMITE_CORPO_BYTES))
+RAZAO_MAXIMA_COMPRESSAO = int(os.getenv("RAZAO_MAXIMA_COMPRESSAO", 100))
+# Abaixo disso a razão não é verificada (XML pequeno e repetitivo comprime muito)
+MINIMO_PARA_VERIFICAR_RAZAO = 1024 * 1024
+
+TAMANHO_BLOCO = 64 * 1024
+
+TIPOS_FORM = ("multipart/form-data", "application/x-www-form-urlencoded")
+
+
+class CorpoMuitoGrande(RequestEntityTooLarge):
+    """Corpo da requisição (ou o campo com o XML) acima do limite configurado."""
+
+
+class CorpoInvalido(BadRequest):
+    """Corpo comprimido corrompido ou truncado."""
+
+
+class CodificacaoNaoSuportada(UnsupportedMediaType):
+    """Content-Encoding diferente de gzip/deflate."""
+
+
+def suporta_streaming():
+    """Indica se o corpo da requisição atual ainda pode ser lido em streaming."""
+    if request.mimetype not in TIPOS_FORM:
+        return False
+    # Se alguém já acessou request.form/request.data, o corpo já foi consumido
+    return "form" not in request.__dict__ and "_cached_data" not in request.__dict__
+
+
+def verificar_tamanho_declarado():
+    """Rejeita logo de início corpos cujo Content-Length já passa do limite."""
+    tamanho = request.content_length
+    if tamanho is not None and tamanho > LIMITE_CORPO_BYTES:
+        raise CorpoMuitoGrande(f"Corpo da requisição com {tamanho} bytes excede o limite de {LIMITE_CORPO_BYTES} bytes")
+
+
+def codificacao_do_corpo():
+    """Retorna "gzip" ou "deflate" se o corpo vier comprimido, None se não."""
+    codificacao = request.headers.get("Content-Encoding", "").strip().lower()
+    if codificacao in ("", "identity"):
+        return None
+    if codificacao in ("gzip", "x-gzip"):
+        return "gzip"
+    if codificacao == "deflate":
+        return "deflate"
+    raise CodificacaoNaoSuportada(f"Content-Encoding não suportado: {codificacao}")
+
+
+def blocos_do_corpo():
+    """
+    Lê o corpo da requisição em blocos, contando os bytes contra o limite.
+    Corpos gzip/deflate são descomprimidos aqui mesmo, bloco a bloco.
+    """
+    verificar_tamanho_declarado()
+    codificacao = codificacao_do_corpo()
+    if codificacao is None:
+        return _blocos_brutos()
+    logging.debug(f"Corpo da requisição comprimido ({codificacao})")
+    return _descomprimir(_blocos_brutos(), codificacao)
+
+
+def ler_corpo_inteiro():
+    """Corpo inteiro (já descomprimido) para quem não lê em streaming."""
+    if codificacao_do_corpo() is None:
+        return request.get_data(cache=True)
+    if "corpo_descomprimido" not in g:
+        g.corpo_descomprimido = b"".join(blocos_do_corpo())
+    return g.corpo_descomprimido
+
+
+def _blocos_brutos():
+    stream = request.stream
+    total = 0
+    while True:
+        bloco = stream.read(TAMANHO_BLOCO)
+        if not bloco:
+            return
+        total += len(bloco)
+        if total > LIMITE_CORPO_BYTES:
+            raise CorpoMuitoGrande(f"Corpo da requisição excede o limite de {LIMITE_CORPO_BYTES} bytes")
+        yield bloco
+
+
+def _wbits_deflate(inicio):
+    # "deflate" no HTTP deveria ser zlib (RFC 1950), mas há clientes que mandam deflate cru
+    if len(inicio) >= 2 and inicio[0] & 0x0F == 8 and ((inicio[0] << 8) | inicio[1]) % 31 == 0:
+        return zlib.MAX_WBITS
+    return -zlib.MAX_WBITS
+
+
+def _descomprimir(blocos, codificacao):
+    descompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if codificacao == "gzip" else None
+    entrada = saida = 0
+    for bloco in blocos:
+        entrada += len(bloco)
+        if descompressor is None:
+            descompressor = zlib.decompressobj(_wbits_deflate(bloco))
+        dados = bloco
+        while dados and not descompressor.eof:
+            try:
+                # max_length limita quanto cada pedaço pode crescer em memória
+                parte = descompressor.decompress(dados, TAMANHO_BLOCO)
+            except zlib.error as e:
+                raise CorpoInvalido(f"Corpo {codificacao} inválido: {e}")
+            dados = descompressor.unconsumed_tail
+            saida += len(parte)
+            _verificar_descompressao(entrada, saida)
+            if parte:
+                yield parte
+        if descompressor.eof:
+            # Ignora o que vier depois do fim do stream comprimido
+            break
+    if descompressor is None:
+        return
+    if not descompressor.eof:
+        raise CorpoInvalido(f"Corpo {codificacao} truncado")
+    resto = descompressor.flush()
+    if resto:
+        _verificar_descompressao(entrada, saida + len(resto))
+        yield resto
+
+
+def _verificar_descompressao(entrada, saida):
+    if saida > LIMITE_DESCOMPRIMIDO_BYTES:
+        raise CorpoMuitoGrande(f"Corpo descomprimido excede o limite de {LIMITE_DESCOMPRIMIDO_BYTES} bytes")
+    if saida > MINIMO_PARA_VERIFICAR_RAZAO and saida > RAZAO_MAXIMA_COMPRESSAO * entrada:
+        raise CorpoMuitoGrande(f"Taxa de compressão suspeita ({saida} bytes a partir de {entrada})")
+
+
+def tamanho_maximo_do_xml():
+    """
+    Limite superior (bytes) do XML que vem no corpo: o Content-Length, ou None se
+    for desconhecido (corpo chunked ou comprimido, cujo Content-Length não diz
+    quanto ele cresce ao descomprimir).
+    """
+    if codificacao_do_corpo() is not None:
+        return None
+    return request.content_length
+
+
+class LeituraConcluida(Exception):
+    """Levantada por um destino quando já tem tudo o que precisa do XML."""
+
+
+class DestinoArvore:
+    """
+    Recebe os bytes do campo com o XML e alimenta o parser incremental do lxml.
+    XML lido como UTF-8 que chega em Latin-1 é convertido no caminho (ver _ajustar_latin1).
+    O resultado de fechar() é o elemento raiz; com um conjunto em `anexos` e um corpo
+    que pode ter valores grandes, eles ficam guardados fora da árvore e as referências
+    vão para o conjunto (ver utils/anexos.py).
+    Subclasses podem trocar o parser e o resultado (ver utils/extrator_campos.py).
+    """
+
+    def __init__(self, recover=False, encoding=None, anexos=None):
+        self.recover = recover
+        self.encoding = encoding
+        self.anexos = anexos
+        self.parser = None
+        self.inicio = b""
+        self.total = 0
+        self.latin1 = None  # None: só passou ASCII pelo parser até agora
+        self.pendente = b""
+
+    def escrever(self, dados):
+        if not dados:
+            return
+        self.total += len(dados)
+        if self.total > LIMITE_XML_BYTES:
+            raise CorpoMuitoGrande(f"XML excede o limite de {LIMITE_XML_BYTES} bytes")
+        if self.parser is None:
+            # Guarda o começo do documento até conseguir detectar o encoding
+            self.inicio += dados
+            if len(self.inicio) < 200:
+                return
+            self._iniciar_parser()
+            dados, self.inicio = self.inicio, b""
+        self._entregar(dados)
+        self.apos_escrever()
+
+    def _iniciar_parser(self):
+        # Import tardio: xml_da_requisicao importa este módulo
+        from utils.xml_da_requisicao import detectar_encoding_xml, le_como_utf8
+        encoding = self.encoding
+        if encoding is None:
+            encoding = detectar_encoding_xml(self.inicio)
+        if not le_como_utf8(self.inicio, encoding):
+            # Encoding declarado (ou forçado) que não é UTF-8: não há o que converter
+            self.latin1 = False
+        self.parser = self.criar_parser(encoding)
+
+    def _entregar(self, dados):
+        dados = self._ajustar_latin1(dados)
+        if dados:
+            self.parser.feed(dados)
+
+    def _entregar_pendente(self):
+        # Sequência cortada que ficou sem continuação no fim do documento: o parser aponta o erro
+        if self.pendente:
+            self.parser.feed(self.pendente)
+            self.pendente = b""
+
+    def _ajustar_latin1(self, dados):
+        """
+        O mesmo fallback de ler_com_fallback_latin1 sem guardar o corpo já lido:
+        enquanto só passou ASCII pelo parser, o primeiro bloco com outros bytes decide.
+        UTF-8 válido segue como está; senão o documento é Latin-1 e, daí em diante,
+        cada bloco é convertido para o UTF-8 que o parser espera (o ASCII já lido é
+        igual nos dois).
+        """
+        if self.latin1 is None:
+            if self.pendente:
+                dados, self.pendente = self.pendente + dados, b""
+            if not dados.isascii():
+                try:
+                    dados.decode("utf-8")
+                    self.latin1 = False
+                except UnicodeDecodeError as e:
+                    if e.reason != "unexpected end of data":
+                        logging.debug("XML inválido como UTF-8, lendo como Latin-1")
+                        self.latin1 = True
+                    elif dados[:e.start].isascii():
+                        # Só o fim do bloco tem outros bytes, talvez cortados: decide com o próximo
+                        dados, self.pendente = dados[:e.start], dados[e.start:]
+                    else:
+                        self.latin1 = False
+        if self.latin1:
+            return dados.decode("latin-1").encode("utf-8")
+        return dados
+
+    def criar_parser(self, encoding):
+        tamanho = tamanho_maximo_do_xml()
+        return obter_parser(escolher_perfil(self.recover, tamanho), encoding,
+                            escolher_tipo_arvore(self.anexos is not None, tamanho), self.anexos)
+
+    def apos_escrever(self):
+        """Chamado depois de cada bloco entregue ao parser."""
+
+    def fechar(self):
+        if self.parser is None:
+            if not self.inicio.strip():
+                return None
+            self._iniciar_parser()
+            self._entregar(self.inicio)
+        self._entregar_pendente()
+        root = self.parser.close()
+        if root is None:
+            raise etree.XMLSyntaxError("Documento XML vazio", None, 0, 0)
+        return root
+
+
+def alimentar_destino(destino, xml_bytes):
+    """Entrega bytes já em memória a um destino, em blocos, parando se ele concluir."""
+    dados = memoryview(xml_bytes)
+    try:
+        for inicio in range(0, len(dados), TAMANHO_BLOCO):
+            destino.escrever(bytes(dados[inicio:inicio + TAMANHO_BLOCO]))
+    except LeituraConcluida:
+        pass
+    return destino.fechar()
+
+
+class _LeitorCampos:
+    """
+    Decide, campo a campo, para onde vão os bytes do form.
+    O campo com nome conhecido vai direto para o parser; o primeiro campo (que não
+    seja arquivo) fica guardado (limitado) só para o caso de nenhum nome conhecido
+    aparecer. Os demais campos e os arquivos (fotos etc.) são descartados sem ficar
+    em memória.
+    """
+
+    def __init__(self, nomes_xml, criar_destino):
+        self.nomes_xml = nomes_xml
+        self.criar_destino = criar_destino
+        self.destino = None
+        self.primeiro_campo = None
+        self.primeiro_bytes = bytearray()
+        self.atual = None
+
+    def iniciar_campo(self, nome):
+        if self.destino is None and nome in self.nomes_xml:
+            logging.debug(f"XML encontrado no campo {nome} do form (streaming)")
+            self.destino = self.criar_destino()
+            self.primeiro_bytes = bytearray()
+            self.atual = "xml"
+        elif self.destino is None and self.primeiro_campo is None:
+            self.primeiro_campo = nome
+            self.atual = "primeiro"
+        else:
+            self.atual = None
+
+    def ignorar_campo(self):
+        self.atual = None
+
+    def dados(self, dados):
+        if self.atual == "xml":
+            self.destino.escrever(dados)
+        elif self.atual == "primeiro" and self.primeiro_bytes is not None:
+            if len(self.primeiro_bytes) + len(dados) > LIMITE_XML_BYTES:
+                # Grande demais para ser o XML: não vale a pena guardar
+                self.primeiro_bytes = None
+            else:
+                self.primeiro_bytes += dados
+
+    def finalizar_campo(self):
+        if self.atual == "xml":
+            self.atual = "concluido"
+
+    def resultado(self):
+        if self.destino is not None:
+            return self.destino.fechar()
+        if self.primeiro_campo is not None and self.primeiro_bytes:
+            logging.debug(f"Usando primeiro campo do form: {self.primeiro_campo} (streaming)")
+            return alimentar_destino(self.criar_destino(), bytes(self.primeiro_bytes))
+        return None
+
+
+def _ler_multipart(leitor, boundary):
+    decoder = MultipartDecoder(boundary.encode("latin-1"))
+    for bloco in blocos_do_corpo():
+        decoder.receive_data(bloco)
+        _consumir_eventos(decoder, leitor)
+    decoder.receive_data(None)
+    _consumir_eventos(decoder, leitor)
+
+
+def _consumir_eventos(decoder, leitor):
+    evento = decoder.next_event()
+    while not isinstance(evento, (NeedData, Epilogue)):
+        if isinstance(evento, Field):
+            leitor.iniciar_campo(evento.name)
+        elif isinstance(evento, File):
+            # Arquivos (fotos etc.) nunca são o XML, como no request.form: descartados
+            leitor.ignorar_campo()
+        elif isinstance(evento, Data):
+            leitor.dados(evento.data)
+            if not evento.more_data:
+                leitor.finalizar_campo()
+        evento = decoder.next_event()
+
+
+def _ler_urlencoded(leitor):
+    """Percorre "nome=valor&nome=valor" sem montar o corpo inteiro em memória."""
+    nome = bytearray()
+    lendo_nome = True
+    pendente = b""  # sobra de um "%XX" cortado entre dois blocos
+
+    for bloco in blocos_do_corpo():
+        bloco = pendente + bloco
+        pendente = b""
+        pos = 0
+        while pos < len(bloco):
+            if lendo_nome:
+                fim = _proximo(bloco, pos, (b"=", b"&"))
+                nome += bloco[pos:fim]
+                if fim == len(bloco):
+                    break
+                if bloco[fim:fim + 1] == b"=":
+                    leitor.iniciar_campo(unquote_plus(nome.decode("latin-1")))
+                    lendo_nome = False
+                nome = bytearray()
+                pos = fim + 1
+            else:
+                fim = bloco.find(b"&", pos)
+                if fim == -1:
+                    trecho = bloco[pos:]
+                    # Não decodifica um "%X" incompleto no fim do bloco
+                    corte = trecho.rfind(b"%", max(0, len(trecho) - 2))
+                    if corte != -1:
+                        trecho, pendente = trecho[:corte], trecho[corte:]
+                    leitor.dados(unquote_to_bytes(trecho.replace(b"+", b" ")))
+                    break
+                leitor.dados(unquote_to_bytes(bloco[pos:fim].replace(b"+", b" ")))
+                leitor.finalizar_campo()
+                lendo_nome = True
+                pos = fim + 1
+
+    if not lendo_nome:
+        if pendente:
+            leitor.dados(unquote_to_bytes(pendente.replace(b"+", b" ")))
+        leitor.finalizar_campo()
+
+
+def _proximo(bloco, pos, separadores):
+    posicoes = [p for p in (bloco.find(s, pos) for s in separadores) if p != -1]
+    return min(posicoes) if posicoes else len(bloco)
+
+
+def parse_xml_do_corpo(nomes_xml, recover=False, criar_destino=None, anexos=None):
+    """
+    Lê o form da requisição em streaming e faz o parse do campo com o XML
+    à medida que os bytes chegam. Retorna o resultado do destino (por padrão o
+    elemento raiz, ver DestinoArvore para `anexos`) ou None se não houver XML.
+    Levanta CorpoMuitoGrande se algum limite for excedido.
+    """
+    if criar_destino is None:
+        criar_destino = lambda: DestinoArvore(recover, anexos=anexos)
+    leitor = _LeitorCampos(nomes_xml, criar_destino)
+    try:
+        if request.mimetype == "multipart/form-data":
+            boundary = request.mimetype_params.get("boundary")
+            if not boundary:
+                return None
+            _ler_multipart(leitor, boundary)
+        else:
+            _ler_urlencoded(leitor)
+    except LeituraConcluida:
+        # O destino já tem o que precisa; o resto do corpo nem é lido
+        logging.debug("Leitura do corpo encerrada antecipadamente")
+    return leitor.resultado()
@@ -0,0 +1,50 @@
+# utils/especulacao.py
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import threading
+
+# Threads para chamadas adiantadas (cada uma é uma chamada externa em andamento)
+ESPECULACAO_THREADS = int(os.getenv("ESPECULACAO_THREADS", 4))
+
+_executor = ThreadPoolExecutor(max_workers=ESPECULACAO_THREADS, thread_name_prefix="especulacao")
+_trava = threading.Lock()
+_contadores = {"iniciadas": 0, "aproveitadas": 0, "descartadas": 0, "canceladas": 0}
+
+
+def _contar(chave):
+    with _trava:
+        _contadores[chave] += 1
+
+
+class Especulacao:
+    """
+    Chamada adiantada numa thread à parte, com base num palpite; `chave` identifica o
+    que foi pedido. Quem a iniciou confere depois se o palpite acertou (aproveitar) ou
+    a descarta: se ainda não tinha começado, nem chega a rodar.
+    """
+
+    def __init__(self, chave, funcao, *args):
+        self.chave = chave
+        self._futuro = _executor.submit(funcao, *args)
+        _contar("iniciadas")
+        logging.debug(f"Chamada especulativa iniciada: {chave}")
+
+    def aproveitar(self, chave):
+        """Resultado da chamada se `chave` é a que foi especulada; senão descarta e retorna None."""
+        if chave != self.chave:
+            self.descartar()
+            return None
+        _contar("aproveitadas")
+        return self._futuro.result()
+
+    def descartar(self):
+        # Uma chamada já em andamento não é interrompida: termina e o resultado é ignorado
+        _contar("canceladas" if self._futuro.cancel() else "descartadas")
+        logging.debug(f"Chamada especulativa descartada: {self.chave}")
+
+
+def estatisticas_especulacao():
+    """Chamadas especulativas iniciadas, aproveitadas, descartadas e canceladas antes de rodar."""
+    with _trava:
+        return dict(_contadores)
@@ -0,0 +1,81 @@
+# utils/extrator_campos.py
+from utils.corpo_streaming import (DestinoArvore, LeituraConcluida, alimentar_destino, parse_xml_do_corpo,
+                                   suporta_streaming, tamanho_maximo_do_xml)
+from utils.form_index import FormIndex, ler_campo
+from utils.parsers import escolher_perfil, obter_parser
+from utils.xml_da_requisicao import CAMPOS_XML_FORM, ler_com_fallback_latin1, obter_xml_bytes_da_requisicao
+
+
+class ExtratorCampos(DestinoArvore):
+    """
+    Lê apenas os <Field> com os IDs pedidos e encerra a leitura assim que todos
+    aparecem. Cada Field já visto é descartado, então nem o tempo nem a memória
+    dependem do resto do formulário (fotos, tabelas grandes etc.).
+    Vale a primeira ocorrência não vazia de cada ID. O resultado é um FormIndex
+    só com os campos pedidos. Corpos em Latin-1 são lidos como no DestinoArvore.
+    """
+
+    def __init__(self, ids, recover=False, encoding=None):
+        super().__init__(recover, encoding)
+        self.faltando = set(ids)
+        self.campos = FormIndex()
+
+    def criar_parser(self, encoding):
+        return obter_parser(escolher_perfil(self.recover, tamanho_maximo_do_xml()), encoding, tipo="campos")
+
+    def apos_escrever(self):
+        self._ler_eventos()
+        if not self.faltando:
+            raise LeituraConcluida()
+
+    def _ler_eventos(self):
+        for _, field in self.parser.read_events():
+            field_id, value = ler_campo(field)
+            if field_id in self.faltando and value:
+                self.campos.adicionar_campo(field_id, value)
+                self.faltando.discard(field_id)
+            descartar_elemento(field)
+
+    def fechar(self):
+        if not self.faltando:
+            if self.parser is not None:
+                # O resto do documento não interessa; o parser volta para o pool
+                self.parser.abandonar()
+            return self.campos
+        if self.parser is None:
+            if not self.inicio.strip():
+                return None
+            self._iniciar_parser()
+            self._entregar(self.inicio)
+        self._entregar_pendente()
+        # Documento lido até o fim sem achar tudo: fecha para validar e pegar o que restou
+        self.parser.close()
+        self._ler_eventos()
+        return self.campos
+
+
+def descartar_elemento(elemento):
+    """Libera um elemento já processado e os irmãos anteriores a ele."""
+    elemento.clear(keep_tail=True)
+    parent = elemento.getparent()
+    if parent is not None:
+        while elemento.getprevious() is not None:
+            del parent[0]
+
+
+def extrair_campos_da_requisicao(ids, recover=False):
+    """
+    Extrai da requisição apenas os campos com os IDs pedidos.
+    Retorna um FormIndex com os que foram encontrados (campos.get(id)), ou None se
+    não houver XML. Levanta etree.XMLSyntaxError se o XML for inválido antes de
+    todos os campos aparecerem.
+    """
+    if suporta_streaming():
+        return parse_xml_do_corpo(CAMPOS_XML_FORM, criar_destino=lambda: ExtratorCampos(ids, recover))
+
+    xml_bytes, encoding = obter_xml_bytes_da_requisicao()
+    if not xml_bytes:
+        return None
+    # Mesmo fallback para Latin-1 do parse da árvore (parse_xml_bytes)
+    return ler_com_fallback_latin1(
+        lambda enc: alimentar_destino(ExtratorCampos(ids, recover, enc), xml_bytes), xml_bytes, encoding)
@@ -0,0 +1,184 @@
+# utils/form_index.py
+import sys
+from lxml import etree
+
+# Variações de nome de tag usadas pelos formulários do Officetrack
+TAGS_CAMPO = frozenset(("Field", "field"))
+TAGS_ID = frozenset(("ID", "Id", "id"))
+TAGS_VALOR = frozenset(("Value", "value"))
+TAGS_TABELA = frozenset(("TableField", "tablefield"))
+TAGS_LINHA = frozenset(("Row", "row"))
+
+
+# Busca de uma tabela pelo ID e da sua linha alvo feita pelo libxml2 (as outras linhas não passam pelo Python)
+_TABELA_POR_ID = etree.XPath(
+    ".//*[self::TableField or self::tablefield][(ID | Id | id)[1] = $table_id]")
+_LINHAS = "*[not(self::ID or self::Id or self::id)]/descendant-or-self::*[self::Row or self::row]"
+_LINHA_ATUAL = etree.XPath(f"({_LINHAS})[@IsCurrentRow = 'True'][1]")
+_PRIMEIRA_LINHA = etree.XPath(f"({_LINHAS})[1]")
+
+
+class Campo:
+    """Um <Field> do formulário: ID, valor e o elemento original."""
+    __slots__ = ("id", "valor", "elemento")
+
+    def __init__(self, field_id, valor, elemento=None):
+        self.id = field_id
+        self.valor = valor
+        self.elemento = elemento
+
+
+class LinhaTabela:
+    """Uma <Row> de TableField, com os campos indexados por ID."""
+    __slots__ = ("elemento", "campos", "atual")
+
+    def __init__(self, elemento):
+        self.elemento = elemento
+        self.campos = {}
+        self.atual = elemento.get("IsCurrentRow") == "True"
+
+    def get(self, field_id, default=None):
+        campo = self.campos.get(field_id)
+        return campo.valor if campo is not None and campo.valor is not None else default
+
+
+class TabelaForm:
+    """Um <TableField>: suas linhas, na ordem do documento, e a linha atual."""
+    __slots__ = ("id", "elemento", "linhas", "linha_atual")
+
+    def __init__(self, table_id, elemento):
+        self.id = table_id
+        self.elemento = elemento
+        self.linhas = []
+        self.linha_atual = None
+
+    def linha_alvo(self):
+        """Linha marcada com IsCurrentRow ou, na falta dela, a primeira."""
+        if self.linha_atual is not None:
+            return self.linha_atual
+        return self.linhas[0] if self.linhas else None
+
+
+class FormIndex:
+    """
+    Índice do formulário montado em uma única passada pela árvore.
+    Campos fora de tabelas ficam em `campos`; as tabelas ficam em `tabelas`,
+    com as linhas e a linha atual já resolvidas. Em IDs repetidos fora de tabelas vale
+    a última ocorrência, como no dicionário que os handlers montavam sobre .//Field.
+    """
+    __slots__ = ("campos", "tabelas")
+
+    def __init__(self):
+        self.campos = {}
+        self.tabelas = {}
+
+    def __repr__(self):
+        return repr({field_id: campo.valor for field_id, campo in self.campos.items()})
+
+    def __len__(self):
+        return len(self.campos)
+
+    def __contains__(self, field_id):
+        return field_id in self.campos
+
+    def get(self, field_id, default=None):
+        """Valor de um campo fora de tabela (mesma interface de dict usada pelos handlers)."""
+        campo = self.campos.get(field_id)
+        return campo.valor if campo is not None and campo.valor is not None else default
+
+    def tabela(self, table_id):
+        return self.tabelas.get(table_id)
+
+    def adicionar_campo(self, field_id, valor, elemento=None):
+        field_id = sys.intern(field_id)
+        self.campos[field_id] = Campo(field_id, valor, elemento)
+
+    @classmethod
+    def construir(cls, root):
+        """Indexa o formulário inteiro a partir do elemento raiz."""
+        index = cls()
+        _indexar(root, index, None)
+        return index
+
+
+def ler_campo(field):
+    """
+    Retorna (id, valor) de um <Field>, aceitando ID/Id/id e Value/value. Como o
+    findtext: um <Value/> vazio vale "" (None só se não houver Value) e um ID vazio
+    dá lugar à próxima variação.
+    """
+    field_id = valor = None
+    for filho in field:
+        tag = filho.tag
+        if tag in TAGS_ID:
+            if not field_id:
+                field_id = filho.text
+        elif tag in TAGS_VALOR:
+            if valor is None:
+                valor = filho.text or ""
+    return field_id, valor
+
+
+def _indexar(elemento, index, linha):
+    for filho in elemento:
+        tag = filho.tag
+        if tag in TAGS_CAMPO:
+            field_id, valor = ler_campo(filho)
+            if not field_id:
+                continue
+            if linha is None:
+                index.adicionar_campo(field_id, valor, filho)
+            else:
+                field_id = sys.intern(field_id)
+                if field_id not in linha.campos:
+                    linha.campos[field_id] = Campo(field_id, valor, filho)
+        elif tag in TAGS_TABELA:
+            _indexar_tabela(filho, index)
+        elif tag in TAGS_LINHA and linha is None:
+            # Row solta fora de TableField: ignora, como antes
+            continue
+        elif isinstance(tag, str):
+            _indexar(filho, index, linha)
+
+
+def _indexar_tabela(elemento, index):
+    table_id = None
+    tabela = None
+    for filho in elemento:
+        tag = filho.tag
+        if tag in TAGS_ID and table_id is None:
+            table_id = sys.intern(filho.text or "")
+        elif isinstance(tag, str):
+            if tabela is None:
+                tabela = TabelaForm(table_id, elemento)
+            for row in filho.iter("Row", "row"):
+                linha = LinhaTabela(row)
+                _indexar(row, index, linha)
+                tabela.linhas.append(linha)
+                if linha.atual and tabela.linha_atual is None:
+                    tabela.linha_atual = linha
+    if tabela is None:
+        tabela = TabelaForm(table_id, elemento)
+    tabela.id = table_id
+    if table_id and table_id not in index.tabelas:
+        index.tabelas[table_id] = tabela
+
+
+def tabela_so_linha_alvo(root, table_id):
+    """
+    TabelaForm só com a linha alvo (IsCurrentRow ou, na falta dela, a primeira),
+    sem indexar o resto do formulário: o custo não cresce com o número de linhas.
+    None se a tabela não existir.
+    """
+    tabelas = _TABELA_POR_ID(root, table_id=table_id)
+    if not tabelas:
+        return None
+    tabela = TabelaForm(table_id, tabelas[0])
+    rows = _LINHA_ATUAL(tabela.elemento) or _PRIMEIRA_LINHA(tabela.elemento)
+    if rows:
+        linha = LinhaTabela(rows[0])
+        _indexar(rows[0], FormIndex(), linha)
+        tabela.linhas.append(linha)
+        if linha.atual:
+            tabela.linha_atual = linha
+    return tabela
@@ -1,23 +1,53 @@
 # utils/gerar_erro.py
-from lxml import etree
 from flask import Response
+from functools import lru_cache
+import os
+from utils.charset_resposta import charset_da_resposta, content_type_xml
+from utils.resposta_v2 import Vaga, compilar_resposta_v2
 
-def gerar_erro_xml(mensagem, short_text, root_element="ResponseV2", namespaces=None):
-    if namespaces is None:
-        namespaces = {
-            'xsi': 'http://www.w3.org/2001/XMLSchema-instance',
-            'xsd': 'http://www.w3.org/2001/XMLSchema'
-        }
-
-    response = etree.Element(root_element, nsmap=namespaces)
-    message = etree.SubElement(response, "MessageV2")
-    etree.SubElement(message, "Text").text = mensagem
-    return_value = etree.SubElement(response, "ReturnValueV2")
-    fields = etree.SubElement(return_value, "Fields")
-    etree.SubElement(return_value, "ShortText").text = short_text
-    etree.SubElement(return_value, "LongText")
-    etree.SubElement(return_value, "Value").text = "0"
-    xml_declaration = '<?xml version="1.0" encoding="utf-16"?>'
-    xml_str = etree.tostring(response, encoding="utf-16", xml_declaration=False).decode("utf-16")
-    xml_str = xml_declaration + "\n" + xml_str
-    return Response(xml_str.encode("utf-16"), content_type="application/xml; charset=utf-16")
\ No newline at end of file
+# Quantos corpos de erro já codificados ficam em memória (os mais recentes)
+LIMITE_CACHE_ERROS = int(os.getenv("LIMITE_CACHE_ERROS", 1024))
+
+# Modelos compilados por (root_element, namespaces); o padrão é compilado na importação
+_modelos_erro = {}
+
+
+def _modelo_erro(root_element, namespaces):
+    chave = (root_element, tuple(namespaces.items()) if namespaces is not None else None)
+    modelo = _modelos_erro.get(chave)
+    if modelo is None:
+        modelo = compilar_resposta_v2(Vaga("mensagem"), Vaga("short_text"), value="0",
+                                      root_element=root_element, namespaces=namespaces)
+        _modelos_erro[chave] = modelo
+    return modelo
+
+
+_modelo_erro("ResponseV2", None)
+
+
+@lru_cache(maxsize=LIMITE_CACHE_ERROS)
+def _corpo_erro(root_element, namespaces, mensagem, short_text, status_code, encoding):
+    """
+    Corpo de erro já codificado. Numa queda da API externa todas as requisições
+    caem no mesmo erro: a partir da segunda, o corpo sai daqui sem montar nada.
+    """
+    namespaces = dict(namespaces) if namespaces is not None else None
+    return _modelo_erro(root_element, namespaces).gerar(encoding, mensagem=mensagem, short_text=short_text)
+
+
+def gerar_erro_xml(mensagem, short_text, root_element="ResponseV2", namespaces=None, status_code=200,
+                   encoding=None, content_type=None):
+    """encoding None: o charset negociado para a requisição atual (utils/charset_resposta.py)."""
+    if encoding is None:
+        encoding = charset_da_resposta()
+    namespaces = tuple(namespaces.items()) if namespaces is not None else None
+    corpo = _corpo_erro(root_element, namespaces, mensagem, short_text, status_code, encoding)
+    if content_type is None:
+        content_type = content_type_xml(encoding)
+    return Response(corpo, status=status_code, content_type=content_type)
+
+
+def estatisticas_erros():
+    """Acertos/faltas do cache de corpos de erro."""
+    info = _corpo_erro.cache_info()
+    return {"acertos": info.hits, "faltas": info.misses, "tamanho": info.currsize, "limite": info.maxsize}
@@ -0,0 +1,132 @@
+# utils/listas_estaticas.py
+from flask import Response, request
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from utils.resposta_v2 import ConstrutorXml
+
+# De quantos em quantos segundos o arquivo de uma lista é conferido (mtime e tamanho)
+LISTAS_INTERVALO_VERIFICACAO = float(os.getenv("LISTAS_INTERVALO_VERIFICACAO", 2))
+
+_listas = {}
+
+
+class _Versao:
+    """Uma versão renderizada da lista; nunca muda depois de criada."""
+    __slots__ = ("assinatura", "itens", "corpo", "etag")
+
+    def __init__(self, assinatura, itens, corpo):
+        self.assinatura = assinatura
+        self.itens = itens
+        self.corpo = corpo
+        self.etag = hashlib.blake2b(corpo, digest_size=16).hexdigest()
+
+
+class ListaEstatica:
+    """
+    Lista de seleção (Items) fixa ou que muda pouco: renderizada uma única vez em
+    bytes, com ETag forte; If-None-Match com a ETag atual é respondido com 304.
+    itens: sequência de (texto, valor). arquivo: JSON com [[texto, valor], ...],
+    relido quando muda (conferido no máximo a cada LISTAS_INTERVALO_VERIFICACAO s);
+    enquanto ele não existir ou estiver inválido, vale a última versão carregada.
+    A versão nova entra numa única atribuição: nenhuma resposta vê uma lista pela metade.
+    """
+
+    def __init__(self, nome, itens=(), arquivo=None, mensagem=None, encoding="utf-8",
+                 content_type=None):
+        self.nome = nome
+        self.arquivo = arquivo
+        self.mensagem = mensagem
+        self.encoding = encoding
+        self.content_type = content_type or f"text/xml; charset={encoding}"
+        self.contadores = {"respostas": 0, "nao_modificadas": 0, "recargas": 0}
+        self._trava = threading.Lock()
+        self._proxima_verificacao = 0.0
+        self._ultimo_erro = None
+        self._versao = self._renderizar(None, tuple(itens))
+        if arquivo is not None:
+            self._recarregar_se_mudou()
+        _listas[nome] = self
+
+    def _renderizar(self, assinatura, itens):
+        construtor = ConstrutorXml(self.encoding)
+        construtor.abrir("Response")
+        if self.mensagem is not None:
+            construtor.abrir("Message")
+            construtor.elemento("Text", self.mensagem)
+            construtor.elemento("Icon", "Info")
+            construtor.fechar()
+        construtor.abrir("ReturnValue")
+        construtor.abrir("Items")
+        for texto, valor in itens:
+            construtor.item(texto, valor)
+        construtor.fechar()
+        construtor.fechar()
+        construtor.fechar()
+        return _Versao(assinatura, itens, construtor.corpo())
+
+    def _recarregar_se_mudou(self):
+        try:
+            info = os.stat(self.arquivo)
+        except OSError as e:
+            self._registrar_erro(f"arquivo {self.arquivo} indisponível ({e})")
+            return
+        assinatura = (info.st_mtime_ns, info.st_size)
+        if assinatura == self._versao.assinatura:
+            return
+        try:
+            with open(self.arquivo, encoding="utf-8") as arquivo:
+                itens = tuple((str(texto), str(valor)) for texto, valor in json.load(arquivo))
+            versao = self._renderizar(assinatura, itens)
+        except (OSError, ValueError, TypeError) as e:
+            self._registrar_erro(f"arquivo {self.arquivo} inválido ({e})")
+            return
+        self._versao = versao
+        self._ultimo_erro = None
+        self.contadores["recargas"] += 1
+        logging.info(f"Lista '{self.nome}' recarregada: {len(itens)} itens, ETag {versao.etag}")
+
+    def _registrar_erro(self, erro):
+        # Conferido a cada intervalo: o mesmo erro só entra no log uma vez
+        if erro != self._ultimo_erro:
+            logging.error(f"Lista '{self.nome}': {erro}; mantendo a versão atual")
+            self._ultimo_erro = erro
+
+    def versao(self):
+        """Versão atual, conferindo antes o arquivo de origem se já passou o intervalo."""
+        if self.arquivo is not None:
+            agora = time.monotonic()
+            if agora >= self._proxima_verificacao:
+                with self._trava:
+                    if agora >= self._proxima_verificacao:
+                        self._recarregar_se_mudou()
+                        self._proxima_verificacao = agora + LISTAS_INTERVALO_VERIFICACAO
+        return self._versao
+
+    def resposta(self):
+        """200 com o corpo pronto, ou 304 se o cliente já tem esta versão (If-None-Match)."""
+        versao = self.versao()
+        # If-None-Match usa comparação fraca: vale também a ETag enfraquecida pela compressão
+        if request.if_none_match.contains_weak(versao.etag):
+            response = Response(status=304)
+            chave = "nao_modificadas"
+        else:
+            response = Response(versao.corpo, content_type=self.content_type)
+            chave = "respostas"
+        with self._trava:
+            self.contadores[chave] += 1
+        response.set_etag(versao.etag)
+        # O cliente sempre revalida: uma lista recarregada é vista na próxima consulta
+        response.cache_control.no_cache = True
+        return response
+
+
+def estatisticas_listas():
+    """Versão atual e respostas 200/304 de cada lista estática."""
+    return {
+        nome: {"etag": lista._versao.etag, "itens": len(lista._versao.itens), **lista.contadores}
+        for nome, lista in _listas.items()
+    }
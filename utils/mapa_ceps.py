@@ -0,0 +1,110 @@
+# utils/mapa_ceps.py
+import logging
+import mmap
+import os
+import sqlite3
+import threading
+import time
+
+# Mapa de bits dos CEPs existentes (gerado por este módulo, ver __main__); "" desliga
+MAPA_CEPS_ARQUIVO = os.getenv("MAPA_CEPS_ARQUIVO", "")
+# De quantos em quantos segundos o arquivo é conferido (um mapa novo troca o arquivo)
+MAPA_CEPS_INTERVALO_VERIFICACAO = float(os.getenv("MAPA_CEPS_INTERVALO_VERIFICACAO", 5))
+
+# Um bit por CEP de 8 dígitos: 10^8 bits = 12,5 MB
+TAMANHO_MAPA = 10 ** 8 // 8
+
+_trava = threading.Lock()
+_mapa = None  # mmap só de leitura: as páginas ficam no cache do sistema, compartilhadas pelos processos
+_assinatura = None
+_proxima_verificacao = 0.0
+_contadores = {"consultas": 0, "rejeitados": 0}
+
+
+def _carregar_se_mudou():
+    # Chamado com a trava
+    global _mapa, _assinatura
+    try:
+        info = os.stat(MAPA_CEPS_ARQUIVO)
+    except OSError as e:
+        if _assinatura is not False:
+            logging.error(f"Mapa de CEPs {MAPA_CEPS_ARQUIVO} indisponível ({e}); CEPs não serão pré-filtrados")
+        _mapa = None
+        _assinatura = False
+        return
+    assinatura = (info.st_ino, info.st_mtime_ns)
+    if assinatura == _assinatura:
+        return
+    _assinatura = assinatura
+    if info.st_size != TAMANHO_MAPA:
+        logging.error(f"Mapa de CEPs {MAPA_CEPS_ARQUIVO} com {info.st_size} bytes (esperado {TAMANHO_MAPA}); ignorado")
+        _mapa = None
+        return
+    with open(MAPA_CEPS_ARQUIVO, "rb") as arquivo:
+        # O mapa antigo não é fechado: alguma thread pode estar lendo dele; sai com o último uso
+        _mapa = mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+    logging.info(f"Mapa de CEPs carregado de {MAPA_CEPS_ARQUIVO}")
+
+
+def _mapa_atual():
+    global _proxima_verificacao
+    agora = time.monotonic()
+    if agora >= _proxima_verificacao:
+        with _trava:
+            if agora >= _proxima_verificacao:
+                _carregar_se_mudou()
+                _proxima_verificacao = agora + MAPA_CEPS_INTERVALO_VERIFICACAO
+    return _mapa
+
+
+def pode_existir(cep):
+    """
+    False só se o mapa está carregado e o CEP (8 dígitos, já normalizado) não consta nele;
+    sem mapa, todo CEP pode existir. Não faz I/O além de ler uma página já mapeada.
+    """
+    if not MAPA_CEPS_ARQUIVO:
+        return True
+    mapa = _mapa_atual()
+    if mapa is None:
+        return True
+    numero = int(cep)
+    existe = mapa[numero >> 3] >> (numero & 7) & 1
+    with _trava:
+        _contadores["consultas"] += 1
+        _contadores["rejeitados"] += not existe
+    return bool(existe)
+
+
+def gerar(ceps, destino):
+    """Grava em `destino` o mapa dos CEPs (strings de 8 dígitos); troca o arquivo anterior de uma vez."""
+    mapa = bytearray(TAMANHO_MAPA)
+    total = 0
+    for cep in ceps:
+        numero = int(cep)
+        mapa[numero >> 3] |= 1 << (numero & 7)
+        total += 1
+    temporario = f"{destino}.gerando"
+    with open(temporario, "wb") as arquivo:
+        arquivo.write(mapa)
+    os.replace(temporario, destino)
+    return total
+
+
+def estatisticas_mapa_ceps():
+    """CEPs conferidos no mapa e quantos deles foram rejeitados sem consulta."""
+    with _trava:
+        return {**_contadores, "carregado": _mapa is not None, "arquivo": MAPA_CEPS_ARQUIVO or None}
+
+
+if __name__ == "__main__":
+    # Geração a partir da base local: python -m utils.mapa_ceps [base.sqlite3] [mapa]
+    import sys
+    from utils.base_cep import BASE_CEP_ARQUIVO
+
+    origem = sys.argv[1] if len(sys.argv) > 1 else BASE_CEP_ARQUIVO
+    destino = sys.argv[2] if len(sys.argv) > 2 else MAPA_CEPS_ARQUIVO
+    if not origem or not destino:
+        sys.exit("uso: python -m utils.mapa_ceps <base .sqlite3> <mapa> (ou BASE_CEP_ARQUIVO e MAPA_CEPS_ARQUIVO)")
+    conexao = sqlite3.connect(f"file:{origem}?mode=ro", uri=True)
+    total = gerar((cep for (cep,) in conexao.execute("SELECT cep FROM enderecos")), destino)
+    print(f"{total} CEPs marcados em {destino}")
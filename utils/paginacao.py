@@ -0,0 +1,85 @@
+# utils/paginacao.py
+import os
+import threading
+
+# Itens por página de uma lista de seleção (Items), fora o item "mais resultados"
+PAGINACAO_ITENS_POR_PAGINA = int(os.getenv("PAGINACAO_ITENS_POR_PAGINA", 10))
+
+# Valor do item "mais resultados": PREFIXO_CURSOR + "<chave da consulta>:<início da próxima página>".
+# Nada fica guardado no servidor: a rota refaz a lista pela chave (dos caches compartilhados),
+# então qualquer processo atende a próxima página
+PREFIXO_CURSOR = "+MAIS:"
+
+_trava = threading.Lock()
+_contadores = {"listas": 0, "paginas": 0, "invalidos": 0}
+
+
+class Pagina:
+    """Um trecho de uma lista de (texto, valor), com o valor para pedir a próxima página."""
+    __slots__ = ("itens", "inicio", "total", "proximo")
+
+    def __init__(self, itens, inicio, total, proximo=None):
+        self.itens = itens
+        self.inicio = inicio
+        self.total = total
+        self.proximo = proximo
+
+    def texto_mais(self):
+        """Texto do item "mais resultados" (a faixa da próxima página)."""
+        fim = self.inicio + len(self.itens)
+        ultimo = min(fim + PAGINACAO_ITENS_POR_PAGINA, self.total)
+        return f"Mais resultados ({fim + 1}-{ultimo} de {self.total})"
+
+
+def _contar(chave):
+    with _trava:
+        _contadores[chave] += 1
+
+
+def eh_cursor(valor):
+    return isinstance(valor, str) and valor.startswith(PREFIXO_CURSOR)
+
+
+def ler_cursor(valor):
+    """(chave, início da página) de um valor de "mais resultados", ou None se ele for inválido."""
+    chave, _, inicio = valor[len(PREFIXO_CURSOR):].rpartition(":")
+    if not chave or not inicio.isdigit():
+        _contar("invalidos")
+        return None
+    return chave, int(inicio)
+
+
+def paginar(itens, chave, inicio=0):
+    """
+    Página de `itens` (sequência de (texto, valor)) a partir de `inicio`, ou None se
+    `inicio` estiver fora da lista (ela mudou desde a página anterior). `chave`
+    identifica a consulta que gerou os itens: volta no cursor da próxima página, e
+    com ela a rota monta a mesma lista de novo.
+    """
+    total = len(itens)
+    if inicio and not 0 < inicio < total:
+        _contar("invalidos")
+        return None
+    fim = inicio + PAGINACAO_ITENS_POR_PAGINA
+    proximo = f"{PREFIXO_CURSOR}{chave}:{fim}" if fim < total else None
+    if inicio:
+        _contar("paginas")
+    elif proximo is not None:
+        _contar("listas")
+    return Pagina(tuple(itens[inicio:fim]), inicio, total, proximo)
+
+
+def escrever_itens(construtor, pagina):
+    """<Items> da página (ConstrutorXml), com o item "mais resultados" no fim se houver próxima."""
+    construtor.abrir("Items")
+    for texto, valor in pagina.itens:
+        construtor.item(texto, valor)
+    if pagina.proximo is not None:
+        construtor.item(pagina.texto_mais(), pagina.proximo)
+    construtor.fechar()
+
+
+def estatisticas_paginacao():
+    """Listas com mais de uma página, páginas seguintes servidas e cursores inválidos ou fora da lista."""
+    with _trava:
+        return dict(_contadores)
@@ -0,0 +1,177 @@
+# utils/parsers.py
+from collections import Counter
+from lxml import etree
+import logging
+import os
+import threading
+from utils.anexos import LIMITE_VALOR_INLINE, ConstrutorArvore
+from utils.form_index import TAGS_CAMPO
+
+# Todos os parsers: sem resolver entidades, sem DTD externo e sem acesso à rede
+OPCOES_SEGURANCA = {"resolve_entities": False, "no_network": True, "load_dtd": False}
+
+PERFIS = {
+    "strict": {"recover": False},
+    "recover": {"recover": True},
+    # Sem huge_tree o libxml2 recusa nós de texto acima de 10 MB (fotos grandes)
+    "huge_tree": {"recover": False, "huge_tree": True},
+}
+
+# Acima deste tamanho o parse estrito usa o perfil huge_tree
+LIMITE_HUGE_TREE_BYTES = int(os.getenv("LIMITE_HUGE_TREE_BYTES", 8 * 1024 * 1024))
+
+# Quantos parsers livres cada thread guarda por combinação de tipo/perfil/encoding
+MAX_LIVRES_POR_CHAVE = 2
+
+_contadores = Counter()
+_trava_contadores = threading.Lock()
+
+
+class _ParsersDaThread(threading.local):
+    def __init__(self):
+        self.livres = {}
+
+
+_pool = _ParsersDaThread()
+
+
+def _contar(perfil, evento):
+    with _trava_contadores:
+        _contadores[(perfil, evento)] += 1
+
+
+def escolher_perfil(recover=False, tamanho=None):
+    """
+    Perfil adequado para um parse: recover se pedido, huge_tree para documentos
+    grandes ou de tamanho desconhecido (tamanho None: corpo comprimido ou chunked).
+    """
+    if recover:
+        return "recover"
+    if tamanho is None or tamanho > LIMITE_HUGE_TREE_BYTES:
+        return "huge_tree"
+    return "strict"
+
+
+def escolher_tipo_arvore(anexos=False, tamanho=None):
+    """
+    "anexos" (valores grandes vão para o disco) só quando a rota pede e o corpo pode
+    ter um valor acima de LIMITE_VALOR_INLINE (tamanho None: desconhecido); senão
+    "arvore", o parser nativo, sem callbacks em Python por nó.
+    """
+    if anexos and (tamanho is None or tamanho > LIMITE_VALOR_INLINE):
+        return "anexos"
+    return "arvore"
+
+
+class ParserReutilizavel:
+    """
+    Parser emprestado do pool da thread. Use feed()/close() como no lxml; depois
+    de um close() bem-sucedido (ou de abandonar()) ele volta para o pool.
+    Parsers com erro de sintaxe são descartados, e a falha é contada no perfil.
+    """
+    __slots__ = ("parser", "alvo", "chave")
+
+    def __init__(self, parser, alvo, chave):
+        self.parser = parser
+        self.alvo = alvo
+        self.chave = chave
+
+    @property
+    def perfil(self):
+        return self.chave[1]
+
+    def feed(self, dados):
+        try:
+            self.parser.feed(dados)
+        except etree.XMLSyntaxError:
+            _contar(self.perfil, "falhas")
+            raise
+
+    def read_events(self):
+        return self.parser.read_events()
+
+    def close(self):
+        try:
+            resultado = self.parser.close()
+        except etree.XMLSyntaxError:
+            _contar(self.perfil, "falhas")
+            raise
+        _contar(self.perfil, "parses")
+        self._devolver()
+        return resultado
+
+    def abandonar(self):
+        """Encerra um parse interrompido de propósito (ex.: campos já encontrados) e devolve o parser."""
+        try:
+            self.parser.close()
+        except etree.XMLSyntaxError:
+            pass
+        _contar(self.perfil, "parses")
+        self._devolver()
+
+    def _devolver(self):
+        if self.alvo is not None:
+            # Solta a árvore já entregue; não fica presa no parser até o próximo uso
+            self.alvo.reiniciar()
+        livres = _pool.livres.setdefault(self.chave, [])
+        if len(livres) < MAX_LIVRES_POR_CHAVE:
+            livres.append(self)
+
+
+def _criar(tipo, perfil, encoding):
+    opcoes = dict(OPCOES_SEGURANCA, **PERFIS[perfil])
+    if tipo == "arvore":
+        return etree.XMLParser(encoding=encoding, **opcoes), None
+    if tipo == "anexos":
+        alvo = ConstrutorArvore()
+        return etree.XMLParser(target=alvo, encoding=encoding, **opcoes), alvo
+    if tipo == "campos":
+        return etree.XMLPullParser(events=("end",), tag=tuple(TAGS_CAMPO), encoding=encoding, **opcoes), None
+    raise ValueError(f"Tipo de parser desconhecido: {tipo}")
+
+
+def obter_parser(perfil="strict", encoding=None, tipo="arvore", anexos=None):
+    """
+    Empresta um parser da thread atual.
+    tipo "arvore": monta a árvore com o parser nativo.
+    tipo "anexos": monta a árvore, mas valores grandes vão para o disco (ver utils/anexos.py);
+    as referências criadas são acrescentadas ao conjunto `anexos`.
+    tipo "campos": XMLPullParser que emite o fim de cada <Field>.
+    """
+    chave = (tipo, perfil, encoding)
+    livres = _pool.livres.get(chave)
+    if livres:
+        parser = livres.pop()
+        if tipo == "campos":
+            # Eventos do documento anterior (lidos ou não depois do close) não podem vazar para este
+            for _ in parser.read_events():
+                pass
+    else:
+        _contar(perfil, "criados")
+        logging.debug(f"Criando parser {tipo}/{perfil} (encoding={encoding})")
+        parser = ParserReutilizavel(*_criar(tipo, perfil, encoding), chave)
+    if parser.alvo is not None and anexos is not None:
+        parser.alvo.referencias = anexos
+    return parser
+
+
+def parse_bytes(dados, perfil="strict", encoding=None, anexos=None):
+    """
+    Parse de um documento inteiro já em memória; retorna o elemento raiz (ou None com
+    recover). anexos: conjunto que recebe as referências dos valores grandes, que vão
+    para o disco se o documento puder tê-los; None deixa tudo na árvore.
+    """
+    tipo = escolher_tipo_arvore(anexos is not None, len(dados))
+    parser = obter_parser(perfil, encoding, tipo, anexos)
+    parser.feed(dados)
+    return parser.close()
+
+
+def estatisticas_parsers():
+    """Contadores por perfil: parsers criados, parses concluídos e falhas de parse."""
+    with _trava_contadores:
+        itens = list(_contadores.items())
+    estatisticas = {perfil: {"criados": 0, "parses": 0, "falhas": 0} for perfil in PERFIS}
+    for (perfil, evento), total in itens:
+        estatisticas[perfil][evento] = total
+    return estatisticas
@@ -0,0 +1,383 @@
+# utils/resposta_v2.py
+from flask import Response
+import codecs
+import logging
+import re
+import sys
+from utils.anexos import blocos_do_anexo
+from utils.charset_resposta import content_type_xml
+
+NSMAP_PADRAO = {
+    'xsi': 'http://www.w3.org/2001/XMLSchema-instance',
+    'xsd': 'http://www.w3.org/2001/XMLSchema'
+}
+
+# Mesmo resultado de str.encode("utf-16"): BOM + bytes na ordem da máquina
+_BOM = "".encode("utf-16")
+_CODEC = "utf-16-le" if sys.byteorder == "little" else "utf-16-be"
+
+# Caracteres que o lxml recusa em texto (ValueError), e os que ele escapa
+_RE_INVALIDOS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]")
+_RE_ESCAPE = re.compile("[&<>\r]")
+_RE_ESPECIAIS = re.compile(_RE_INVALIDOS.pattern[:-1] + "&<>\r]")
+_ENTIDADES = {"&": "&amp;", "<": "&lt;", ">": "&gt;", "\r": "&#13;"}
+_RE_ESCAPE_ATRIBUTO = re.compile('[&<>"\r\n\t]')
+_ENTIDADES_ATRIBUTO = {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;",
+                       "\r": "&#13;", "\n": "&#10;", "\t": "&#9;"}
+
+# Marcadores usados só durante a compilação (área de uso privado do Unicode)
+_RE_MARCADOR = re.compile("<([A-Za-z_][\\w.-]*)>\ue000(\\d+)\ue001</\\1>")
+
+
+class Vaga:
+    """Lugar de um valor preenchido a cada requisição (texto de um elemento)."""
+    __slots__ = ("nome",)
+
+    def __init__(self, nome):
+        self.nome = nome
+
+
+class _VagaCompilada:
+    __slots__ = ("nome", "abre", "fecha", "vazio")
+
+    def __init__(self, nome, tag, codec):
+        self.nome = nome
+        self.abre = f"<{tag}>".encode(codec)
+        self.fecha = f"</{tag}>".encode(codec)
+        self.vazio = f"<{tag}/>".encode(codec)
+
+
+def declaracao_padrao(encoding):
+    return f'<?xml version="1.0" encoding="{encoding}"?>'
+
+
+def _codec_e_bom(encoding):
+    """Codec dos fragmentos e BOM inicial: "utf-16" sai como str.encode("utf-16")."""
+    if encoding == "utf-16":
+        return _CODEC, _BOM
+    return encoding, b""
+
+
+def _validar_texto(valor):
+    if not isinstance(valor, str):
+        raise TypeError(f"Argument must be bytes or unicode, got '{type(valor).__name__}'")
+    if _RE_INVALIDOS.search(valor):
+        raise ValueError("All strings must be XML compatible: Unicode or ASCII, no NULL bytes or control characters")
+
+
+def escapar_texto(valor):
+    """Escapa o texto de um elemento exatamente como o lxml faz na serialização."""
+    if valor.__class__ is str and not _RE_ESPECIAIS.search(valor):
+        return valor
+    _validar_texto(valor)
+    if _RE_ESCAPE.search(valor):
+        return _RE_ESCAPE.sub(lambda m: _ENTIDADES[m.group()], valor)
+    return valor
+
+
+def escapar_atributo(valor):
+    """Escapa o valor de um atributo exatamente como o lxml faz na serialização."""
+    _validar_texto(valor)
+    if _RE_ESCAPE_ATRIBUTO.search(valor):
+        return _RE_ESCAPE_ATRIBUTO.sub(lambda m: _ENTIDADES_ATRIBUTO[m.group()], valor)
+    return valor
+
+
+class _ModeloCodificado:
+    __slots__ = ("literais", "vagas", "codificar")
+
+    def __init__(self, texto, nomes, encoding):
+        codec, bom = _codec_e_bom(encoding)
+        texto = declaracao_padrao(encoding) + "\n" + texto
+        self.literais = []
+        self.vagas = []
+        pos = 0
+        for marcador in _RE_MARCADOR.finditer(texto):
+            self.literais.append(texto[pos:marcador.start()].encode(codec))
+            self.vagas.append(_VagaCompilada(nomes[int(marcador.group(2))], marcador.group(1), codec))
+            pos = marcador.end()
+        self.literais.append(texto[pos:].encode(codec))
+        self.literais[0] = bom + self.literais[0]
+        self.codificar = codecs.lookup(codec).encode
+
+
+class ModeloResposta:
+    """
+    ResponseV2 de forma fixa, compilada em fragmentos de bytes (uma vez por encoding,
+    na primeira vez que ele é pedido). gerar(**valores) devolve os mesmos bytes que a
+    montagem com etree.SubElement + tostring + declaração + encode(encoding);
+    None gera o elemento vazio (<Value/>).
+    """
+    __slots__ = ("texto", "nomes", "codificados")
+
+    def __init__(self, texto, nomes):
+        if "encoding" in nomes:
+            raise ValueError("'encoding' não pode ser nome de Vaga")
+        self.texto = texto
+        self.nomes = nomes
+        self.codificados = {"utf-16": _ModeloCodificado(texto, nomes, "utf-16")}
+
+    def gerar(self, encoding="utf-16", **valores):
+        modelo = self.codificados.get(encoding)
+        if modelo is None:
+            modelo = self.codificados.setdefault(encoding, _ModeloCodificado(self.texto, self.nomes, encoding))
+        codificar = modelo.codificar
+        partes = [modelo.literais[0]]
+        for vaga, literal in zip(modelo.vagas, modelo.literais[1:]):
+            valor = valores[vaga.nome]
+            if valor is None:
+                partes.append(vaga.vazio)
+            else:
+                partes.append(vaga.abre)
+                partes.append(codificar(escapar_texto(valor))[0])
+                partes.append(vaga.fecha)
+            partes.append(literal)
+        return b"".join(partes)
+
+    def resposta(self, status_code=200, encoding="utf-16", **valores):
+        return Response(self.gerar(encoding, **valores), status=status_code,
+                        content_type=content_type_xml(encoding))
+
+
+def registrar_resposta(rotulo, corpo, encoding="utf-16"):
+    """Log de depuração da resposta; só decodifica os bytes se o DEBUG estiver ativo."""
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(f"{rotulo}: {corpo.decode(encoding)}")
+
+
+class _Marcacao(dict):
+    """Marcação fixa (tags) já codificada num codec; codifica na primeira vez que é pedida."""
+
+    def __init__(self, codec):
+        super().__init__()
+        self.codec = codec
+
+    def __missing__(self, texto):
+        dados = self[texto] = texto.encode(self.codec)
+        return dados
+
+
+# Um cache por codec; só recebe nomes de tags escritos no código, nunca texto da requisição
+_MARCACOES = {}
+
+
+class ConstrutorXml:
+    """
+    Escreve XML direto em bytes num único buffer, sem montar árvore: cada texto é
+    escapado e codificado uma vez e anexado ao bytearray. A saída é idêntica à do
+    tostring do lxml, inclusive <Tag/> para elementos sem conteúdo.
+    encoding "utf-16" gera o BOM + bytes na ordem da máquina, como str.encode("utf-16").
+    declaracao: True para a declaração padrão do projeto, ou o texto da declaração.
+    anexos: referências de anexo criadas no parse desta requisição (utils/anexos.py).
+    Só esses valores saem do disco: corpo() passa a devolver um gerador que lê o anexo
+    na hora do envio. Qualquer outro texto é escrito como veio, mesmo que pareça uma referência.
+    Respostas grandes podem ser enviadas aos poucos com descarregar().
+    """
+
+    def __init__(self, encoding="utf-16", declaracao=True, anexos=()):
+        self.encoding = encoding
+        self.referencias_anexos = anexos
+        self.codec, bom = _codec_e_bom(encoding)
+        self.buffer = bytearray(bom)
+        self.marcacao = _MARCACOES.get(self.codec) or _MARCACOES.setdefault(self.codec, _Marcacao(self.codec))
+        # Função do codec guardada: str.encode(nome) procura o codec pelo nome a cada chamada
+        self._codificar = codecs.lookup(self.codec).encode
+        self.abertos = []
+        self.pendente = False  # tag de abertura ainda sem ">" (pode virar "<Tag/>")
+        self.anexos = []  # (posição no buffer, referência)
+        if declaracao:
+            if declaracao is True:
+                declaracao = declaracao_padrao(encoding)
+            self.buffer += (declaracao + "\n").encode(self.codec)
+
+    def _completar_abertura(self):
+        if self.pendente:
+            self.buffer += self.marcacao[">"]
+            self.pendente = False
+
+    def _escrever_texto(self, valor):
+        if valor in self.referencias_anexos:
+            self.anexos.append((len(self.buffer), valor))
+        else:
+            self.buffer += self._codificar(escapar_texto(valor))[0]
+
+    def abrir(self, tag, atributos=None):
+        self._completar_abertura()
+        self.buffer += self.marcacao[f"<{tag}"]
+        if atributos:
+            for nome, valor in atributos.items():
+                self.buffer += f' {nome}="{escapar_atributo(valor)}"'.encode(self.codec)
+        self.abertos.append(tag)
+        self.pendente = True
+
+    def fechar(self):
+        tag = self.abertos.pop()
+        if self.pendente:
+            self.buffer += self.marcacao["/>"]
+            self.pendente = False
+        else:
+            self.buffer += self.marcacao[f"</{tag}>"]
+
+    def elemento(self, tag, valor=None):
+        """Elemento só com texto; None gera o elemento vazio (<Tag/>), "" gera <Tag></Tag>."""
+        self._completar_abertura()
+        if valor is None:
+            self.buffer += self.marcacao[f"<{tag}/>"]
+        else:
+            self.buffer += self.marcacao[f"<{tag}>"]
+            self._escrever_texto(valor)
+            self.buffer += self.marcacao[f"</{tag}>"]
+
+    # Os métodos abaixo escrevem a marcação de uma vez (caminho quente das tabelas grandes)
+
+    def campo(self, field_id, valor, override=False):
+        """<Field> com ID, OverrideData=1 (opcional) e Value."""
+        self._completar_abertura()
+        buffer = self.buffer
+        marcacao = self.marcacao
+        if field_id is None:
+            buffer += marcacao["<Field><ID/>"]
+        else:
+            buffer += marcacao["<Field><ID>"]
+            buffer += self._codificar(escapar_texto(field_id))[0]
+            buffer += marcacao["</ID>"]
+        if override:
+            buffer += marcacao["<OverrideData>1</OverrideData>"]
+        if valor is None:
+            buffer += marcacao["<Value/></Field>"]
+        else:
+            buffer += marcacao["<Value>"]
+            self._escrever_texto(valor)
+            buffer += marcacao["</Value></Field>"]
+
+    def abrir_tabela(self, table_id, override=False):
+        """<TableField> com ID e OverrideData=1 (opcional); as linhas vêm em seguida."""
+        self.abrir("TableField")
+        self.elemento("ID", table_id)
+        if override:
+            self.elemento("OverrideData", "1")
+        self.abrir("Rows")
+
+    def fechar_tabela(self):
+        self.fechar()
+        self.fechar()
+
+    def abrir_linha(self, atual=False):
+        """<Row> (com IsCurrentRow="True" se for a linha atual); os campos vêm em seguida."""
+        self._completar_abertura()
+        self.buffer += self.marcacao['<Row IsCurrentRow="True"><Fields' if atual else "<Row><Fields"]
+        self.abertos += ("Row", "Fields")
+        self.pendente = True
+
+    def fechar_linha(self):
+        del self.abertos[-2:]
+        if self.pendente:
+            self.buffer += self.marcacao["/></Row>"]
+            self.pendente = False
+        else:
+            self.buffer += self.marcacao["</Fields></Row>"]
+
+    def tabela(self, table_id, linhas, override=False):
+        """TableField completo; linhas é uma sequência de dicionários {ID: valor}."""
+        self.abrir_tabela(table_id, override)
+        for linha in linhas:
+            self.abrir_linha()
+            for field_id, valor in linha.items():
+                self.campo(field_id, valor)
+            self.fechar_linha()
+        self.fechar_tabela()
+
+    def item(self, texto, valor):
+        """<Item> de uma lista de seleção (Items)."""
+        self.abrir("Item")
+        self.elemento("Text", texto)
+        self.elemento("Value", valor)
+        self.fechar()
+
+    def corpo(self):
+        """Bytes da resposta, ou um gerador de blocos se houver anexos a ler do disco."""
+        if self.abertos:
+            raise ValueError(f"Elementos não fechados: {self.abertos}")
+        if not self.anexos:
+            return bytes(self.buffer)
+        return self._blocos()
+
+    def descarregar(self):
+        """
+        Gerador com tudo o que já foi escrito, esvaziando o buffer em seguida; para
+        respostas em streaming (os elementos abertos continuam abertos).
+        """
+        yield from self._blocos()
+        self.buffer = bytearray()
+        self.anexos = []
+
+    def _blocos(self):
+        dados = memoryview(self.buffer)
+        pos = 0
+        for posicao, referencia in self.anexos:
+            yield bytes(dados[pos:posicao])
+            yield from blocos_do_anexo(referencia, self.codec)
+            pos = posicao
+        yield bytes(dados[pos:])
+
+    def registrar(self, rotulo):
+        """Log de depuração do XML gerado; só decodifica se o DEBUG estiver ativo."""
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(f"{rotulo}: {self.buffer.decode(self.encoding)}")
+
+
+class ConstrutorRespostaV2(ConstrutorXml):
+    """
+    ResponseV2 montada direto em bytes: o construtor já escreve MessageV2 e abre
+    ReturnValueV2/Fields; campos e tabelas vêm em seguida e finalizar() fecha a resposta.
+    """
+
+    def __init__(self, mensagem, encoding="utf-16", declaracao=True,
+                 root_element="ResponseV2", namespaces=None, anexos=()):
+        super().__init__(encoding, declaracao, anexos)
+        namespaces = NSMAP_PADRAO if namespaces is None else namespaces
+        self.abrir(root_element, {f"xmlns:{prefixo}": uri for prefixo, uri in namespaces.items()})
+        self.abrir("MessageV2")
+        self.elemento("Text", mensagem)
+        self.fechar()
+        self.abrir("ReturnValueV2")
+        self.abrir("Fields")
+
+    def finalizar(self, short_text, value="58", long_text=None):
+        """Fecha Fields, escreve ShortText/LongText/Value e devolve o corpo (ver corpo())."""
+        self.fechar()
+        self.elemento("ShortText", short_text)
+        self.elemento("LongText", long_text)
+        self.elemento("Value", value)
+        self.fechar()
+        self.fechar()
+        return self.corpo()
+
+
+def compilar_resposta_v2(mensagem, short_text, value="58", campos=(), long_text=None,
+                         root_element="ResponseV2", namespaces=None):
+    """
+    Compila um modelo de ResponseV2. Qualquer texto pode ser fixo ou uma Vaga.
+    campos: sequência de (ID, valor) na ordem da resposta; valor que é lista de
+    dicionários vira TableField (ver ConstrutorXml.tabela).
+    O esqueleto é escrito pelo ConstrutorRespostaV2, então as partes fixas saem
+    idênticas às das respostas montadas campo a campo.
+    """
+    nomes = []
+
+    def texto(valor):
+        if isinstance(valor, Vaga):
+            # Marcador com o índice da vaga em `nomes`, trocado por fragmentos em ModeloResposta
+            nomes.append(valor.nome)
+            return f"{len(nomes) - 1}"
+        return valor
+
+    construtor = ConstrutorRespostaV2(texto(mensagem), declaracao=False,
+                                      root_element=root_element, namespaces=namespaces)
+    for field_id, valor in campos:
+        if isinstance(valor, list):
+            construtor.tabela(field_id, valor)
+        else:
+            construtor.campo(field_id, texto(valor))
+    corpo = construtor.finalizar(texto(short_text), texto(value), texto(long_text))
+    return ModeloResposta(corpo.decode("utf-16"), nomes)
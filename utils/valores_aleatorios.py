@@ -0,0 +1,100 @@
+# utils/valores_aleatorios.py
+import os
+import random
+import threading
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy é opcional: sem ele a API é a mesma, implementada com o módulo random
+    np = None
+
+# Faixas dos valores gerados pelas rotas
+FAIXA_PESO = (0.5, 500.0)
+FAIXA_TESTE_ELETRICO = (1.0, 2.1)
+
+# Faixas com menos valores possíveis que isto são sorteadas de uma tabela pré-formatada
+LIMITE_TABELA_VALORES = 4096
+
+# Semente opcional, para respostas reproduzíveis (testes, demonstrações)
+SEMENTE_VALORES = os.getenv("SEMENTE_VALORES")
+
+_locais = threading.local()
+
+
+def formatar_decimais(valores, casas=2, zeros_a_direita=True):
+    """
+    Números como strings pt-BR (vírgula decimal), em lote.
+    zeros_a_direita=False reproduz str(round(x, casas)): "12,5" em vez de "12,50".
+    """
+    if np is not None and zeros_a_direita:
+        # Arredonda tudo de uma vez; em Python fica só a junção de dois inteiros
+        escala = 10 ** casas
+        unidades = np.rint(np.asarray(valores, dtype=float) * escala).astype(np.int64)
+        inteiros, fracoes = np.divmod(np.abs(unidades), escala)
+        sinais = ["-" if negativo else "" for negativo in (unidades < 0).tolist()]
+        if not casas:
+            return [f"{sinal}{inteiro}" for sinal, inteiro in zip(sinais, inteiros.tolist())]
+        return [f"{sinal}{inteiro},{fracao:0{casas}d}"
+                for sinal, inteiro, fracao in zip(sinais, inteiros.tolist(), fracoes.tolist())]
+    textos = []
+    for valor in valores:
+        texto = f"{valor:.{casas}f}"
+        if not zeros_a_direita and casas:
+            texto = texto.rstrip("0")
+            if texto.endswith("."):
+                texto += "0"
+        textos.append(texto.replace(".", ","))
+    return textos
+
+
+@lru_cache(maxsize=32)
+def _tabela_de_valores(primeiro, ultimo, casas, zeros_a_direita):
+    """Todos os valores possíveis da faixa (em unidades de 10^-casas), já formatados."""
+    escala = 10 ** casas
+    textos = formatar_decimais([unidade / escala for unidade in range(primeiro, ultimo + 1)], casas, zeros_a_direita)
+    return np.array(textos, dtype=object) if np is not None else textos
+
+
+class GeradorValores:
+    """Valores aleatórios gerados em lote (colunas inteiras) e já formatados em pt-BR."""
+
+    def __init__(self, semente=None):
+        self.rng = np.random.default_rng(semente) if np is not None else random.Random(semente)
+
+    def uniformes(self, minimo, maximo, quantidade):
+        if np is not None:
+            return self.rng.uniform(minimo, maximo, quantidade)
+        return [self.rng.uniform(minimo, maximo) for _ in range(quantidade)]
+
+    def coluna(self, minimo, maximo, quantidade, casas=2, zeros_a_direita=True):
+        """`quantidade` valores entre minimo e maximo, com `casas` decimais, como strings pt-BR."""
+        escala = 10 ** casas
+        primeiro, ultimo = round(minimo * escala), round(maximo * escala)
+        if ultimo - primeiro < LIMITE_TABELA_VALORES:
+            # Faixa com poucos valores possíveis (ex.: 1,0 a 2,1): sorteia direto na tabela formatada
+            tabela = _tabela_de_valores(primeiro, ultimo, casas, zeros_a_direita)
+            if np is not None:
+                return tabela[self.rng.integers(0, len(tabela), quantidade)].tolist()
+            return self.rng.choices(tabela, k=quantidade)
+        return formatar_decimais(self.uniformes(minimo, maximo, quantidade), casas, zeros_a_direita)
+
+    def pesos(self, tstpeso, casas=2, zeros_a_direita=True):
+        """(peso, pesobalanca) entre 0,5 e 500: iguais, ou diferentes se TSTPESO for "1"."""
+        if tstpeso != "1":
+            valor = self.coluna(*FAIXA_PESO, 1, casas, zeros_a_direita)[0]
+            return valor, valor
+        while True:
+            peso, pesobalanca = self.coluna(*FAIXA_PESO, 2, casas, zeros_a_direita)
+            if peso != pesobalanca:
+                return peso, pesobalanca
+
+
+def gerador_valores():
+    """Gerador da thread atual (o gerador do numpy não pode ser usado por várias threads)."""
+    gerador = getattr(_locais, "gerador", None)
+    if gerador is None:
+        semente = int(SEMENTE_VALORES) if SEMENTE_VALORES is not None else None
+        gerador = _locais.gerador = GeradorValores(semente)
+    return gerador
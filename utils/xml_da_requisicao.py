@@ -1,36 +1,142 @@
 from flask import request
 from lxml import etree
 import logging
+import re
+from utils.corpo_streaming import codificacao_do_corpo, ler_corpo_inteiro, parse_xml_do_corpo, suporta_streaming
+from utils.parsers import escolher_perfil, parse_bytes
 
-def obter_xml_da_requisicao():
-    """Tenta obter o XML da requisição a partir de diferentes fontes."""
+# Nomes de campo do form onde o Officetrack costuma enviar o XML, em ordem de prioridade
+CAMPOS_XML_FORM = ["TextXML", "textxml", "XMLData", "xmldata", "xml", "application/x-www-form-urlencoded"]
+
+# Declaração XML no início do documento (só olhamos os primeiros bytes)
+_RE_DECLARACAO = re.compile(rb'^\s*<\?xml[^>]*?encoding\s*=\s*["\']([A-Za-z0-9._-]+)["\']')
+
+_BOMS = (b"\xef\xbb\xbf", b"\xff\xfe", b"\xfe\xff")
+
+
+def detectar_encoding_xml(dados):
+    """
+    Descobre como o lxml deve ler os bytes recebidos, sem decodificar o corpo.
+    Retorna None quando o próprio lxml consegue detectar (BOM ou declaração coerente),
+    ou o nome do encoding a forçar no parser.
+    """
+    if dados.startswith(_BOMS):
+        return None
+
+    # UTF-16 sem BOM: o primeiro "<" vem acompanhado de um byte nulo
+    if dados[:2] == b"<\x00":
+        return "utf-16le"
+    if dados[:2] == b"\x00<":
+        return "utf-16be"
+
+    declaracao = _RE_DECLARACAO.match(dados[:200])
+    if declaracao:
+        declarado = declaracao.group(1).decode("ascii").lower()
+        # O Officetrack declara utf-16 mesmo quando o conteúdo chega em 8 bits
+        if declarado.startswith(("utf-16", "utf16", "ucs-2", "ucs2")):
+            return "utf-8"
+
+    return None
+
+
+def le_como_utf8(dados, encoding):
+    """Indica se o lxml vai ler estes bytes como UTF-8 (encoding forçado ou, sem ele, o declarado)."""
+    if encoding is not None:
+        return encoding == "utf-8"
+    if dados.startswith(_BOMS):
+        return dados.startswith(b"\xef\xbb\xbf")
+    declaracao = _RE_DECLARACAO.match(dados[:200])
+    return declaracao is None or declaracao.group(1).lower() in (b"utf-8", b"utf8")
+
+
+def obter_xml_bytes_da_requisicao():
+    """
+    Obtém o XML da requisição como bytes, prontos para o lxml.
+    Retorna (xml_bytes, encoding); encoding é None quando o lxml deve detectá-lo sozinho.
+    Retorna (None, None) se não houver XML na requisição.
+    """
     logging.debug("Obtendo XML da requisição...")
-    
-    # 1. Tenta obter do form (vários nomes possíveis)
-    if request.form:
-        for possible_name in ["TextXML", "textxml", "xmldata", "xml"]:
+
+    # 1. Tenta obter do form (vários nomes possíveis); o Werkzeug não descomprime o corpo
+    if codificacao_do_corpo() is None and request.form:
+        xml_data = None
+        for possible_name in CAMPOS_XML_FORM:
             if possible_name in request.form:
                 xml_data = request.form.get(possible_name)
                 logging.debug(f"XML encontrado no campo {possible_name} do form")
-                return xml_data
+                break
         # Se não encontrou por nome específico, tenta o primeiro campo do form
-        if len(request.form) > 0:
+        if not xml_data:
             first_key = next(iter(request.form))
             xml_data = request.form.get(first_key)
             logging.debug(f"Usando primeiro campo do form: {first_key}")
-            return xml_data
-    
-    # 2. Tenta obter do corpo da requisição
-    if request.data:
-        try:
-            xml_data = request.data.decode('utf-8')
-            logging.debug("Usando dados brutos do corpo da requisição")
-            return xml_data
-        except Exception as e:
-            logging.error(f"Erro ao decodificar dados do corpo: {e}")
-            return None  # Indica que não foi possível obter o XML
-        
-    
+        if xml_data:
+            # O form já foi decodificado pelo Werkzeug; a declaração interna pode mentir
+            return xml_data.encode("utf-8"), "utf-8"
+
+    # 2. Usa o corpo bruto da requisição (descomprimido, se for o caso), sem decodificar
+    xml_bytes = ler_corpo_inteiro()
+    if xml_bytes:
+        logging.debug(f"Usando dados brutos do corpo da requisição ({len(xml_bytes)} bytes)")
+        return xml_bytes, detectar_encoding_xml(xml_bytes)
 
     logging.warning("Nenhum dado XML encontrado na requisição")
-    return None  # Indica que não foi possível obter o XML
\ No newline at end of file
+    return None, None
+
+
+def ler_com_fallback_latin1(ler, xml_bytes, encoding):
+    """
+    Retorna ler(encoding); se o XML for inválido como UTF-8 (ou sem encoding
+    conhecido) e tiver bytes fora do ASCII, repete com ler("iso-8859-1").
+    Para o corpo lido em streaming, ver DestinoArvore._ajustar_latin1.
+    """
+    try:
+        return ler(encoding)
+    except etree.XMLSyntaxError:
+        if encoding not in (None, "utf-8") or xml_bytes.isascii():
+            raise
+        # Corpo fora de UTF-8 sem declaração correta: tenta como Latin-1
+        logging.debug("Falha ao ler o XML como UTF-8, tentando Latin-1")
+        return ler("iso-8859-1")
+
+
+def parse_xml_bytes(xml_bytes, encoding=None, recover=False, anexos=None):
+    """Faz o parse dos bytes recebidos e retorna o elemento raiz (anexos: ver obter_root_da_requisicao)."""
+    perfil = escolher_perfil(recover, len(xml_bytes))
+    root = ler_com_fallback_latin1(lambda enc: parse_bytes(xml_bytes, perfil, enc, anexos), xml_bytes, encoding)
+    if root is None:
+        # Com recover=True o lxml pode devolver None em vez de levantar erro
+        raise etree.XMLSyntaxError("Documento XML vazio", None, 0, 0)
+    return root
+
+
+def obter_root_da_requisicao(recover=False, anexos=None):
+    """
+    Obtém o XML da requisição e retorna o elemento raiz.
+    Forms (multipart/urlencoded) são lidos em streaming, sem passar por request.form.
+    anexos: conjunto (vazio) para rotas que sabem lidar com referências de anexo (ver
+    utils/anexos.py): valores grandes de corpos grandes ficam em disco e as referências
+    criadas entram no conjunto, que a rota repassa ao ConstrutorXml.
+    Retorna None se não houver XML; levanta etree.XMLSyntaxError se o XML for inválido.
+    """
+    if suporta_streaming():
+        return parse_xml_do_corpo(CAMPOS_XML_FORM, recover=recover, anexos=anexos)
+
+    xml_bytes, encoding = obter_xml_bytes_da_requisicao()
+    if not xml_bytes:
+        return None
+    return parse_xml_bytes(xml_bytes, encoding, recover=recover, anexos=anexos)
+
+
+def obter_xml_da_requisicao():
+    """Tenta obter o XML da requisição a partir de diferentes fontes (como texto)."""
+    xml_bytes, encoding = obter_xml_bytes_da_requisicao()
+    if not xml_bytes:
+        return None
+    if encoding is None:
+        encoding = "utf-16" if xml_bytes.startswith((b"\xff\xfe", b"\xfe\xff")) else "utf-8-sig"
+    try:
+        return xml_bytes.decode(encoding)
+    except UnicodeDecodeError as e:
+        logging.error(f"Erro ao decodificar dados do corpo: {e}")
+        return None  # Indica que não foi possível obter o XML